@@ -0,0 +1,4 @@
+# KYUGen metadata engine.
+#
+# Kept free of heavy imports on purpose: Qt, cv2 and google.generativeai are
+# only imported by the modules (and code paths) that actually need them.
@@ -0,0 +1,227 @@
+import os
+import sys
+import time
+import signal
+import argparse
+from datetime import datetime
+
+from kyugen.client import ApiConnectionError
+from kyugen.cluster import merge_shards
+from kyugen.engine import MetadataEngine, load_config
+from kyugen.exporters import EXPORTERS, get_exporters
+from kyugen.preprocess import UPLOAD_FORMATS
+from kyugen.tagger import LocalModelError
+from kyugen.video import VIDEO_MODES
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m kyugen",
+        description="Generate stock metadata for a folder of media files without the GUI.")
+    parser.add_argument("--config", default="config.json",
+                        help="config.json to read defaults from (default: %(default)s)")
+    parser.add_argument("-i", "--input", dest="input_path", help="input folder")
+    parser.add_argument("-o", "--output", dest="output_path", help="output folder")
+    parser.add_argument("--api-key", dest="api_key",
+                        help="Gemini API key (default: $GEMINI_API_KEY or config)")
+    parser.add_argument("--api-keys", dest="api_keys", metavar="KEYS",
+                        help="more keys to spread requests over, comma-separated, each optionally KEY@model "
+                             "(default: $GEMINI_API_KEYS or config)")
+    parser.add_argument("--model")
+    parser.add_argument("--max-title-length", dest="max_title_length", type=int)
+    parser.add_argument("--max-keywords", dest="max_keywords", type=int)
+    parser.add_argument("--custom-keywords", dest="custom_keywords")
+    parser.add_argument("--workers", type=int, help="maximum concurrent API calls")
+    parser.add_argument("--dispatch", choices=["thread", "async"],
+                        help="one thread per API call, or all calls on one asyncio event loop for "
+                             "hundreds of concurrent requests (default: thread)")
+    parser.add_argument("--preprocess-workers", dest="preprocess_workers", type=int,
+                        help="threads decoding and resizing files (default: one per CPU)")
+    parser.add_argument("--preprocess-backend", dest="preprocess_backend", choices=["thread", "process"],
+                        help="run decoding in threads or in a process pool (default: thread)")
+    parser.add_argument("--finalize-workers", dest="finalize_workers", type=int,
+                        help="threads moving files and writing the CSV (default: 1)")
+    parser.add_argument("--rpm", type=int, help="requests per minute across all workers")
+    parser.add_argument("--tpm", type=int, help="tokens per minute across all workers (0 = unlimited)")
+    parser.add_argument("--upload-size", dest="upload_size", type=int,
+                        help="longest side of the image sent to the API, in pixels")
+    parser.add_argument("--upload-format", dest="upload_format", choices=sorted(UPLOAD_FORMATS))
+    parser.add_argument("--upload-quality", dest="upload_quality", type=int)
+    parser.add_argument("--video-mode", dest="video_mode", choices=VIDEO_MODES,
+                        help="describe a clip by its sharpest keyframe or a contact sheet (default: sharpest)")
+    parser.add_argument("--video-samples", dest="video_samples", type=int,
+                        help="keyframes sampled per clip (default: 5)")
+    parser.add_argument("--max-retries", dest="max_retries", type=int,
+                        help="retries per request for transient API errors (default: 5)")
+    parser.add_argument("--retry-budget", dest="retry_budget", type=int,
+                        help="total transient-error retries allowed per run, 0 for no limit (default: 200)")
+    parser.add_argument("--batch-size", dest="batch_size", type=int,
+                        help="images described per API request (default: 1)")
+    parser.add_argument("--text-output", dest="structured_output", action="store_false", default=None,
+                        help="ask for the labelled text format instead of schema-constrained JSON")
+    parser.add_argument("--export", dest="exporters", metavar="NAMES",
+                        help=f"comma-separated marketplace CSVs to write ({', '.join(EXPORTERS)}; default: adobe)")
+    parser.add_argument("--embed", dest="embed_metadata", action="store_true", default=None,
+                        help="write title and keywords into JPEG/PNG/MP4/MOV files as XMP/IPTC")
+    parser.add_argument("--quality-filter", dest="quality_filter", action="store_true", default=None,
+                        help="move blurred, black/white, low-resolution and extreme-aspect images to Rejected/ "
+                             "without calling the API")
+    parser.add_argument("--min-megapixels", dest="reject_min_megapixels", type=float,
+                        help="quality filter: smallest accepted image size (default: 4, 0 = any)")
+    parser.add_argument("--min-sharpness", dest="reject_min_sharpness", type=float,
+                        help="quality filter: lowest accepted Laplacian sharpness (default: 30, 0 = off)")
+    parser.add_argument("--local-model", dest="local_model_dir", metavar="DIR",
+                        help="folder with an ONNX CLIP image encoder that picks categories and extra keywords "
+                             "on the CPU")
+    parser.add_argument("--local-mode", dest="local_model_mode", choices=["assist", "title"],
+                        help="assist: the local model adds keywords and picks the category when confident; "
+                             "title: the API only writes titles (default: assist)")
+    parser.add_argument("--watch", action="store_true", default=None,
+                        help="keep running and process files as they arrive in the input folder; "
+                             "Ctrl+C stops taking new files and finishes the rest")
+    parser.add_argument("--settle", dest="watch_settle", type=float,
+                        help="seconds a new file's size and mtime must stay unchanged before it is "
+                             "processed (default: 2)")
+    parser.add_argument("--cluster", action="store_true", default=None,
+                        help="share the input and output folders with other machines running --cluster: "
+                             "each file is claimed by one node, and the CSV shards are merged at the end")
+    parser.add_argument("--node-id", dest="node_id",
+                        help="this machine's name in cluster mode; keep it the same across restarts "
+                             "(default: the hostname)")
+    parser.add_argument("--lease-seconds", dest="lease_seconds", type=int,
+                        help="seconds after which a crashed node's files are taken over (default: 120)")
+    parser.add_argument("--merge", action="store_true",
+                        help="only merge the cluster nodes' CSV shards in the output folder, then exit")
+    parser.add_argument("--incremental", action="store_true", default=None,
+                        help="skip files already completed in an earlier run unless they changed")
+    parser.add_argument("--no-cache", dest="cache_enabled", action="store_false", default=None,
+                        help="always call the API, even for files seen before")
+    parser.add_argument("--dedupe", dest="dedupe_enabled", action="store_true", default=None,
+                        help="describe one image per near-duplicate group and reuse its metadata")
+    parser.add_argument("--dedupe-distance", dest="dedupe_distance", type=int,
+                        help="max dHash bit difference for near-duplicates (default: 6)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print errors and the summary")
+    return parser
+
+
+def build_config(args):
+    config = load_config(args.config)
+    if os.environ.get("GEMINI_API_KEY"):
+        config["api_key"] = os.environ["GEMINI_API_KEY"]
+    if os.environ.get("GEMINI_API_KEYS"):
+        config["api_keys"] = os.environ["GEMINI_API_KEYS"]
+    for key, value in vars(args).items():
+        if key in config and value is not None:
+            config[key] = value
+    if isinstance(config["api_keys"], str):
+        config["api_keys"] = [k.strip() for k in config["api_keys"].split(",") if k.strip()]
+    return config
+
+
+def print_metrics(snap):
+    print(f"Throughput {snap['files_per_min']:.1f} files/min, latency p50 {snap['p50']:.2f}s "
+          f"p95 {snap['p95']:.2f}s, error rate {snap['error_rate']:.1%}")
+    tokens = snap["tokens"]
+    print(f"API calls {snap['api_calls']}, tokens {tokens['total']} "
+          f"({tokens['prompt']} prompt, {tokens['output']} output)")
+    for name, stage in snap["stages"].items():
+        if stage["count"]:
+            print(f"  {name:<10} {stage['count']:>7}x  total {stage['seconds']:8.1f}s  cpu {stage['cpu']:8.1f}s  "
+                  f"p50 {stage['p50']:.3f}s  p95 {stage['p95']:.3f}s")
+    if len(snap["keys"]) > 1:
+        for label, key in snap["keys"].items():
+            state = "" if key["available"] else "  (resting)"
+            print(f"  {label} {key['model']:<24} {key['requests']:>7} requests  {key['errors']:>5} errors  "
+                  f"{key['tokens']:>9} tokens  latency {key['latency']:.2f}s{state}")
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = build_config(args)
+
+    if args.merge:
+        if not config["output_path"] or not os.path.isdir(config["output_path"]):
+            print("[ERROR] --merge needs an existing output folder (--output or config).", file=sys.stderr)
+            return 2
+        merged = merge_shards(config["output_path"])
+        if not merged:
+            print("No cluster shards found in the output folder.")
+        for path, rows in merged.items():
+            print(f"Merged {rows} rows into {path}")
+        return 0
+    if not config["input_path"] or not config["output_path"]:
+        print("[ERROR] Both input and output folders are required (--input/--output or config).", file=sys.stderr)
+        return 2
+    if not config["api_key"] and not config["api_keys"]:
+        print("[ERROR] No Gemini API key (--api-key, $GEMINI_API_KEY or config).", file=sys.stderr)
+        return 2
+    if not os.path.isdir(config["input_path"]):
+        print(f"[ERROR] Input folder does not exist: {config['input_path']}", file=sys.stderr)
+        return 2
+    try:
+        get_exporters(config["exporters"])
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 2
+    os.makedirs(config["output_path"], exist_ok=True)
+
+    def on_file_done(result):
+        if result.status == "ok" and not args.quiet:
+            print(f"[{result.index}] {os.path.basename(result.source)} -> {result.filename}")
+        elif result.status == "error":
+            print(f"[{result.index}] {os.path.basename(result.source)} -> Error ({result.error})")
+        elif result.status == "rejected" and not args.quiet:
+            print(f"[{result.index}] {os.path.basename(result.source)} -> Rejected ({result.error})")
+
+    engine = MetadataEngine(config, on_file_done=on_file_done)
+    if config["watch"]:
+        def stop_watching(signum, frame):
+            # First signal: stop taking files and drain; a second one
+            # interrupts as usual
+            print("[WATCH] Stopping; finishing files in progress (Ctrl+C again to abort)", file=sys.stderr)
+            engine.stop_watching()
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+
+        signal.signal(signal.SIGINT, stop_watching)
+        if hasattr(signal, "SIGTERM"):
+            signal.signal(signal.SIGTERM, stop_watching)
+    started = time.time()
+    try:
+        counts = engine.run()
+    except (ApiConnectionError, LocalModelError) as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        print("Interrupted.", file=sys.stderr)
+        return 130
+    finally:
+        engine.close()
+
+    total = sum(counts.values())
+    if not total:
+        if config["watch"]:
+            print("No files arrived while watching.")
+        elif config["cluster"]:
+            print("No unclaimed media files left in the input folder.")
+        else:
+            print("No supported media files found in the input folder.")
+        return 0
+    failed = counts["error"]
+    elapsed = time.time() - started
+    rejected = f", {counts['rejected']} rejected" if counts["rejected"] else ""
+    unchanged = (f", {counts['unchanged']} left in the input folder as unchanged since an earlier run"
+                 if counts["unchanged"] else "")
+    print(f"Processed {counts['ok']}/{total} files in {elapsed:.1f}s, {failed} moved to Error{rejected}{unchanged}.")
+    if not args.quiet:
+        print_metrics(engine.metrics.snapshot())
+    if engine.quota_reset:
+        print(f"Stopped: every API key is out of daily quota until "
+              f"{datetime.fromtimestamp(engine.quota_reset):%Y-%m-%d %H:%M}. The remaining files are still in the "
+              f"input folder; run again after the reset.")
+        # EX_TEMPFAIL: try again later
+        return 75
+    if engine.csv_failures:
+        print(f"{engine.csv_failures} CSV rows could not be written"
+              + ("; their files are exported again on the next run." if config["journal_enabled"] else "."),
+              file=sys.stderr)
+    return 1 if failed or engine.csv_failures else 0
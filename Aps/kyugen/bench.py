@@ -0,0 +1,404 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+from types import SimpleNamespace
+
+from kyugen.client import GeminiSession
+from kyugen.constants import CATEGORY_MAP
+from kyugen.keypool import KeyPool
+from kyugen.metrics import STAGES
+from kyugen.ratelimit import TokenBucket
+
+MANIFEST_FILENAME = "corpus.json"
+
+_WORDS = ("abstract", "texture", "gradient", "colour", "pattern", "background", "design", "noise", "light",
+          "shape", "modern", "digital", "art", "vivid", "smooth", "surface", "graphic", "wallpaper",
+          "artistic", "creative", "bright", "soft", "blur", "detail", "closeup", "synthetic", "render",
+          "geometric", "decorative", "backdrop")
+
+
+class ResourceExhausted(Exception):
+    # Same class name as google.api_core's 429 so the engine treats it as quota
+    pass
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+# Local stand-in for genai.GenerativeModel. Answers in the format the request
+# asks for (JSON with a generation_config, labelled text otherwise, one entry
+# per image for batches) after a simulated latency, fails a share of calls
+# with 503s and answers 429 once its own requests/min limit is spent. Random
+# choices come from a seeded generator, so runs are repeatable.
+class MockGenerativeModel:
+    def __init__(self, latency=0.5, jitter=0.2, error_rate=0.0, rpm=0, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # Allows five seconds' worth of requests in a burst, like RateLimiter
+        self.bucket = TokenBucket(rpm / 60.0, max(1.0, rpm / 12.0)) if rpm > 0 else None
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def _roll(self):
+        with self.lock:
+            self.calls += 1
+            return self.random.random(), self.random.uniform(-self.jitter, self.jitter)
+
+    def _admit(self):
+        # Returns (seconds of latency, fails): 429 straight away when over
+        # the limit
+        if self.bucket and self.bucket.reserve(1) > 0:
+            self.bucket.adjust(1)
+            raise ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+        roll, jitter = self._roll()
+        return max(0.0, self.latency * (1 + jitter)), roll < self.error_rate
+
+    def generate_content(self, contents, generation_config=None):
+        latency, fails = self._admit()
+        time.sleep(latency)
+        return self._answer(contents, generation_config, fails)
+
+    async def generate_content_async(self, contents, generation_config=None):
+        latency, fails = self._admit()
+        await asyncio.sleep(latency)
+        return self._answer(contents, generation_config, fails)
+
+    def _answer(self, contents, generation_config, fails):
+        if fails:
+            raise ServiceUnavailable("503 The model is overloaded. Please try again later.")
+        if isinstance(contents, str):
+            # Repair or title variation request
+            text = contents.rsplit("\n", 1)[-1]
+            if generation_config:
+                return self._response(json.dumps(self._describe(text.encode("utf-8"))), contents)
+            return self._response(f"Alternative {text[:80]}", contents)
+
+        images = [part["inline_data"]["data"] for part in contents if isinstance(part, dict)]
+        prompt = "".join(part for part in contents if isinstance(part, str))
+        described = [self._describe(data) for data in images]
+        batch = len(images) > 1 or "Image 1:" in prompt
+        if generation_config:
+            if batch:
+                text = json.dumps([dict(d, image=n) for n, d in enumerate(described, 1)])
+            else:
+                text = json.dumps(described[0])
+        else:
+            blocks = [self._labelled(d) for d in described]
+            if batch:
+                blocks = [f"Image {n}\n{block}" for n, block in enumerate(blocks, 1)]
+            text = "\n\n".join(blocks)
+        return self._response(text, prompt, len(images))
+
+    @staticmethod
+    def _describe(data):
+        # Deterministic per image, so titles (and output names) don't depend
+        # on worker scheduling
+        digest = hashlib.sha256(data).digest()
+        keywords = [_WORDS[(digest[i] + i) % len(_WORDS)] for i in range(24)]
+        categories = list(CATEGORY_MAP)
+        return {
+            "title": f"Synthetic abstract test image {digest[:4].hex()} with soft colour gradients",
+            "keywords": list(dict.fromkeys(keywords)),
+            "category": categories[digest[30] % len(categories)],
+        }
+
+    @staticmethod
+    def _labelled(described):
+        return (f"Title: {described['title']}\nKeywords: {', '.join(described['keywords'])}\n"
+                f"Category: {described['category']}")
+
+    @staticmethod
+    def _response(text, prompt, images=0):
+        prompt_tokens = len(prompt) // 4 + 258 * images
+        output_tokens = len(text) // 4
+        usage = SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens,
+                                total_token_count=prompt_tokens + output_tokens)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+
+def _noise_image(rng, width, height, mode="RGB"):
+    # Smooth coloured noise: compresses like a photo rather than like static
+    import numpy as np
+    from PIL import Image
+
+    bands = 4 if mode == "RGBA" else 3
+    small = rng.integers(0, 256, (max(2, height // 32), max(2, width // 32), bands), dtype=np.uint8)
+    img = Image.fromarray(small, mode).resize((width, height), Image.BICUBIC)
+    grain = rng.integers(-12, 13, (height, width, bands), dtype=np.int16)
+    return Image.fromarray(np.clip(np.asarray(img, dtype=np.int16) + grain, 0, 255).astype(np.uint8), mode)
+
+
+def _size_for(megapixels, aspect=1.5):
+    height = int((megapixels * 1e6 / aspect) ** 0.5)
+    return int(height * aspect), height
+
+
+def _write_video(path, rng, seconds, fps=25, size=(1280, 720)):
+    # Short H.264 clip from ffmpeg's test source; OpenCV as a fallback.
+    # False if neither is available.
+    if shutil.which("ffmpeg"):
+        import subprocess
+
+        pattern = ("testsrc2", "mandelbrot", "life", "smptebars")[int(rng.integers(0, 4))]
+        subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+                        "-i", f"{pattern}=size={size[0]}x{size[1]}:rate={fps}", "-t", str(seconds),
+                        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-g", str(fps * 2), path], check=True)
+        return True
+    try:
+        import cv2
+    except ImportError:
+        return False
+    import numpy as np
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    frame = np.asarray(_noise_image(rng, *size))
+    for i in range(int(seconds * fps)):
+        writer.write(np.roll(frame, i * 8, axis=1))
+    writer.release()
+    return True
+
+
+def generate_corpus(path, megapixels=(1, 6, 12, 24), jpegs=4, pngs=4, png_megapixels=4, videos=2,
+                    video_seconds=5, eps=2, seed=1):
+    # Writes the synthetic corpus into `path` and a manifest describing it.
+    # The same arguments always produce the same files.
+    import numpy as np
+
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    files = []
+    for mp in megapixels:
+        for i in range(jpegs):
+            name = f"jpeg_{mp:g}mp_{i:03d}.jpg"
+            _noise_image(rng, *_size_for(mp)).save(os.path.join(path, name), quality=90)
+            files.append(name)
+    for i in range(pngs):
+        name = f"png_{png_megapixels:g}mp_{i:03d}.png"
+        _noise_image(rng, *_size_for(png_megapixels), mode="RGBA").save(os.path.join(path, name))
+        files.append(name)
+    for i in range(eps):
+        # Raster EPS as written by Pillow; rendering it back needs Ghostscript
+        name = f"eps_{i:03d}.eps"
+        _noise_image(rng, *_size_for(2)).save(os.path.join(path, name), "EPS")
+        files.append(name)
+    for i in range(videos):
+        name = f"video_{video_seconds:g}s_{i:03d}.mp4"
+        if not _write_video(os.path.join(path, name), rng, video_seconds):
+            print("[BENCH] Neither ffmpeg nor OpenCV is available, no videos in the corpus")
+            break
+        files.append(name)
+
+    manifest = {"seed": seed, "megapixels": list(megapixels), "jpegs": jpegs, "pngs": pngs,
+                "png_megapixels": png_megapixels, "videos": videos, "video_seconds": video_seconds, "eps": eps,
+                "files": files, "bytes": sum(os.path.getsize(os.path.join(path, f)) for f in files)}
+    with open(os.path.join(path, MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_corpus(path, **spec):
+    # Reuses a corpus generated earlier with the same settings
+    try:
+        with open(os.path.join(path, MANIFEST_FILENAME), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = None
+    if manifest and all(manifest.get(k) == (list(v) if isinstance(v, tuple) else v) for k, v in spec.items()) \
+            and all(os.path.exists(os.path.join(path, name)) for name in manifest["files"]):
+        return manifest
+    return generate_corpus(path, **spec)
+
+
+def peak_rss():
+    # Peak resident set size in bytes of this process or its largest child
+    # (process-pool preprocessing, ffmpeg), None where it can't be measured
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    unit = 1 if sys.platform == "darwin" else 1024
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * unit
+
+
+def run_once(corpus_path, work_path, config, mock):
+    # One pipeline run over a fresh copy of the corpus. Meant to run in its
+    # own process so peak RSS belongs to this run alone.
+    from kyugen.engine import MetadataEngine
+
+    input_path = os.path.join(work_path, "input")
+    output_path = os.path.join(work_path, "output")
+    shutil.rmtree(work_path, ignore_errors=True)
+    shutil.copytree(corpus_path, input_path, ignore=shutil.ignore_patterns(MANIFEST_FILENAME))
+    os.makedirs(output_path)
+
+    config = dict(config, input_path=input_path, output_path=output_path)
+    engine = MetadataEngine(config)
+    # One mock per key, each with its own rate limit, like separate projects
+    models = []
+
+    def session_factory(api_key, model_name, own_client):
+        models.append(MockGenerativeModel(**dict(mock, seed=mock["seed"] + len(models))))
+        return GeminiSession(api_key, model_name, engine.config["max_title_length"], engine.config["max_keywords"],
+                             engine.config["custom_keywords"], engine.config["structured_output"], model=models[-1])
+
+    engine.keys = KeyPool.from_config(engine.config, session_factory)
+    cpu_before = os.times()
+    started = time.perf_counter()
+    try:
+        counts = engine.run(check_connection=False)
+    finally:
+        engine.close()
+    elapsed = time.perf_counter() - started
+    cpu_after = os.times()
+    snap = engine.metrics.snapshot()
+    shutil.rmtree(work_path, ignore_errors=True)
+
+    finished = counts["ok"] + counts["error"]
+    return {
+        "workers": config["workers"],
+        "counts": counts,
+        "elapsed": elapsed,
+        "files_per_sec": finished / elapsed if elapsed else 0.0,
+        "cpu": sum(cpu_after[i] - cpu_before[i] for i in range(4)),
+        "stage_cpu": {name: snap["stages"][name]["cpu"] for name in STAGES},
+        "stage_seconds": {name: snap["stages"][name]["seconds"] for name in STAGES},
+        "api_calls": snap["api_calls"],
+        "mock_calls": sum(model.calls for model in models),
+        "api_errors": snap["errors"],
+        "tokens": snap["tokens"]["total"],
+        "peak_rss": peak_rss(),
+    }
+
+
+def run_suite(corpus_path, work_path, worker_counts, config, mock, repeat=1):
+    # Every run gets a fresh interpreter (spawn), so imports, caches and peak
+    # memory don't carry over from the previous one
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for workers in worker_counts:
+        for attempt in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_once, corpus_path, os.path.join(work_path, f"run_{workers}_{attempt}"),
+                                     dict(config, workers=workers), mock).result()
+            result["repeat"] = attempt
+            results.append(result)
+            print(f"[BENCH] {workers} workers: {result['files_per_sec']:.2f} files/s "
+                  f"({result['counts']['ok']} ok, {result['counts']['error']} error)")
+    return results
+
+
+def format_report(manifest, results):
+    lines = [f"Corpus: {len(manifest['files'])} files, {manifest['bytes'] / 1e6:.1f} MB (seed {manifest['seed']})",
+             "",
+             f"{'workers':>7} {'ok':>5} {'error':>5} {'files/s':>8} {'wall s':>7} {'cpu s':>7} "
+             f"{'api calls':>9} {'mock calls':>10} {'peak RSS':>9}  errors"]
+    for r in results:
+        rss = f"{r['peak_rss'] / 2 ** 20:.0f} MB" if r["peak_rss"] else "n/a"
+        errors = ", ".join(f"{k} {v}" for k, v in sorted(r["api_errors"].items())) or "-"
+        lines.append(f"{r['workers']:>7} {r['counts']['ok']:>5} {r['counts']['error']:>5} "
+                     f"{r['files_per_sec']:>8.2f} {r['elapsed']:>7.1f} {r['cpu']:>7.1f} "
+                     f"{r['api_calls']:>9} {r['mock_calls']:>10} {rss:>9}  {errors}")
+    lines += ["", "CPU seconds per stage:", f"{'workers':>7} " + " ".join(f"{name:>10}" for name in STAGES)]
+    for r in results:
+        lines.append(f"{r['workers']:>7} " + " ".join(f"{r['stage_cpu'][name]:>10.2f}" for name in STAGES))
+    return "\n".join(lines)
+
+
+def _numbers(text, kind=int):
+    return [kind(part) for part in text.split(",") if part.strip()]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m kyugen.bench",
+        description="Run the full pipeline over a synthetic corpus against a local mock of the Gemini API "
+                    "and report throughput, CPU time per stage, peak memory and API calls per worker count.")
+    parser.add_argument("--corpus", help="folder for the generated corpus, reused when the settings match "
+                                         "(default: a temporary folder)")
+    parser.add_argument("--megapixels", default="1,6,12,24", help="JPEG sizes in megapixels (default: %(default)s)")
+    parser.add_argument("--jpegs", type=int, default=4, help="JPEGs per size (default: %(default)s)")
+    parser.add_argument("--pngs", type=int, default=4, help="4 MP PNGs with alpha (default: %(default)s)")
+    parser.add_argument("--videos", type=int, default=2, help="short MP4 clips, needs ffmpeg or OpenCV "
+                                                              "(default: %(default)s)")
+    parser.add_argument("--video-seconds", dest="video_seconds", type=float, default=5)
+    parser.add_argument("--eps", type=int, default=2, help="EPS files, rendered with Ghostscript "
+                                                           "(default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", default="1,4,8", help="API worker counts to compare (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per worker count (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock seconds per request (default: %(default)s)")
+    parser.add_argument("--jitter", type=float, default=0.2,
+                        help="latency varies by up to this fraction (default: %(default)s)")
+    parser.add_argument("--error-rate", dest="error_rate", type=float, default=0.0,
+                        help="share of mock requests failing with 503 (default: %(default)s)")
+    parser.add_argument("--mock-rpm", dest="mock_rpm", type=int, default=0,
+                        help="mock server requests/min before it answers 429, 0 = unlimited (default: %(default)s)")
+    parser.add_argument("--rpm", type=int, default=0,
+                        help="client-side requests/min limit per key, 0 = unlimited (default: %(default)s)")
+    parser.add_argument("--keys", type=int, default=1,
+                        help="API keys in the pool, each with its own mock and --mock-rpm limit (default: %(default)s)")
+    parser.add_argument("--batch-size", dest="batch_size", type=int, default=1)
+    parser.add_argument("--dispatch", choices=["thread", "async"], default="thread",
+                        help="API workers as threads or as requests on one event loop (default: %(default)s)")
+    parser.add_argument("--preprocess-backend", dest="preprocess_backend", choices=["thread", "process"],
+                        default="thread")
+    parser.add_argument("--text-output", dest="structured_output", action="store_false")
+    parser.add_argument("--embed", dest="embed_metadata", action="store_true")
+    parser.add_argument("--json", dest="json_path", help="also write the results as JSON")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.eps and not any(shutil.which(gs) for gs in ("gs", "gswin64c", "gswin32c")):
+        print("[BENCH] Ghostscript not found, leaving EPS files out of the corpus")
+        args.eps = 0
+    spec = {"megapixels": _numbers(args.megapixels, float), "jpegs": args.jpegs, "pngs": args.pngs,
+            "videos": args.videos, "video_seconds": args.video_seconds, "eps": args.eps, "seed": args.seed}
+    config = {"api_key": "benchmark-0", "api_keys": [f"benchmark-{i}" for i in range(1, args.keys)],
+              "model": "mock", "rpm": args.rpm, "tpm": 0, "batch_size": args.batch_size,
+              "dispatch": args.dispatch,
+              "preprocess_backend": args.preprocess_backend, "structured_output": args.structured_output,
+              "embed_metadata": args.embed_metadata, "cache_enabled": False, "journal_enabled": True,
+              "retry_budget": 0, "breaker_cooldown": 5}
+    mock = {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+            "rpm": args.mock_rpm, "seed": args.seed}
+
+    temp_path = tempfile.mkdtemp(prefix="kyugen_bench_")
+    try:
+        corpus_path = args.corpus or os.path.join(temp_path, "corpus")
+        print(f"[BENCH] Preparing corpus in {corpus_path}")
+        manifest = load_corpus(corpus_path, **spec)
+        results = run_suite(corpus_path, temp_path, _numbers(args.workers), config, mock, args.repeat)
+    finally:
+        shutil.rmtree(temp_path, ignore_errors=True)
+
+    print()
+    print(format_report(manifest, results))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"corpus": manifest, "config": config, "mock": mock, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
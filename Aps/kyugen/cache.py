@@ -0,0 +1,136 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+CACHE_FILENAME = ".kyugen_cache.sqlite"
+EMBEDDINGS_FILENAME = ".kyugen_embeddings.sqlite"
+
+
+def cache_key(data, model_name, prompt):
+    # The upload bytes plus everything that changes the answer
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(data).digest())
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Persistent response cache keyed by cache_key(). Lives in the output folder so
+# re-runs over Error/ or re-uploaded duplicates never pay for a second call.
+# Entries expire after max_age_days and the least recently used ones are
+# dropped beyond max_entries.
+class ResultCache:
+    def __init__(self, path, max_entries=100000, max_age_days=180):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400 if max_age_days else 0
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                title TEXT NOT NULL,
+                keywords TEXT NOT NULL,
+                category TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        self.evict()
+
+    @classmethod
+    def for_output(cls, output_path, config):
+        return cls(os.path.join(output_path, CACHE_FILENAME),
+                   config.get("cache_max_entries", 100000), config.get("cache_max_age_days", 180))
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT title, keywords, category, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.max_age and row[3] < time.time() - self.max_age:
+                self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            self.conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+        return row[0], row[1], row[2]
+
+    def put(self, key, response, title, keywords, category):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, response, title, keywords, category, now, now))
+            self.writes += 1
+            evict = self.writes % 1000 == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        with self.lock:
+            if self.max_age:
+                self.conn.execute("DELETE FROM results WHERE created < ?", (time.time() - self.max_age,))
+            if self.max_entries:
+                self.conn.execute("""
+                    DELETE FROM results WHERE key IN (
+                        SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                    )""", (self.max_entries,))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# Image embeddings from the local model, keyed by file content hash and
+# model, so re-exported or re-run files are never embedded twice. Vectors are
+# stored as float32 bytes.
+class EmbeddingCache:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                created REAL NOT NULL
+            )""")
+
+    @classmethod
+    def for_output(cls, output_path):
+        return cls(os.path.join(output_path, EMBEDDINGS_FILENAME))
+
+    @staticmethod
+    def key(content_hash, model_id):
+        return f"{model_id}:{content_hash}"
+
+    def get(self, key):
+        import numpy as np
+
+        with self.lock:
+            row = self.conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        return np.frombuffer(row[0], dtype=np.float32) if row else None
+
+    def put_many(self, items):
+        # [(key, vector)], one transaction
+        import numpy as np
+
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
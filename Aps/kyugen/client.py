@@ -0,0 +1,213 @@
+import threading
+
+from kyugen.constants import CATEGORY_MAP
+from kyugen.parse import response_schema
+
+# genai.configure() mutates module-wide state; serialize it
+_configure_lock = threading.Lock()
+
+
+class ApiConnectionError(Exception):
+    pass
+
+
+# google-generativeai has no public way to give one GenerativeModel its own
+# API key: generate_content() sends through the model's _client and
+# _async_client attributes, falling back to the process-wide configured key
+# when they are unset. Releases in this range [low, high) are known to work
+# that way; outside it a keyed model refuses to start rather than quietly
+# sending every key's traffic through one project.
+KEYED_CLIENT_VERSIONS = ((0, 8), (0, 9))
+
+
+def keyed_model(genai, model_name, client_options):
+    # genai.GenerativeModel whose requests use client_options["api_key"]
+    version = getattr(genai, "__version__", "unknown")
+    low, high = KEYED_CLIENT_VERSIONS
+    try:
+        supported = low <= tuple(int(part) for part in version.split(".")[:2]) < high
+    except ValueError:
+        supported = False
+    model = genai.GenerativeModel(model_name)
+    if not supported or not hasattr(model, "_client") or not hasattr(model, "_async_client"):
+        raise ApiConnectionError(f"google-generativeai {version} can't send through several API keys; "
+                                 f"install the version in requirements.txt or use a single key")
+    from google.ai import generativelanguage as glm
+
+    model._client = glm.GenerativeServiceClient(client_options=client_options)
+    return model
+
+
+def attach_async_client(model, client_options):
+    # The async half of keyed_model(). The async client binds to the running
+    # event loop, so it is only created from inside it.
+    if model._async_client is None:
+        from google.ai import generativelanguage as glm
+
+        model._async_client = glm.GenerativeServiceAsyncClient(client_options=client_options)
+    return model
+
+
+def format_instructions(max_title, max_keywords, custom_keywords, title_only=False):
+    # title_only: keywords and category come from the local model
+    title = f"""Title: Describe the image in clear, detailed terms, focusing on the main subject, setting, and defining features. Avoid general themes or vague labels. Avoid assumptions or inferred meanings—only describe visible, tangible elements. Do not start with 'This image contains...'. Keep the response informative but concise, Stay under {max_title} characters."""
+    if title_only:
+        return title
+    prompt_parts = [
+        f"""{title}
+Keywords: A comma-separated list of {max_keywords} relevant single-word keywords. Avoid copyrighted words."""
+    ]
+    if custom_keywords:
+        prompt_parts.append(f"Ensure these keywords are included in the list: {custom_keywords}.")
+
+    prompt_parts.append(f"Category: The most relevant category from the following list: {', '.join(CATEGORY_MAP.keys())}.")
+    return "\n".join(prompt_parts)
+
+
+def build_prompt(max_title, max_keywords, custom_keywords, title_only=False):
+    return f"""Describe this image with the following format:
+{format_instructions(max_title, max_keywords, custom_keywords, title_only)}
+Do not include anything except the exact formatted result."""
+
+
+def _json_keys(title_only):
+    return '"title"' if title_only else '"title", "keywords" (an array of strings) and "category"'
+
+
+def build_json_prompt(max_title, max_keywords, custom_keywords, title_only=False):
+    keys = "the key" if title_only else "the keys"
+    return f"""Describe this image. Respond with a JSON object with {keys} {_json_keys(title_only)}, filled in as follows:
+{format_instructions(max_title, max_keywords, custom_keywords, title_only)}"""
+
+
+def build_batch_prompt(max_title, max_keywords, custom_keywords, structured=False, title_only=False):
+    # Template with a {count} placeholder; the instructions are sent (and
+    # billed) once per request instead of once per image.
+    instructions = format_instructions(max_title, max_keywords, custom_keywords, title_only)
+    instructions = instructions.replace("{", "{{").replace("}", "}}")
+    if structured:
+        keys = '"image" (its number) and "title"' if title_only else f'"image" (its number), {_json_keys(False)}'
+        return f"""You were given {{count}} images, labelled "Image 1" to "Image {{count}}". Describe each image separately.
+Respond with a JSON array containing one object per image, each with the keys {keys}, filled in as follows:
+{instructions}"""
+    return f"""You were given {{count}} images, labelled "Image 1" to "Image {{count}}". Describe each image separately, in order.
+For each image write a line "Image N" (its number) followed by this format:
+{instructions}
+Do not include anything except the exact formatted results."""
+
+
+# One configured Gemini client per run. Holds the model handle (and with it the
+# underlying gRPC channel / HTTP session, so connections are reused across
+# files) plus the prompt, which only depends on run settings. The generated
+# client is thread-safe, so all workers share a single session.
+class GeminiSession:
+    def __init__(self, api_key, model_name, max_title, max_keywords, custom_keywords, structured=False,
+                 model=None, own_client=False, title_only=False):
+        # `model` stands in for genai.GenerativeModel (the benchmark's local
+        # mock); no API key is configured then. With own_client the session
+        # gets API clients of its own instead of the process-wide configured
+        # key, so sessions for several keys can be used at the same time.
+        # With title_only the model is only asked for titles.
+        self.model_name = model_name
+        self.client_options = {"api_key": api_key} if own_client and model is None else None
+        if model is None:
+            import google.generativeai as genai
+
+            self.genai = genai
+            if self.client_options:
+                model = keyed_model(genai, model_name, self.client_options)
+            else:
+                with _configure_lock:
+                    genai.configure(api_key=api_key)
+                    model = genai.GenerativeModel(model_name)
+        else:
+            self.genai = None
+        self.model = model
+        self.max_title = max_title
+        self.structured = structured
+        self.title_only = title_only
+        if structured:
+            # JSON mode: the API enforces the schema, including the category enum
+            self.prompt = build_json_prompt(max_title, max_keywords, custom_keywords, title_only)
+            self.generation_config = {"response_mime_type": "application/json",
+                                      "response_schema": response_schema(title_only=title_only)}
+            self.batch_generation_config = {"response_mime_type": "application/json",
+                                            "response_schema": response_schema(batch=True, title_only=title_only)}
+        else:
+            self.prompt = build_prompt(max_title, max_keywords, custom_keywords, title_only)
+            self.generation_config = self.batch_generation_config = None
+        self.batch_prompt = build_batch_prompt(max_title, max_keywords, custom_keywords, structured, title_only)
+
+    def check_connection(self):
+        # Model metadata lookup: validates key and model name without spending
+        # generation quota.
+        if self.genai is None:
+            return
+        name = self.model_name if self.model_name.startswith("models/") else f"models/{self.model_name}"
+        client = None
+        if self.client_options:
+            from google.ai import generativelanguage as glm
+
+            client = glm.ModelServiceClient(client_options=self.client_options)
+        try:
+            self.genai.get_model(name, client=client)
+        except Exception as e:
+            raise ApiConnectionError(f"Could not initialize Gemini API: {e}") from e
+
+    def image_request(self, image_data, mime_type):
+        return [{"inline_data": {"mime_type": mime_type, "data": image_data}}, self.prompt]
+
+    def batch_request(self, uploads):
+        parts = []
+        for number, upload in enumerate(uploads, 1):
+            parts.append(f"Image {number}:")
+            parts.append({"inline_data": {"mime_type": upload.mime_type, "data": upload.data}})
+        parts.append(self.batch_prompt.format(count=len(uploads)))
+        return parts
+
+    def complete(self, parsed):
+        # Whether (title, keyword_text, category) has every field asked for
+        return bool(parsed[0]) if self.title_only else all(parsed)
+
+    def repair_request(self, result):
+        if self.title_only:
+            return ("The following answer should be a JSON object with the key \"title\" (string). "
+                    f"Return it corrected as valid JSON only.\n\n{result}")
+        return ("The following answer should be a JSON object with the keys \"title\" (string), "
+                "\"keywords\" (array of single-word strings) and \"category\" (one of: "
+                f"{', '.join(CATEGORY_MAP.keys())}). Return it corrected as valid JSON only.\n\n{result}")
+
+    def vary_title_request(self, title):
+        return (f"Rewrite this stock photo title with different wording but the same meaning. "
+                f"Stay under {self.max_title} characters. Reply with the title only.\n{title}")
+
+    def generate(self, image_data, mime_type):
+        return self.model.generate_content(self.image_request(image_data, mime_type),
+                                           generation_config=self.generation_config)
+
+    def generate_batch(self, uploads):
+        return self.model.generate_content(self.batch_request(uploads), generation_config=self.batch_generation_config)
+
+    def repair(self, result):
+        return self.model.generate_content(self.repair_request(result), generation_config=self.generation_config)
+
+    def vary_title(self, title):
+        return self.model.generate_content(self.vary_title_request(title))
+
+    # Coroutine versions for the asyncio dispatcher; same requests, sent
+    # through the client's async transport
+    def _async_model(self):
+        if self.client_options:
+            return attach_async_client(self.model, self.client_options)
+        return self.model
+
+    async def generate_async(self, image_data, mime_type):
+        return await self._async_model().generate_content_async(self.image_request(image_data, mime_type),
+                                                       generation_config=self.generation_config)
+
+    async def repair_async(self, result):
+        return await self._async_model().generate_content_async(self.repair_request(result),
+                                                       generation_config=self.generation_config)
+
+    async def vary_title_async(self, title):
+        return await self._async_model().generate_content_async(self.vary_title_request(title))
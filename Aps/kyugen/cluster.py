@@ -0,0 +1,245 @@
+import os
+import csv
+import json
+import time
+import socket
+import hashlib
+import threading
+
+from kyugen.exporters import EXPORTERS
+from kyugen.quality import REJECTED_FILENAME, REJECTED_FOLDER
+from kyugen.sink import complete_rows
+
+LEASES_DIRNAME = ".kyugen_leases"
+NODES_DIRNAME = ".kyugen_nodes"
+MERGE_LOCK_FILENAME = ".kyugen_merge.lock"
+
+# A merge lock older than this belongs to a node that died while merging
+MERGE_LOCK_STALE = 600
+
+
+def default_node_id():
+    # Stable across restarts, so a restarted node finds its own journal
+    return socket.gethostname() or "node"
+
+
+def node_path(output_path, node_id):
+    # Per-node journal, caches, metrics and CSV shards
+    return os.path.join(output_path, NODES_DIRNAME, node_id)
+
+
+# Claims on input files for several machines sharing one input and output
+# folder, without a coordinator. A claim is a lock file in the output folder
+# created with O_EXCL, which is atomic on local disks, SMB and NFS alike (unlike
+# SQLite locking on network shares). The owner touches its lease files every
+# lease_seconds / 3; a lease that hasn't been touched for lease_seconds
+# belongs to a node that crashed, and the first node to rename it away takes
+# the file over. Leases are named after the file's path relative to the input
+# folder, so nodes may mount the share at different paths. Expiry compares the
+# file server's mtimes with the local clock, so node clocks should be synced.
+class LeaseManager:
+    def __init__(self, input_path, output_path, node_id, lease_seconds=120):
+        self.input_path = os.path.abspath(input_path)
+        self.path = os.path.join(output_path, LEASES_DIRNAME)
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+        self.held = {}
+        os.makedirs(self.path, exist_ok=True)
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._renew, daemon=True)
+        self.thread.start()
+
+    def _relative(self, file_path):
+        return os.path.relpath(os.path.abspath(file_path), self.input_path).replace(os.sep, "/")
+
+    def _lease_path(self, file_path):
+        name = hashlib.sha1(self._relative(file_path).encode("utf-8")).hexdigest()
+        return os.path.join(self.path, name + ".lease")
+
+    def claim(self, file_path):
+        # True if this node now owns the file
+        lease_path = self._lease_path(file_path)
+        for _ in range(2):
+            try:
+                fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self._take_over(lease_path):
+                    return False
+                continue
+            except OSError as e:
+                print(f"[CLUSTER] Cannot claim {os.path.basename(file_path)}: {e}")
+                return False
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"node": self.node_id, "file": self._relative(file_path), "claimed": time.time()}, f)
+            with self.lock:
+                self.held[file_path] = lease_path
+            return True
+        return False
+
+    def _owner(self, lease_path):
+        try:
+            with open(lease_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("node")
+        except (OSError, ValueError):
+            return None
+
+    def _take_over(self, lease_path):
+        # Removes an expired lease; True if the caller should try to claim
+        # again
+        try:
+            age = time.time() - os.stat(lease_path).st_mtime
+        except FileNotFoundError:
+            return True
+        if age < self.lease_seconds:
+            return False
+        # Renaming is atomic: of several nodes seeing the same expired lease,
+        # only one moves it away
+        stale_path = f"{lease_path}.{self.node_id}.stale"
+        try:
+            os.replace(lease_path, stale_path)
+        except FileNotFoundError:
+            return True
+        except OSError:
+            return False
+        try:
+            if time.time() - os.stat(stale_path).st_mtime < self.lease_seconds:
+                # Someone re-claimed it between the stat and the rename
+                os.replace(stale_path, lease_path)
+                return False
+            print(f"[CLUSTER] Taking over an expired lease from {self._owner(stale_path) or 'an unknown node'}")
+            os.remove(stale_path)
+        except OSError:
+            pass
+        return True
+
+    def release(self, file_path):
+        with self.lock:
+            lease_path = self.held.pop(file_path, None)
+        if lease_path:
+            try:
+                os.remove(lease_path)
+            except OSError:
+                pass
+
+    def _renew(self):
+        while not self.closed.wait(self.lease_seconds / 3):
+            with self.lock:
+                held = list(self.held.items())
+            for file_path, lease_path in held:
+                try:
+                    if self._owner(lease_path) != self.node_id:
+                        raise FileNotFoundError
+                    os.utime(lease_path)
+                except OSError:
+                    # This node stalled past its lease and another one took
+                    # the file; whichever finishes first moves it
+                    print(f"[CLUSTER] Lost the lease on {os.path.basename(file_path)}")
+                    with self.lock:
+                        self.held.pop(file_path, None)
+
+    def close(self, release=True):
+        # Gives back whatever is still held, e.g. files skipped on stop. With
+        # release=False (the run died) the leases are left to expire, as a
+        # worker may still be moving their files.
+        self.closed.set()
+        self.thread.join()
+        with self.lock:
+            held = list(self.held) if release else []
+        for file_path in held:
+            self.release(file_path)
+
+
+def _shard_rows(path, delimiter):
+    # Complete rows only; a row torn by a crashed node is left out
+    with open(path, "rb") as f:
+        rows, _ = complete_rows(f.read(), delimiter)
+    return (rows[0] if rows else None), rows[1:]
+
+
+def merge_csv(target, shards, delimiter=","):
+    # Rows already in `target`, then every shard's, each filename once.
+    # Written next to the target, fsynced and swapped in atomically.
+    seen = set()
+    header = None
+    temp_path = target + ".tmp"
+    count = 0
+    with open(temp_path, "w", newline="", encoding="utf-8") as out:
+        writer = csv.writer(out, delimiter=delimiter)
+        for path in ([target] if os.path.exists(target) else []) + shards:
+            shard_header, rows = _shard_rows(path, delimiter)
+            if header is None and shard_header:
+                header = shard_header
+                writer.writerow(header)
+            for row in rows:
+                if row and row[0] not in seen:
+                    seen.add(row[0])
+                    writer.writerow(row)
+                    count += 1
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(temp_path, target)
+    return count
+
+
+def _node_paths(output_path):
+    nodes_path = os.path.join(output_path, NODES_DIRNAME)
+    if not os.path.isdir(nodes_path):
+        return []
+    return sorted(entry.path for entry in os.scandir(nodes_path) if entry.is_dir())
+
+
+def exported_filenames(output_path):
+    # Filenames in the merged CSVs and in every node's shards, so a name
+    # whose file has been moved away since is never handed out again
+    names = set()
+    for exporter in EXPORTERS.values():
+        for folder in [output_path] + _node_paths(output_path):
+            path = os.path.join(folder, exporter.filename)
+            if os.path.exists(path):
+                _, rows = _shard_rows(path, exporter.delimiter)
+                names.update(row[0] for row in rows if row)
+    return names
+
+
+def _acquire_merge_lock(path):
+    while True:
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return
+        except FileExistsError:
+            try:
+                if time.time() - os.stat(path).st_mtime > MERGE_LOCK_STALE:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue
+            time.sleep(0.5)
+
+
+def merge_shards(output_path):
+    # Folds every node's CSV shards into the final CSVs in the output folder.
+    # Safe to run at any time and from any node; merges are serialized by a
+    # lock file. Returns {final CSV path: rows}.
+    nodes = _node_paths(output_path)
+    if not nodes:
+        return {}
+    delimiters = {exporter.filename: exporter.delimiter for exporter in EXPORTERS.values()}
+    targets = {name: os.path.join(output_path, name) for name in delimiters}
+    targets[REJECTED_FILENAME] = os.path.join(output_path, REJECTED_FOLDER, REJECTED_FILENAME)
+
+    lock_path = os.path.join(output_path, MERGE_LOCK_FILENAME)
+    _acquire_merge_lock(lock_path)
+    try:
+        merged = {}
+        for name, target in targets.items():
+            shards = [os.path.join(node, name) for node in nodes if os.path.exists(os.path.join(node, name))]
+            if shards:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                merged[target] = merge_csv(target, shards, delimiters.get(name, ","))
+        return merged
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
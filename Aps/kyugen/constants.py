@@ -0,0 +1,33 @@
+# Define available Gemini models
+GEMINI_MODELS = [
+    "gemini-2.0-flash", "gemini-2.5-pro-exp-03-25", "gemini-2.0-pro",
+    "gemini-2.0-flash-lite", "gemini-1.5-pro", "gemini-1.5-flash", "gemini-1.5-flash-8b"
+]
+
+# Category mapping for Adobe Stock
+CATEGORY_MAP = {
+    "Animals": "1",
+    "Architecture": "2",
+    "Backgrounds/Textures": "3",
+    "Beauty/Fashion": "4",
+    "Business": "5",
+    "Food & Drink": "6",
+    "Healthcare/Medical": "7",
+    "Holidays": "8",
+    "Industrial": "9",
+    "Interiors": "10",
+    "Miscellaneous": "11",
+    "Nature": "12",
+    "Objects": "13",
+    "Parks/Outdoor": "14",
+    "People": "15",
+    "Religion": "16",
+    "Science": "17",
+    "Signs/Symbols": "18",
+    "Sports/Recreation": "19",
+    "Technology": "20",
+    "The Arts": "21",
+    "Transportation": "22",
+    "Travel": "23",
+    "Vectors": "24"
+}
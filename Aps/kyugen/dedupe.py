@@ -0,0 +1,129 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+HASH_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Set-bit count for every byte value, for vectorized Hamming distances
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(file_path, hash_size=8):
+    # 64-bit difference hash. JPEGs are decoded with draft() straight at a
+    # tiny scale, so hashing costs a fraction of a full decode.
+    from PIL import Image
+
+    with Image.open(file_path) as img:
+        img.draft("L", (hash_size * 8, hash_size * 8))
+        small = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def popcount64(x):
+    # Set bits per uint64 element; np.bitwise_count is only in NumPy >= 2.0
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def hamming(a, b):
+    # Bitwise distance between one uint64 and an array of uint64 (or two arrays)
+    return popcount64(np.ascontiguousarray(np.bitwise_xor(a, b)))
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # Keep the earliest file as the root so it becomes the representative
+            if ra < rb:
+                self.parent[rb] = ra
+            else:
+                self.parent[ra] = rb
+
+
+# Perceptual-hash index over a scan. Groups images whose dHash differs by at
+# most max_distance bits. Candidate pairs come from multi-index hashing: with
+# the 64 bits split into max_distance + 1 bands, two hashes within the
+# threshold must agree exactly on at least one band. Only files that share a
+# band value get compared, so 100k files don't mean 10^10 comparisons.
+class PerceptualIndex:
+    def __init__(self, max_distance=6):
+        self.max_distance = max_distance
+        self.paths = []
+        self.hashes = np.zeros(0, dtype=np.uint64)
+
+    def build(self, file_paths, workers=None):
+        candidates = [p for p in file_paths if p.lower().endswith(HASH_EXTENSIONS)]
+
+        def safe_hash(path):
+            try:
+                return dhash(path)
+            except Exception as e:
+                print(f"[DEDUPE] Could not hash {os.path.basename(path)}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4) as pool:
+            hashed = [(p, h) for p, h in zip(candidates, pool.map(safe_hash, candidates)) if h is not None]
+        self.paths = [p for p, _ in hashed]
+        self.hashes = np.array([h for _, h in hashed], dtype=np.uint64)
+        return self
+
+    def _bands(self):
+        n_bands = min(64, self.max_distance + 1)
+        width = 64 // n_bands
+        for band in range(n_bands):
+            shift = band * width
+            bits = 64 - shift if band == n_bands - 1 else width
+            mask = np.uint64((1 << bits) - 1)
+            yield (self.hashes >> np.uint64(shift)) & mask
+
+    def _close_pairs(self, members, block=1024):
+        # All (i, j), i < j, within max_distance among `members`, computed as
+        # a blocked distance matrix
+        group = self.hashes[members]
+        g = len(group)
+        for start in range(0, g, block):
+            rows = group[start:start + block]
+            dist = popcount64(np.bitwise_xor(rows[:, None], group[None, :]))
+            upper = np.arange(g)[None, :] > np.arange(start, start + len(rows))[:, None]
+            ii, jj = np.nonzero((dist <= self.max_distance) & upper)
+            yield from zip(members[ii + start], members[jj])
+
+    def clusters(self):
+        # Lists of paths; the first entry of each list is the representative.
+        # Files that have no near-duplicate are not returned.
+        n = len(self.paths)
+        if n < 2:
+            return []
+        uf = _UnionFind(n)
+        for band_values in self._bands():
+            order = np.argsort(band_values, kind="stable")
+            sorted_values = band_values[order]
+            starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+            ends = np.r_[starts[1:], n]
+            for start, end in zip(starts, ends):
+                if end - start < 2:
+                    continue
+                members = np.sort(order[start:end])
+                for i, j in self._close_pairs(members):
+                    uf.union(i, j)
+
+        groups = {}
+        for i in range(n):
+            groups.setdefault(uf.find(i), []).append(self.paths[i])
+        return [members for members in groups.values() if len(members) > 1]
@@ -0,0 +1,182 @@
+import os
+import time
+import queue
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from kyugen.keypool import QuotaExhausted
+from kyugen.parse import parse_description
+from kyugen.retry import ApiError, PARSE, QUOTA, TRANSIENT
+
+
+# API stage on a single asyncio event loop instead of one blocked thread per
+# request, for quotas that allow hundreds of requests in flight. Jobs come
+# off the engine's bounded api_queue only while fewer than `in_flight`
+# requests are running, so a slow API backs up into preprocessing exactly as
+# it does with worker threads. Rate limits, the circuit breaker, retries,
+# cache and journal are the engine's own; only the waiting is async. Cache
+# and journal calls take a lock and commit to SQLite, so they run on a
+# storage thread of their own rather than stalling every request in flight.
+class AsyncDispatcher:
+    def __init__(self, engine, in_flight):
+        self.engine = engine
+        self.in_flight = max(1, in_flight)
+        self.storage = None
+
+    def run(self, inbox, stop_item):
+        # Thread target; returns once stop_item was read and every request
+        # has finished
+        asyncio.run(self._main(inbox, stop_item))
+
+    async def _main(self, inbox, stop_item):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.in_flight)
+        # Blocking queue reads happen off the loop, one at a time
+        reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dispatch-reader")
+        self.storage = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dispatch-storage")
+        tasks = set()
+        try:
+            while True:
+                await slots.acquire()
+                job = await loop.run_in_executor(reader, inbox.get)
+                if job is stop_item:
+                    slots.release()
+                    break
+                task = asyncio.create_task(self._handle(job, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            reader.shutdown(wait=False)
+            self.storage.shutdown(wait=False)
+
+    async def off_loop(self, func, *args):
+        # func(*args) on the storage thread, in the calling task's context so
+        # metrics still land on its job
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.storage, context.run, func, *args)
+
+    async def _handle(self, job, slots):
+        engine = self.engine
+        try:
+            with engine.metrics.bind(job):
+                await self.describe_stage(job)
+        except Exception as e:
+            print(f"[ERROR] Failed to process {os.path.basename(job.path)}: {e}")
+            job.fail(str(e))
+        finally:
+            slots.release()
+        try:
+            engine.finalize_queue.put_nowait(job)
+        except queue.Full:
+            await asyncio.get_running_loop().run_in_executor(None, engine.finalize_queue.put, job)
+
+    async def describe_stage(self, job):
+        engine = self.engine
+        if engine.should_stop():
+            job.status = "skipped"
+            return
+        try:
+            parsed = await self.describe_image(job.upload)
+        except ApiError as e:
+            parsed = e
+        await self.off_loop(engine.apply_description, job, parsed, False)
+        if not job.status and job.siblings and engine.config["dedupe_variation"]:
+            job.sibling_titles = [await self.vary_title(job.title) for _ in job.siblings]
+
+    async def describe_image(self, upload):
+        engine = self.engine
+        session = engine.open_session()
+        key, cached = await self.off_loop(engine.lookup_cache, session, upload)
+        if cached:
+            return cached
+        response = await self.call_api(lambda s: s.generate_async(upload.data, upload.mime_type),
+                                       len(upload.data))
+        result = response.text.strip() if response else ""
+        with engine.metrics.timed("parse"):
+            parsed = parse_description(result)
+        if not session.complete(parsed) and result and session.structured and not engine.should_stop():
+            result = await self.repair_description(result)
+            with engine.metrics.timed("parse"):
+                parsed = parse_description(result)
+        if not session.complete(parsed) and not engine.should_stop():
+            raise ApiError(PARSE, "incomplete answer" if result else "empty answer")
+        await self.off_loop(engine.store_cache, key, result, parsed)
+        return parsed
+
+    async def repair_description(self, result):
+        try:
+            response = await self.call_api(lambda s: s.repair_async(result))
+            return response.text.strip() if response else result
+        except Exception as e:
+            print(f"[GEMINI ERROR] Repair failed: {e}")
+            return result
+
+    async def vary_title(self, title):
+        try:
+            response = await self.call_api(lambda s: s.vary_title_async(title))
+            varied = response.text.strip().splitlines()[0].strip() if response else ""
+        except Exception as e:
+            print(f"[GEMINI ERROR] {e}")
+            varied = ""
+        return varied or title
+
+    async def call_api(self, request, upload_bytes=0):
+        # MetadataEngine.call_api for coroutines: same breaker, key pool and
+        # retry rules, awaiting instead of blocking. The in-flight cap is the
+        # dispatcher's own, so the adaptive thread limit isn't used here.
+        engine = self.engine
+        keys = engine.open_keys()
+        tries = {QUOTA: 0, TRANSIENT: 0}
+        while True:
+            waited = time.perf_counter()
+            while not engine.breaker.ready():
+                if not await self.sleep(0.25):
+                    return None
+            wait_for_reset = engine.watcher is not None
+            try:
+                slot, estimate, wait = keys.reserve(wait_for_reset)
+                while slot is None:
+                    # Every key is resting
+                    if not await self.sleep(wait):
+                        return None
+                    slot, estimate, wait = keys.reserve(wait_for_reset)
+            except QuotaExhausted as e:
+                engine.out_of_quota(e)
+                return None
+            if wait and not await self.sleep(wait):
+                keys.release(slot, estimate)
+                return None
+            engine.metrics.observe("throttle", time.perf_counter() - waited)
+            engine.metrics.api_call(upload_bytes)
+            started = time.perf_counter()
+            try:
+                response = await request(slot.session)
+                # Safety blocks only surface when the text is read
+                response.text
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            # Wall time only: the loop thread's CPU time belongs to every
+            # request in flight
+            seconds = time.perf_counter() - started
+            engine.metrics.observe("api", seconds)
+            if error is None:
+                engine.api_succeeded(slot, estimate, response, seconds)
+                return response
+            delay = engine.retry_delay(slot, error, tries)
+            if delay and not await self.sleep(delay):
+                return None
+
+    async def sleep(self, seconds):
+        # Interruptible wait; False if the run was stopped meanwhile
+        deadline = time.monotonic() + seconds
+        while not self.engine.should_stop():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            await asyncio.sleep(min(remaining, 0.5))
+        return False
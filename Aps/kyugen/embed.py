@@ -0,0 +1,228 @@
+import os
+import struct
+import shutil
+import zlib
+from xml.sax.saxutils import escape
+
+EMBED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".mp4", ".mov")
+
+_XMP_APP1 = b"http://ns.adobe.com/xap/1.0/\0"
+_XMP_EXTENSION_APP1 = b"http://ns.adobe.com/xmp/extension/\0"
+_EXIF_APP1 = b"Exif\0"
+_PHOTOSHOP_APP13 = b"Photoshop 3.0\0"
+_IRB_IPTC = 0x0404
+_IRB_IPTC_DIGEST = 0x0425
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_XMP_KEYWORD = b"XML:com.adobe.xmp"
+_XMP_UUID = bytes.fromhex("BE7ACFCB97A942E89C71999491E3AFAC")
+
+
+class EmbedError(Exception):
+    pass
+
+
+def build_xmp(title, description, keywords):
+    # Replaces any XMP already in the file, so only these fields survive
+    title = escape(title)
+    description = escape(description)
+    subjects = "".join(f"<rdf:li>{escape(k)}</rdf:li>" for k in keywords)
+    return f"""<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>
+<x:xmpmeta xmlns:x="adobe:ns:meta/">
+ <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+  <rdf:Description rdf:about=""
+    xmlns:dc="http://purl.org/dc/elements/1.1/"
+    xmlns:photoshop="http://ns.adobe.com/photoshop/1.0/">
+   <dc:title><rdf:Alt><rdf:li xml:lang="x-default">{title}</rdf:li></rdf:Alt></dc:title>
+   <dc:description><rdf:Alt><rdf:li xml:lang="x-default">{description}</rdf:li></rdf:Alt></dc:description>
+   <dc:subject><rdf:Bag>{subjects}</rdf:Bag></dc:subject>
+   <photoshop:Headline>{title}</photoshop:Headline>
+  </rdf:Description>
+ </rdf:RDF>
+</x:xmpmeta>
+<?xpacket end="w"?>""".encode("utf-8")
+
+
+def _iptc_dataset(record, dataset, value, limit):
+    # Cut to `limit` bytes on a character boundary, so the value stays valid
+    # UTF-8
+    data = value.encode("utf-8")[:limit].decode("utf-8", "ignore").encode("utf-8")
+    return b"\x1c" + bytes((record, dataset)) + struct.pack(">H", len(data)) + data
+
+
+def build_iptc(title, description, keywords):
+    # IPTC-IIM record, declared UTF-8 (1:90) so non-ASCII titles survive
+    parts = [b"\x1c\x01\x5a\x00\x03\x1b%G", b"\x1c\x02\x00\x00\x02\x00\x04",
+             _iptc_dataset(2, 5, title, 64), _iptc_dataset(2, 105, title, 256)]
+    parts.extend(_iptc_dataset(2, 25, k, 64) for k in keywords)
+    parts.append(_iptc_dataset(2, 120, description, 2000))
+    return b"".join(parts)
+
+
+def _irb(resource_id, data):
+    block = b"8BIM" + struct.pack(">H", resource_id) + b"\0\0" + struct.pack(">I", len(data)) + data
+    return block + b"\0" if len(data) % 2 else block
+
+
+def _photoshop_segment(existing, iptc):
+    # Keeps every other image resource of an existing APP13 block and
+    # swaps in the new IPTC record (dropping the now stale IPTC digest)
+    blocks = []
+    data = existing[len(_PHOTOSHOP_APP13):] if existing else b""
+    pos = 0
+    while pos + 12 <= len(data) and data[pos:pos + 4] == b"8BIM":
+        resource_id = struct.unpack(">H", data[pos + 4:pos + 6])[0]
+        name_length = data[pos + 6]
+        name_end = pos + 7 + name_length + (1 - name_length % 2)
+        size = struct.unpack(">I", data[name_end:name_end + 4])[0]
+        end = name_end + 4 + size + size % 2
+        if resource_id not in (_IRB_IPTC, _IRB_IPTC_DIGEST):
+            blocks.append(data[pos:end])
+        pos = end
+    blocks.append(_irb(_IRB_IPTC, iptc))
+    return _PHOTOSHOP_APP13 + b"".join(blocks)
+
+
+def _segment(marker, payload):
+    if len(payload) > 65533:
+        raise EmbedError("metadata does not fit in a JPEG segment")
+    return b"\xff" + bytes((marker,)) + struct.pack(">H", len(payload) + 2) + payload
+
+
+def embed_jpeg(src, dst, xmp, iptc):
+    # Rewrites only the header segments; the entropy-coded image data after
+    # SOS is copied byte for byte
+    with open(src, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            raise EmbedError("not a JPEG file")
+        segments = []
+        while True:
+            byte = f.read(1)
+            while byte == b"\xff":
+                marker = f.read(1)
+                if marker != b"\xff":
+                    break
+            else:
+                raise EmbedError("corrupt JPEG header")
+            if not marker:
+                raise EmbedError("truncated JPEG header")
+            marker = marker[0]
+            if marker == 0xDA:
+                break
+            length = struct.unpack(">H", f.read(2))[0]
+            segments.append((marker, f.read(length - 2)))
+
+        leading = 0
+        while leading < len(segments) and (segments[leading][0] == 0xE0 or (
+                segments[leading][0] == 0xE1 and segments[leading][1].startswith(_EXIF_APP1))):
+            leading += 1
+        photoshop = None
+        rest = []
+        for marker, payload in segments[leading:]:
+            if marker == 0xE1 and payload.startswith((_XMP_APP1, _XMP_EXTENSION_APP1)):
+                continue
+            if marker == 0xED and payload.startswith(_PHOTOSHOP_APP13):
+                photoshop = photoshop or payload
+                continue
+            rest.append((marker, payload))
+
+        with open(dst, "wb") as out:
+            out.write(b"\xff\xd8")
+            for marker, payload in segments[:leading]:
+                out.write(_segment(marker, payload))
+            out.write(_segment(0xE1, _XMP_APP1 + xmp))
+            out.write(_segment(0xED, _photoshop_segment(photoshop, iptc)))
+            for marker, payload in rest:
+                out.write(_segment(marker, payload))
+            out.write(b"\xff\xda")
+            shutil.copyfileobj(f, out, 1024 * 1024)
+
+
+def _png_chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def embed_png(src, dst, xmp):
+    # Adds an uncompressed iTXt XMP chunk before the first IDAT; pixel data
+    # is copied as-is
+    with open(src, "rb") as f, open(dst, "wb") as out:
+        if f.read(8) != _PNG_SIGNATURE:
+            raise EmbedError("not a PNG file")
+        out.write(_PNG_SIGNATURE)
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise EmbedError("PNG has no image data")
+            length, chunk_type = struct.unpack(">I", header[:4])[0], header[4:]
+            if chunk_type == b"IDAT":
+                out.write(_png_chunk(b"iTXt", _PNG_XMP_KEYWORD + b"\0\0\0\0\0" + xmp))
+                out.write(header)
+                shutil.copyfileobj(f, out, 1024 * 1024)
+                return
+            body = f.read(length + 4)
+            if chunk_type == b"iTXt" and body.startswith(_PNG_XMP_KEYWORD + b"\0"):
+                continue
+            out.write(header + body)
+
+
+def embed_mp4(path, xmp):
+    # In place: an old XMP uuid box is renamed to "free" and the new one is
+    # appended as a top-level box, so no sample offset moves and the media
+    # data is never rewritten
+    with open(path, "r+b") as f:
+        size = os.fstat(f.fileno()).st_size
+        pos = 0
+        while pos + 8 <= size:
+            f.seek(pos)
+            header = f.read(8)
+            box_size, box_type = struct.unpack(">I", header[:4])[0], header[4:]
+            header_size = 8
+            if box_size == 1:
+                box_size = struct.unpack(">Q", f.read(8))[0]
+                header_size = 16
+            elif box_size == 0:
+                # Last box runs to the end of the file; give it an explicit
+                # size so a box can follow it
+                box_size = size - pos
+                if box_size > 0xFFFFFFFF:
+                    raise EmbedError("cannot append metadata after an open-ended box")
+                f.seek(pos)
+                f.write(struct.pack(">I", box_size))
+            if box_size < header_size:
+                raise EmbedError("corrupt MP4 box structure")
+            if box_type == b"uuid":
+                f.seek(pos + header_size)
+                if f.read(16) == _XMP_UUID:
+                    f.seek(pos + 4)
+                    f.write(b"free")
+            pos += box_size
+        f.seek(size)
+        f.write(struct.pack(">I", 24 + len(xmp)) + b"uuid" + _XMP_UUID + xmp)
+
+
+def embed_metadata(path, title, keywords, description=None):
+    # Writes title, description and keywords into the file without decoding
+    # or re-encoding it. Images are rewritten through a temporary file and
+    # swapped in with os.replace, so a failure leaves the original intact.
+    # Returns False for formats that can't carry embedded metadata here.
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in EMBED_EXTENSIONS:
+        return False
+    description = description or title
+    xmp = build_xmp(title, description, keywords)
+    if ext in (".mp4", ".mov"):
+        embed_mp4(path, xmp)
+        return True
+
+    directory, name = os.path.split(path)
+    temp_path = os.path.join(directory, f".{name}.embed")
+    try:
+        if ext == ".png":
+            embed_png(path, temp_path, xmp)
+        else:
+            embed_jpeg(path, temp_path, xmp, build_iptc(title, description, keywords))
+        shutil.copystat(path, temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return True
@@ -0,0 +1,1123 @@
+import os
+import re
+import json
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from kyugen.constants import GEMINI_MODELS
+from kyugen.cache import EmbeddingCache, ResultCache, cache_key
+from kyugen.client import GeminiSession
+from kyugen.cluster import LeaseManager, default_node_id, exported_filenames, merge_shards, node_path
+from kyugen.dispatch import AsyncDispatcher
+from kyugen.embed import embed_metadata
+from kyugen.exporters import get_exporters
+from kyugen.journal import JobJournal, file_hash
+from kyugen.keypool import KEYS_FILENAME, KeyPool, QuotaExhausted
+from kyugen.metrics import Metrics
+from kyugen.output import NameIndex, move_file
+from kyugen.parse import match_category, parse_description, split_batch_response
+from kyugen.preprocess import preprocess_file
+from kyugen.quality import REJECTED_FILENAME, REJECTED_FOLDER, REJECTED_HEADER, rejected_row, rejection_reason
+from kyugen.ratelimit import AdaptiveConcurrency
+from kyugen.retry import (ApiError, CircuitBreaker, RetryBudget, backoff_delay, classify_error,
+                          PARSE, QUOTA, TRANSIENT)
+from kyugen.scan import iter_media_files
+from kyugen.sink import CsvSink
+from kyugen.tagger import LocalTagger
+from kyugen.watch import FolderWatcher
+
+
+# Same keys as the GUI's config.json
+DEFAULT_CONFIG = {
+    "api_key": "",
+    "api_keys": [],
+    "model": GEMINI_MODELS[0],
+    "input_path": "",
+    "output_path": "",
+    "max_title_length": 120,
+    "max_keywords": 49,
+    "workers": 1,
+    "preprocess_workers": 0,
+    "preprocess_backend": "thread",
+    "finalize_workers": 1,
+    "exporters": ["adobe"],
+    "embed_metadata": False,
+    "csv_flush_rows": 200,
+    "csv_flush_interval": 2.0,
+    "queue_size": 64,
+    "batch_size": 1,
+    "batch_wait": 0.5,
+    "structured_output": True,
+    "max_retries": 5,
+    "retry_budget": 200,
+    "breaker_threshold": 5,
+    "breaker_cooldown": 30,
+    "dispatch": "thread",
+    "rpm": 15,
+    "tpm": 1000000,
+    "upload_size": 1024,
+    "upload_format": "jpeg",
+    "upload_quality": 85,
+    "video_mode": "sharpest",
+    "video_samples": 5,
+    "quality_filter": False,
+    "reject_min_megapixels": 4.0,
+    "reject_max_aspect": 5.0,
+    "reject_min_sharpness": 30.0,
+    "local_model_dir": "",
+    "local_model_mode": "assist",
+    "local_vocabulary": "",
+    "local_keywords": 20,
+    "local_min_confidence": 0.5,
+    "local_batch_size": 16,
+    "local_threads": 0,
+    "journal_enabled": True,
+    "incremental": False,
+    "watch": False,
+    "watch_settle": 2.0,
+    "watch_poll_interval": 5.0,
+    "cluster": False,
+    "node_id": "",
+    "lease_seconds": 120,
+    "cache_enabled": True,
+    "cache_max_entries": 100000,
+    "cache_max_age_days": 180,
+    "dedupe_enabled": False,
+    "dedupe_distance": 6,
+    "dedupe_variation": False,
+    "dedupe_window": 2000,
+    "metrics_enabled": True,
+    "trace_path": "",
+    "metrics_path": "",
+    "custom_keywords": "",
+}
+
+# 429/quota answers are retried (on another key, or on the same one after it
+# has rested) up to this many times per key instead of failing
+THROTTLE_RETRIES = 3
+
+# Copies across volumes this big print their progress
+MOVE_PROGRESS_BYTES = 100 * 1024 * 1024
+
+# Cluster mode: how often files leased by other nodes are checked again once
+# the scan is done
+LEASE_RECHECK_INTERVAL = 5.0
+
+FileResult = namedtuple("FileResult", ["index", "source", "status", "filename", "error",
+                                       "title", "keywords", "category"], defaults=("", "", ""))
+
+
+def load_config(path="config.json"):
+    config = dict(DEFAULT_CONFIG)
+    try:
+        with open(path, "r") as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        return config
+    # Older configs throttled with a per-worker sleep; translate that to the
+    # equivalent request rate.
+    if "rpm" not in saved and saved.get("delay"):
+        saved["rpm"] = max(1, int(saved.get("workers", 1) * 60 / saved["delay"]))
+    saved.pop("delay", None)
+    config.update(saved)
+    return config
+
+
+def split_keywords(text):
+    return [k.strip() for k in re.split(r"[\s,;]+", text) if k.strip()]
+
+
+def merge_keywords(keyword_text, custom_keywords, max_keywords):
+    keywords = [k for k in split_keywords(keyword_text) if len(k.split()) == 1]
+
+    if custom_keywords:
+        combined_keywords = []
+        seen_keywords = set()
+        for kw in split_keywords(custom_keywords) + keywords:
+            if kw.lower() not in seen_keywords:
+                combined_keywords.append(kw)
+                seen_keywords.add(kw.lower())
+        keywords = combined_keywords
+
+    keywords = sorted(set(keywords), key=lambda x: keyword_text.lower().find(x.lower()))[:max_keywords]
+    return ", ".join(keywords)
+
+
+def usage_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", 0) if usage else 0
+
+
+# Runs preprocess -> describe -> parse -> rename -> CSV for a batch of files.
+# No Qt dependency: the GUI and the batch CLI both drive it and receive
+# per-file results through on_file_done and scan totals through
+# on_scan_progress(found, finished).
+class MetadataEngine:
+    def __init__(self, config, on_file_done=None, stop_flag_func=None, on_scan_progress=None):
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self.output_path = self.config["output_path"]
+        self.error_folder = os.path.join(self.output_path, "Error")
+        self.rejected_folder = os.path.join(self.output_path, REJECTED_FOLDER)
+        # Cluster mode: several machines share the input and output folders.
+        # Each keeps its journal, caches, metrics and CSV shards under its
+        # own node folder; the shards are merged at the end of every run.
+        self.cluster = bool(self.config["cluster"])
+        self.node_id = self.config["node_id"] or default_node_id()
+        self.state_path = node_path(self.output_path, self.node_id) if self.cluster else self.output_path
+        if self.cluster:
+            os.makedirs(self.state_path, exist_ok=True)
+        self.leases = None
+        # When every key ran out of daily quota and the run stopped: the
+        # earliest reset (a timestamp), else None
+        self.quota_reset = None
+        self.on_file_done = on_file_done
+        self.on_scan_progress = on_scan_progress
+        self.stop_flag_func = stop_flag_func or (lambda: False)
+        self.stopped = False
+        self.lock = threading.Lock()
+        self.keys = None
+        self.cache = None
+        self.journal = None
+        self.tagger = None
+        self.embeddings = None
+        # "title" mode: the local model picks category and keywords, the API
+        # only writes the title
+        self.title_only = bool(self.config["local_model_dir"]) and self.config["local_model_mode"] == "title"
+        self.sinks = []
+        self.rejected_sink = None
+        # CSV rows that could not be written in this run
+        self.csv_failures = 0
+        self.names = None
+        # NameIndex per folder for files set aside (Error/, Rejected/)
+        self.aside_names = {}
+        self.process_pool = None
+        self.watcher = None
+        workers = max(1, self.config["workers"])
+        self.concurrency = AdaptiveConcurrency(workers, initial=max(1, workers // 2))
+        self.breaker = CircuitBreaker(self.config["breaker_threshold"], self.config["breaker_cooldown"])
+        self.retry_budget = RetryBudget(self.config["retry_budget"])
+        self.metrics = Metrics()
+
+    def stop(self):
+        self.stopped = True
+
+    def stop_watching(self):
+        # Watch mode: take no more files, but finish the ones in progress
+        if self.watcher:
+            self.watcher.close()
+
+    def close(self):
+        self.close_sinks()
+        self.metrics.close()
+        if self.cache:
+            self.cache.close()
+            self.cache = None
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+        if self.embeddings:
+            self.embeddings.close()
+            self.embeddings = None
+
+    def open_sinks(self):
+        # One CSV writer per enabled marketplace exporter
+        if not self.sinks:
+            self.sinks = [
+                (exporter, CsvSink(os.path.join(self.state_path, exporter.filename), exporter.header,
+                                   self.config["csv_flush_rows"], self.config["csv_flush_interval"],
+                                   exporter.delimiter, self.on_csv_flush))
+                for exporter in get_exporters(self.config["exporters"])
+            ]
+        return self.sinks
+
+    def close_sinks(self):
+        # Flushes and fsyncs whatever rows are still buffered. Only files
+        # whose rows reached every CSV are marked exported in the journal.
+        sinks, self.sinks = self.sinks, []
+        rejected_sink, self.rejected_sink = self.rejected_sink, None
+        unsaved = set()
+        for sink in [sink for _, sink in sinks] + ([rejected_sink] if rejected_sink else []):
+            sink.close()
+            if sink.unsaved:
+                self.csv_failures += len(sink.unsaved)
+                print(f"[CSV ERROR] {len(sink.unsaved)} rows could not be written to {sink.path}")
+                if sink is not rejected_sink:
+                    unsaved |= sink.unsaved_filenames()
+        if unsaved and self.journal:
+            print(f"[JOURNAL] {len(unsaved)} files stay pending and are exported again on the next run")
+        if sinks and self.journal:
+            self.journal.mark_exported(unsaved)
+
+    def on_csv_flush(self, rows, seconds):
+        self.metrics.observe("csv", seconds)
+
+    def open_names(self):
+        # Names already in the output folder or in the CSV files; built once,
+        # then every file is named from memory
+        with self.lock:
+            if self.names is None:
+                known = set()
+                for _, sink in self.open_sinks():
+                    known |= sink.filenames
+                if self.cluster:
+                    known |= exported_filenames(self.output_path)
+                self.names = NameIndex(self.output_path, known, exclusive=self.cluster)
+            return self.names
+
+    def move_aside(self, file_path, folder):
+        # Moves a file that won't be described into `folder` under its own
+        # name, or with _1, _2, ... added if that name is taken. Returns the
+        # name used.
+        with self.lock:
+            names = self.aside_names.get(folder)
+            if names is None:
+                os.makedirs(folder, exist_ok=True)
+                names = self.aside_names[folder] = NameIndex(folder, exclusive=self.cluster)
+        filename = names.reserve_original(os.path.basename(file_path))
+        try:
+            self.move(file_path, os.path.join(folder, filename))
+        except Exception:
+            names.release(filename)
+            raise
+        return filename
+
+    def should_stop(self):
+        return self.stopped or self.stop_flag_func()
+
+    def open_keys(self):
+        # Created on the worker side so importing genai never blocks the GUI
+        if self.keys is None:
+            config = self.config
+
+            def session_factory(api_key, model, own_client):
+                return GeminiSession(api_key, model, config["max_title_length"], config["max_keywords"],
+                                     config["custom_keywords"], config["structured_output"], own_client=own_client,
+                                     title_only=self.title_only)
+
+            state_path = os.path.join(self.state_path, KEYS_FILENAME) if self.output_path else None
+            self.keys = KeyPool.from_config(config, session_factory, state_path)
+        return self.keys
+
+    def open_tagger(self):
+        # Loads the ONNX model (and embeds the labels on first use); raises
+        # LocalModelError if it can't be used
+        if self.tagger is None:
+            self.tagger = LocalTagger(self.config["local_model_dir"], self.config["local_vocabulary"],
+                                      self.config["local_threads"])
+            self.embeddings = EmbeddingCache.for_output(self.state_path)
+        return self.tagger
+
+    def open_session(self):
+        # The first key's session; prompts and cache keys come from it
+        return self.open_keys().primary.session
+
+    def check_connection(self):
+        self.open_keys().check_connection()
+
+    def call_api(self, request, upload_bytes=0):
+        # Runs request(session) through the key pool under its rate limits,
+        # the concurrency limit and the circuit breaker. A 429 rests that key
+        # and the request moves to another (or waits for one), transient
+        # failures are retried with jittered exponential backoff out of the
+        # run's retry budget; anything else raises ApiError with its class.
+        # Returns None if the run was stopped while waiting.
+        keys = self.open_keys()
+        tries = {QUOTA: 0, TRANSIENT: 0}
+        while True:
+            waited = time.perf_counter()
+            if not self.breaker.wait(self.should_stop):
+                return None
+            with self.concurrency:
+                try:
+                    reserved = keys.acquire(self.should_stop, wait_for_reset=self.watcher is not None)
+                except QuotaExhausted as e:
+                    self.out_of_quota(e)
+                    return None
+                self.metrics.observe("throttle", time.perf_counter() - waited)
+                if reserved is None:
+                    return None
+                slot, estimate = reserved
+                self.metrics.api_call(upload_bytes)
+                started = time.perf_counter()
+                try:
+                    with self.metrics.timed("api"):
+                        response = request(slot.session)
+                        # Safety blocks only surface when the text is read
+                        response.text
+                except Exception as e:
+                    error = e
+                else:
+                    error = None
+            if error is None:
+                self.api_succeeded(slot, estimate, response, time.perf_counter() - started)
+                return response
+            delay = self.retry_delay(slot, error, tries)
+            if delay and not self.sleep(delay):
+                return None
+
+    def out_of_quota(self, error):
+        # Every key is out of daily quota: stop the run rather than fail the
+        # remaining files. Files not described yet stay in the input folder
+        # and are reported as skipped. Watch mode waits for the reset
+        # instead (see KeyPool.reserve).
+        with self.lock:
+            first = self.quota_reset is None
+            self.quota_reset = error.resume_at
+        if first:
+            print(f"[KEYS] {error}; stopping. Files not described yet stay in the input folder.")
+        self.stop()
+
+    def api_succeeded(self, slot, estimate, response, seconds):
+        self.breaker.record_success()
+        self.concurrency.on_success()
+        self.keys.succeeded(slot, estimate, usage_tokens(response), seconds)
+        self.metrics.usage(response)
+
+    def retry_delay(self, slot, error, tries):
+        # What a failed request does next: returns the seconds to wait before
+        # sending it again, or raises ApiError when it shouldn't be retried.
+        # `tries` counts the quota and transient retries spent so far.
+        kind = classify_error(error)
+        self.metrics.api_error(kind)
+        self.keys.failed(slot, error, kind)
+
+        if kind == TRANSIENT:
+            self.breaker.record_failure()
+        else:
+            # The API answered, so it is up
+            self.breaker.record_success()
+        if kind == QUOTA and tries[QUOTA] < THROTTLE_RETRIES * len(self.keys):
+            # The pool has rested the key; the next attempt goes to another
+            # one or waits until this one is back
+            tries[QUOTA] += 1
+            self.concurrency.on_throttle()
+            return 0
+        if kind == TRANSIENT and tries[TRANSIENT] < self.config["max_retries"] and self.retry_budget.take():
+            delay = backoff_delay(tries[TRANSIENT])
+            tries[TRANSIENT] += 1
+            print(f"[RETRY] {error}; attempt {tries[TRANSIENT]} in {delay:.1f}s")
+            return delay
+        raise ApiError(kind, error) from error
+
+    def sleep(self, seconds):
+        # Interruptible wait; False if the run was stopped meanwhile
+        deadline = time.monotonic() + seconds
+        while not self.should_stop():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            time.sleep(min(remaining, 0.5))
+        return False
+
+    def request_description(self, upload):
+        response = self.call_api(lambda s: s.generate(upload.data, upload.mime_type), len(upload.data))
+        return response.text.strip() if response else ""
+
+    def vary_title(self, title):
+        # Cheap text-only rewrite so near-duplicate siblings don't all carry
+        # the exact same title; falls back to the original on any problem.
+        try:
+            response = self.call_api(lambda s: s.vary_title(title))
+            varied = response.text.strip().splitlines()[0].strip() if response else ""
+        except Exception as e:
+            print(f"[GEMINI ERROR] {e}")
+            varied = ""
+        return varied or title
+
+    def lookup_cache(self, session, upload):
+        if not self.cache:
+            return None, None
+        key = cache_key(upload.data, session.model_name, session.prompt)
+        return key, self.cache.get(key)
+
+    def store_cache(self, key, result, parsed):
+        if key and self.open_session().complete(parsed):
+            self.cache.put(key, result, *parsed)
+
+    def describe_image(self, upload):
+        session = self.open_session()
+        key, cached = self.lookup_cache(session, upload)
+        if cached:
+            return cached
+        result = self.request_description(upload)
+        with self.metrics.timed("parse"):
+            parsed = parse_description(result)
+        if not session.complete(parsed) and result and session.structured and not self.should_stop():
+            result = self.repair_description(result)
+            with self.metrics.timed("parse"):
+                parsed = parse_description(result)
+        if not session.complete(parsed) and not self.should_stop():
+            raise ApiError(PARSE, "incomplete answer" if result else "empty answer")
+        self.store_cache(key, result, parsed)
+        return parsed
+
+    def repair_description(self, result):
+        # One text-only retry that asks the model to fix its own answer; far
+        # cheaper than re-sending the image or failing the file.
+        try:
+            response = self.call_api(lambda s: s.repair(result))
+            return response.text.strip() if response else result
+        except Exception as e:
+            print(f"[GEMINI ERROR] Repair failed: {e}")
+            return result
+
+    def describe_batch(self, uploads):
+        # Several images in one request. Cache hits are answered locally and
+        # any image whose block comes back missing or incomplete is retried
+        # on its own.
+        session = self.open_session()
+        results = [None] * len(uploads)
+        keys = [None] * len(uploads)
+        misses = []
+        for i, upload in enumerate(uploads):
+            keys[i], results[i] = self.lookup_cache(session, upload)
+            if not results[i]:
+                misses.append(i)
+
+        if len(misses) > 1:
+            try:
+                response = self.call_api(lambda s: s.generate_batch([uploads[i] for i in misses]),
+                                         sum(len(uploads[i].data) for i in misses))
+                with self.metrics.timed("parse"):
+                    blocks = split_batch_response(response.text, len(misses)) if response else [""] * len(misses)
+            except Exception as e:
+                print(f"[GEMINI ERROR] Batch of {len(misses)}: {e}")
+                blocks = [""] * len(misses)
+            retry = []
+            for i, block in zip(misses, blocks):
+                parsed = parse_description(block)
+                if session.complete(parsed):
+                    results[i] = parsed
+                    self.store_cache(keys[i], block, parsed)
+                else:
+                    retry.append(i)
+            if retry and not self.should_stop():
+                print(f"[BATCH] Retrying {len(retry)} of {len(misses)} images one by one")
+            misses = retry
+
+        for i in misses:
+            try:
+                results[i] = self.describe_image(uploads[i]) if not self.should_stop() else ("", "", "")
+            except ApiError as e:
+                results[i] = e
+        return results
+
+    def preprocess(self, file_path):
+        args = (file_path, self.config["upload_size"], self.config["upload_format"], self.config["upload_quality"],
+                self.config["video_mode"], self.config["video_samples"], self.config["quality_filter"],
+                self.tagger is not None)
+        if self.process_pool:
+            return self.process_pool.submit(preprocess_file, *args).result()
+        return preprocess_file(*args)
+
+    def move_to_error(self, file_path, error=""):
+        if self.journal:
+            self.journal.failed(file_path, error)
+        if os.path.exists(file_path):
+            self.move_aside(file_path, self.error_folder)
+
+    def move_to_rejected(self, file_path, reason, stats):
+        # Failed the quality pre-filter: never sent to the API, listed with
+        # the reason in Rejected/rejected.csv (a shard of it in cluster mode)
+        if self.journal:
+            self.journal.failed(file_path, f"rejected: {reason}")
+        with self.lock:
+            if self.rejected_sink is None:
+                os.makedirs(self.rejected_folder, exist_ok=True)
+                csv_folder = self.state_path if self.cluster else self.rejected_folder
+                self.rejected_sink = CsvSink(os.path.join(csv_folder, REJECTED_FILENAME), REJECTED_HEADER,
+                                             self.config["csv_flush_rows"], self.config["csv_flush_interval"])
+                # Names in the CSV stay taken even if their files were moved
+                # away since
+                self.aside_names[self.rejected_folder] = NameIndex(self.rejected_folder, self.rejected_sink.filenames,
+                                                                   exclusive=self.cluster)
+        filename = os.path.basename(file_path)
+        if os.path.exists(file_path):
+            # Listed under the name it was moved to
+            filename = self.move_aside(file_path, self.rejected_folder)
+        self.rejected_sink.write(rejected_row(filename, reason, stats))
+
+    def move(self, source, target):
+        # Cross-volume copies of large files (videos) report progress every
+        # 10%
+        name = os.path.basename(source)
+        reported = [0]
+
+        def on_progress(copied, total):
+            step = copied * 10 // total
+            if total >= MOVE_PROGRESS_BYTES and step > reported[0]:
+                reported[0] = step
+                print(f"[MOVE] {name}: {step * 10}% of {total / 1e6:.0f} MB copied")
+
+        move_file(source, target, on_progress)
+
+    def export(self, filename, title, keywords, category):
+        # Same result, one row per marketplace
+        keyword_list = split_keywords(keywords)
+        for exporter, sink in self.open_sinks():
+            sink.write(exporter.row(filename, title, keyword_list, category))
+
+    def finalize(self, file_path, title, keywords, category):
+        ext = os.path.splitext(file_path)[1]
+
+        names = self.open_names()
+        with self.metrics.timed("move"):
+            # Reserved in memory, so workers move files in parallel without
+            # ever picking the same name
+            new_filename = names.reserve(title, ext, self.config["max_title_length"])
+            try:
+                self.move(file_path, os.path.join(self.output_path, new_filename))
+            except Exception:
+                names.release(new_filename)
+                raise
+
+        if self.journal:
+            self.journal.moved(file_path, new_filename, title, keywords, category)
+        if self.config["embed_metadata"]:
+            self.embed(os.path.join(self.output_path, new_filename), title, keywords)
+        self.export(new_filename, title, keywords, category)
+        return new_filename
+
+    def resume_exports(self):
+        # Files an interrupted run moved to the output folder before their CSV
+        # rows were flushed. The sinks skip rows that did make it to disk.
+        pending = [row for row in self.journal.unexported()
+                   if os.path.exists(os.path.join(self.output_path, row[1]))]
+        if pending:
+            print(f"[JOURNAL] Exporting {len(pending)} files left over from an interrupted run")
+        for _, filename, title, keywords, category in pending:
+            if self.config["embed_metadata"]:
+                self.embed(os.path.join(self.output_path, filename), title, keywords)
+            self.export(filename, title, keywords, category)
+
+    def embed(self, file_path, title, keywords):
+        # Runs on the finalize workers, after the move, so it overlaps with
+        # API calls for later files. A failure keeps the file untouched.
+        try:
+            with self.metrics.timed("embed"):
+                embed_metadata(file_path, title, split_keywords(keywords))
+        except Exception as e:
+            print(f"[EMBED ERROR] {os.path.basename(file_path)}: {e}")
+
+    def inherit_metadata(self, index, file_path, source, title):
+        # Near-duplicate of an already described file: reuse its metadata
+        try:
+            new_filename = self.finalize(file_path, title, source.keywords, source.category)
+            return FileResult(index, file_path, "ok", new_filename, "", title, source.keywords, source.category)
+        except Exception as e:
+            print(f"[ERROR] Failed to process {os.path.basename(file_path)}: {e}")
+            self.move_to_error(file_path, str(e))
+            return FileResult(index, file_path, "error", "", str(e))
+
+    # Pipeline stages. Each handler takes a Job and returns the queue it goes
+    # to next (None once it has been finalized).
+
+    def preprocess_stage(self, job):
+        if self.should_stop():
+            job.status = "skipped"
+            return self.finalize_queue
+        restored = self.journal.restore(job.path) if self.journal else None
+        if restored:
+            # Described by an interrupted run: straight to finalize
+            self.apply_description(job, restored)
+            return self.finalize_queue
+        try:
+            with self.metrics.timed("preprocess"):
+                job.upload = self.preprocess(job.path)
+        except Exception as e:
+            print(f"[PREPROCESS ERROR] {os.path.basename(job.path)}: {e}")
+            job.fail(str(e))
+            return self.finalize_queue
+        stats = job.upload.image_stats
+        if stats:
+            self.metrics.observe("quality", stats["seconds"])
+            reason = rejection_reason(stats, self.config["reject_min_megapixels"], self.config["reject_max_aspect"],
+                                      self.config["reject_min_sharpness"])
+            if reason:
+                job.reject(reason, stats)
+                return self.finalize_queue
+        if self.config["incremental"] or self.tagger:
+            job.content_hash = file_hash(job.path)
+        if self.journal:
+            self.journal.preprocessed(job.path, job.content_hash)
+        return self.local_queue if self.tagger else self.api_queue
+
+    def describe_stage(self, job):
+        if self.should_stop():
+            job.status = "skipped"
+            return self.finalize_queue
+        try:
+            parsed = self.describe_image(job.upload)
+        except ApiError as e:
+            parsed = e
+        self.apply_description(job, parsed)
+        return self.finalize_queue
+
+    def apply_local(self, job):
+        # The local model's category replaces the API's when it is confident
+        # enough (and always in title mode); its keywords follow the API's,
+        # and merge_keywords() later drops duplicates and the excess
+        category, confidence, keywords = job.local
+        if not job.category_text or confidence >= self.config["local_min_confidence"]:
+            job.category_text = category
+        job.keyword_text = ", ".join(k for k in (job.keyword_text, ", ".join(keywords)) if k)
+
+    def tag_jobs(self, jobs):
+        # Embeds the jobs' images in one batch, or takes the embeddings from
+        # the cache by file hash, and sets job.local
+        keys = [EmbeddingCache.key(job.content_hash, self.tagger.model_id) for job in jobs]
+        vectors = [self.embeddings.get(key) for key in keys]
+        misses = [i for i, vector in enumerate(vectors) if vector is None]
+        if misses:
+            embedded = self.tagger.embed([jobs[i].upload.pixels for i in misses])
+            self.embeddings.put_many([(keys[i], vector) for i, vector in zip(misses, embedded)])
+            for i, vector in zip(misses, embedded):
+                vectors[i] = vector
+        for job, tags in zip(jobs, self.tagger.tag(vectors, self.config["local_keywords"])):
+            job.local = tags
+
+    def apply_description(self, job, parsed, vary_titles=True):
+        # `parsed` is (title, keyword_text, category_text), or the ApiError
+        # that describing the file ended with
+        job.upload = None
+        if isinstance(parsed, Exception):
+            if self.should_stop():
+                job.status = "skipped"
+                return
+            print(f"[ERROR] {os.path.basename(job.path)}: {parsed}; moving to Error folder.")
+            job.fail(str(parsed))
+            return
+        job.title, job.keyword_text, job.category_text = parsed
+        if job.local:
+            self.apply_local(job)
+        if not job.title or not job.keyword_text or not job.category_text:
+            if self.should_stop():
+                # Interrupted while waiting for a rate-limit slot
+                job.status = "skipped"
+                return
+            print(f"[ERROR] Empty metadata for {os.path.basename(job.path)}, moving to Error folder.")
+            job.fail("empty metadata")
+            return
+        if self.journal:
+            self.journal.described(job.path, job.title, job.keyword_text, job.category_text)
+        if job.siblings and self.config["dedupe_variation"] and vary_titles:
+            job.sibling_titles = [self.vary_title(job.title) for _ in job.siblings]
+
+    def finalize_stage(self, job):
+        results = []
+        try:
+            if job.status == "skipped":
+                results.append(FileResult(job.index, job.path, "skipped", "", ""))
+                results.extend(FileResult(i, p, "skipped", "", "") for i, p in job.siblings)
+                return None
+
+            if job.status in ("error", "rejected"):
+                if job.status == "rejected":
+                    self.move_to_rejected(job.path, job.error, job.image_stats)
+                else:
+                    self.move_to_error(job.path, job.error)
+                results.append(FileResult(job.index, job.path, job.status, "", job.error))
+                if job.siblings:
+                    # The representative failed; give each sibling its own run
+                    self._resubmit([Job(i, p) for i, p in job.siblings])
+                return None
+
+            keywords = merge_keywords(job.keyword_text, self.config["custom_keywords"], self.config["max_keywords"])
+            category = match_category(job.category_text)
+            new_filename = self.finalize(job.path, job.title, keywords, category)
+            first = FileResult(job.index, job.path, "ok", new_filename, "", job.title, keywords, category)
+            results.append(first)
+            titles = job.sibling_titles or [job.title] * len(job.siblings)
+            for (index, path), title in zip(job.siblings, titles):
+                results.append(self.inherit_metadata(index, path, first, title))
+        except Exception as e:
+            print(f"[ERROR] Failed to process {os.path.basename(job.path)}: {e}")
+            self.move_to_error(job.path, str(e))
+            results.append(FileResult(job.index, job.path, "error", "", str(e)))
+        finally:
+            try:
+                for result in results:
+                    self._report(result, job if result.source == job.path else None)
+            finally:
+                self._job_done()
+        return None
+
+    def _report(self, result, job=None):
+        if self.leases:
+            self.leases.release(result.source)
+        with self.pending_changed:
+            self.counts[result.status] = self.counts.get(result.status, 0) + 1
+        self.metrics.file_done(result, job)
+        if self.on_file_done:
+            self.on_file_done(result)
+
+    def _submit(self, job):
+        if self.journal:
+            self.journal.queued(job.path)
+            for _, path in job.siblings:
+                self.journal.queued(path)
+        with self.pending_changed:
+            self.pending += 1
+        self.preprocess_queue.put(job)
+
+    def _resubmit(self, jobs):
+        # Counted as pending right away so the run can't look finished, but
+        # queued from a helper thread: a finalize worker blocking on a full
+        # preprocess queue could otherwise deadlock the pipeline.
+        with self.pending_changed:
+            self.pending += len(jobs)
+
+        def put_all():
+            for job in jobs:
+                self.preprocess_queue.put(job)
+
+        threading.Thread(target=put_all, daemon=True).start()
+
+    def _job_done(self):
+        with self.pending_changed:
+            self.pending -= 1
+            self.pending_changed.notify_all()
+
+    def _stage_worker(self, inbox, handler):
+        while True:
+            job = inbox.get()
+            if job is _STOP:
+                return
+            try:
+                with self.metrics.bind(job):
+                    target = handler(job)
+            except Exception as e:
+                print(f"[ERROR] Failed to process {os.path.basename(job.path)}: {e}")
+                job.fail(str(e))
+                target = self.finalize_queue if inbox is not self.finalize_queue else None
+            if target is not None:
+                target.put(job)
+
+    def _batch_worker(self, inbox):
+        # API stage in batch mode: gathers up to batch_size ready jobs
+        # (waiting at most batch_wait seconds for stragglers) and describes
+        # them in a single request.
+        batch_size = self.config["batch_size"]
+        running = True
+        while running:
+            job = inbox.get()
+            if job is _STOP:
+                return
+            batch = [job]
+            deadline = time.monotonic() + self.config["batch_wait"]
+            while len(batch) < batch_size:
+                try:
+                    job = inbox.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    running = False
+                    break
+                batch.append(job)
+
+            ready = [job for job in batch if not job.status]
+            if self.should_stop():
+                for job in ready:
+                    job.status = "skipped"
+            elif ready:
+                try:
+                    described = self.describe_batch([job.upload for job in ready])
+                except Exception as e:
+                    print(f"[ERROR] Batch failed: {e}")
+                    described = [e] * len(ready)
+                for job, parsed in zip(ready, described):
+                    try:
+                        self.apply_description(job, parsed)
+                    except Exception as e:
+                        job.fail(str(e))
+            for job in batch:
+                self.finalize_queue.put(job)
+
+    def _local_worker(self, inbox):
+        # Local model stage: gathers up to local_batch_size preprocessed jobs
+        # (waiting at most batch_wait seconds for stragglers) for one
+        # batched inference, then passes them on to the API stage.
+        batch_size = max(1, self.config["local_batch_size"])
+        running = True
+        while running:
+            job = inbox.get()
+            if job is _STOP:
+                return
+            batch = [job]
+            deadline = time.monotonic() + self.config["batch_wait"]
+            while len(batch) < batch_size:
+                try:
+                    job = inbox.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    running = False
+                    break
+                batch.append(job)
+
+            ready = [job for job in batch if not job.status]
+            if ready and not self.should_stop():
+                try:
+                    with self.metrics.timed("local"):
+                        self.tag_jobs(ready)
+                except Exception as e:
+                    print(f"[LOCAL ERROR] Batch of {len(ready)}: {e}")
+                    if self.title_only:
+                        # The API won't be asked for keywords or a category
+                        for job in ready:
+                            job.fail(f"local model: {e}")
+            for job in batch:
+                if job.upload is not None:
+                    job.upload = job.upload._replace(pixels=None)
+                (self.finalize_queue if job.status else self.api_queue).put(job)
+
+    def skip_done(self, media_files):
+        # Incremental mode: only files that are new or changed since they
+        # were completed. The others are left in the input folder, reported
+        # and counted as "unchanged".
+        for path in media_files:
+            filename = self.journal.completed(path)
+            if filename is None:
+                yield path
+                continue
+            print(f"[JOURNAL] {os.path.basename(path)} is unchanged since it was done as {filename}; "
+                  f"leaving it in the input folder")
+            with self.pending_changed:
+                self.counts["unchanged"] += 1
+
+    def claim_files(self, media_files):
+        # Cluster mode: only the files this node wins a lease on. Files other
+        # nodes hold are checked again until they are gone from the input
+        # folder, so the files of a node that dies are picked up once its
+        # leases expire.
+        busy = []
+        for path in media_files:
+            if self.leases.claim(path):
+                if os.path.exists(path):
+                    yield path
+                else:
+                    # Finished by another node since it was listed
+                    self.leases.release(path)
+            else:
+                busy.append(path)
+        while busy and self.sleep(LEASE_RECHECK_INTERVAL):
+            waiting = []
+            for path in busy:
+                if not os.path.exists(path):
+                    continue
+                if self.leases.claim(path):
+                    yield path
+                else:
+                    waiting.append(path)
+            busy = waiting
+
+    def iter_jobs(self, media_files):
+        indexed = ((i + 1, path) for i, path in enumerate(media_files))
+        if self.config["dedupe_enabled"] and self.watcher:
+            # A window of files to group never fills up while watching
+            print("[WATCH] Near-duplicate grouping is off in watch mode")
+        if not self.config["dedupe_enabled"] or self.watcher:
+            for index, path in indexed:
+                yield Job(index, path)
+            return
+
+        # Near-duplicates are grouped within a sliding window of the scan so
+        # the index stays bounded; bursts are adjacent after the per-folder
+        # sort, so a window comfortably covers them.
+        from kyugen.dedupe import PerceptualIndex
+
+        window = []
+        for item in indexed:
+            window.append(item)
+            if len(window) >= self.config["dedupe_window"]:
+                yield from self._group_window(window, PerceptualIndex)
+                window = []
+        if window:
+            yield from self._group_window(window, PerceptualIndex)
+
+    def _group_window(self, window, index_class):
+        paths = [path for _, path in window]
+        clusters = index_class(self.config["dedupe_distance"]).build(paths).clusters()
+        position = {path: item for path, item in zip(paths, window)}
+        grouped = {}
+        for cluster in clusters:
+            members = [position[path] for path in cluster]
+            grouped[members[0][1]] = members
+            for _, path in members[1:]:
+                grouped[path] = None
+        if clusters:
+            print(f"[DEDUPE] {sum(len(c) for c in clusters)} files in {len(clusters)} near-duplicate groups")
+        for index, path in window:
+            members = grouped.get(path, [(index, path)])
+            if members is not None:
+                yield Job(index, path, members[1:])
+
+    def run(self, media_files=None, check_connection=True):
+        # Streams files through bounded queues: scan -> preprocess (CPU
+        # workers) -> describe (API workers, or one asyncio dispatcher) ->
+        # finalize (move + CSV). Memory stays flat however many files there
+        # are. Returns per-status counts.
+        if check_connection:
+            self.check_connection()
+        if self.config["cache_enabled"] and self.cache is None:
+            self.cache = ResultCache.for_output(self.state_path, self.config)
+        if self.config["journal_enabled"] and self.journal is None:
+            self.journal = JobJournal.for_output(self.state_path)
+        self.metrics.close()
+        self.metrics = Metrics.for_output(self.state_path, self.config)
+        self.metrics.keys = self.open_keys().snapshot
+        self.open_sinks()
+        if self.journal:
+            self.resume_exports()
+        if self.config["local_model_dir"]:
+            self.open_tagger()
+        if media_files is None and self.config["watch"]:
+            # Runs until stop() or stop_watching()
+            self.watcher = FolderWatcher(self.config["input_path"], self.config["watch_settle"],
+                                         self.config["watch_poll_interval"], ignore=[self.output_path])
+            media_files = self.watcher.iter_files(self.should_stop)
+        elif media_files is None:
+            media_files = iter_media_files(self.config["input_path"])
+        if self.journal and self.config["incremental"]:
+            media_files = self.skip_done(media_files)
+        if self.cluster:
+            self.leases = LeaseManager(self.config["input_path"], self.output_path, self.node_id,
+                                       self.config["lease_seconds"])
+            media_files = self.claim_files(media_files)
+
+        preprocess_workers = self.config["preprocess_workers"] or os.cpu_count() or 2
+        if self.config["preprocess_backend"] == "process":
+            # Decoding, EPS rendering and resizing hold the GIL; with the
+            # process backend each preprocess thread just waits on a worker
+            # process, so all cores are used.
+            from concurrent.futures import ProcessPoolExecutor
+
+            self.process_pool = ProcessPoolExecutor(max_workers=preprocess_workers)
+
+        queue_size = max(1, self.config["queue_size"])
+        self.preprocess_queue = queue.Queue(queue_size)
+        self.local_queue = queue.Queue(queue_size)
+        self.api_queue = queue.Queue(queue_size)
+        self.finalize_queue = queue.Queue(queue_size)
+        self.pending = 0
+        self.pending_changed = threading.Condition()
+        self.counts = {"ok": 0, "error": 0, "rejected": 0, "skipped": 0, "unchanged": 0}
+        self.csv_failures = 0
+
+        dispatch = self.config["dispatch"]
+        if dispatch == "async" and self.config["batch_size"] > 1:
+            print("[DISPATCH] Batched requests use worker threads; ignoring async dispatch")
+            dispatch = "thread"
+        stages = [
+            (self.preprocess_queue, self.preprocess_stage, preprocess_workers),
+            (self.local_queue, self._local_worker, 1 if self.tagger else 0),
+            (self.api_queue, self.describe_stage, 1 if dispatch == "async" else self.config["workers"]),
+            (self.finalize_queue, self.finalize_stage, self.config["finalize_workers"]),
+        ]
+        threads = []
+        for inbox, handler, count in stages:
+            if handler == self._local_worker and not count:
+                continue
+            for _ in range(max(1, count)):
+                if handler == self._local_worker:
+                    thread = threading.Thread(target=self._local_worker, args=(inbox,), daemon=True)
+                elif handler == self.describe_stage and dispatch == "async":
+                    # One event loop keeps up to `workers` requests in flight
+                    dispatcher = AsyncDispatcher(self, self.config["workers"])
+                    thread = threading.Thread(target=dispatcher.run, args=(inbox, _STOP), daemon=True)
+                elif handler == self.describe_stage and self.config["batch_size"] > 1:
+                    thread = threading.Thread(target=self._batch_worker, args=(inbox,), daemon=True)
+                else:
+                    thread = threading.Thread(target=self._stage_worker, args=(inbox, handler), daemon=True)
+                thread.start()
+                threads.append((inbox, thread))
+
+        found = 0
+        reported = time.monotonic()
+        try:
+            for job in self.iter_jobs(media_files):
+                if self.should_stop():
+                    break
+                self._submit(job)
+                found += 1 + len(job.siblings)
+                # Every 100 files while scanning, and for files trickling in
+                # from a watched folder
+                if self.on_scan_progress and (found % 100 == 0 or time.monotonic() - reported >= 1):
+                    self.on_scan_progress(found, False)
+                    reported = time.monotonic()
+            if self.on_scan_progress:
+                self.on_scan_progress(found, True)
+
+            with self.pending_changed:
+                while self.pending > 0:
+                    self.pending_changed.wait()
+        except BaseException:
+            # Let queued files drain as "skipped"; the stage threads are
+            # daemons and won't keep the process alive.
+            self.stop()
+            if self.process_pool:
+                self.process_pool.shutdown(wait=False, cancel_futures=True)
+                self.process_pool = None
+            if self.leases:
+                self.leases.close(release=False)
+                self.leases = None
+            raise
+
+        for inbox, _ in threads:
+            inbox.put(_STOP)
+        for _, thread in threads:
+            thread.join()
+        if self.process_pool:
+            self.process_pool.shutdown()
+            self.process_pool = None
+        self.close_sinks()
+        if self.leases:
+            self.leases.close()
+            self.leases = None
+            merged = merge_shards(self.output_path)
+            if merged:
+                print(f"[CLUSTER] Node {self.node_id}: merged the shards into "
+                      f"{', '.join(f'{os.path.basename(path)} ({rows} rows)' for path, rows in merged.items())}")
+        self.keys.save_state()
+        self.metrics.close()
+        return dict(self.counts)
+
+
+_STOP = object()
+
+
+# One unit of work in the pipeline: a file, plus any near-duplicate siblings
+# that inherit its metadata once it has been described.
+class Job:
+    __slots__ = ("index", "path", "siblings", "status", "error", "upload", "image_stats", "content_hash", "local",
+                 "title", "keyword_text", "category_text", "sibling_titles",
+                 "started", "timings", "tokens")
+
+    def __init__(self, index, path, siblings=()):
+        self.index = index
+        self.path = path
+        self.siblings = list(siblings)
+        self.status = ""
+        self.error = ""
+        self.upload = None
+        self.image_stats = None
+        self.content_hash = None
+        # (category, confidence, keywords) from the local model
+        self.local = None
+        self.title = self.keyword_text = self.category_text = ""
+        self.sibling_titles = None
+        self.started = time.monotonic()
+        self.timings = {}
+        self.tokens = 0
+
+    def fail(self, error):
+        self.status = "error"
+        self.error = error
+
+    def reject(self, reason, stats):
+        self.status = "rejected"
+        self.error = reason
+        self.image_stats = stats
+        self.upload = None
@@ -0,0 +1,142 @@
+import re
+from abc import ABC, abstractmethod
+
+from kyugen.constants import CATEGORY_MAP
+
+CSV_HEADER = ["Filename", "Title", "Keywords", "Category", "Releases"]
+CSV_FILENAME = "metadata_export.csv"
+
+VECTOR_EXTENSIONS = (".eps", ".ai", ".svg")
+
+
+def clean_title(title):
+    return re.sub(r'[^\w\s]', '', title)
+
+
+def trim_title(title, limit):
+    # Cut at a word boundary so a long title doesn't end mid-word
+    title = " ".join(title.split())
+    if not limit or len(title) <= limit:
+        return title
+    cut = title[:limit + 1].rsplit(" ", 1)[0]
+    return (cut if len(cut) <= limit else title[:limit]).rstrip(" ,;:-")
+
+
+# One marketplace's upload CSV. Every exporter receives the same result for
+# each finalized file (new filename, title, keyword list and the canonical
+# category name from CATEGORY_MAP) and formats its own row: column layout,
+# category mapping, keyword limit and title rules.
+class Exporter(ABC):
+    name = ""
+    label = ""
+    filename = ""
+    header = []
+    delimiter = ","
+    max_keywords = 0
+    max_title = 0
+
+    def keywords(self, keywords):
+        return ", ".join(keywords[:self.max_keywords] if self.max_keywords else keywords)
+
+    def title(self, title):
+        return trim_title(title, self.max_title)
+
+    @abstractmethod
+    def row(self, filename, title, keywords, category):
+        pass
+
+
+class AdobeStockExporter(Exporter):
+    name = "adobe"
+    label = "Adobe Stock"
+    filename = CSV_FILENAME
+    header = CSV_HEADER
+
+    def row(self, filename, title, keywords, category):
+        return [filename, clean_title(title), self.keywords(keywords), CATEGORY_MAP.get(category, ""), ""]
+
+
+class ShutterstockExporter(Exporter):
+    name = "shutterstock"
+    label = "Shutterstock"
+    filename = "shutterstock_export.csv"
+    header = ["Filename", "Description", "Keywords", "Categories", "Editorial", "Mature content", "illustration"]
+    max_keywords = 50
+    max_title = 200
+    categories = {
+        "Animals": "Animals/Wildlife",
+        "Architecture": "Buildings/Landmarks",
+        "Backgrounds/Textures": "Backgrounds/Textures",
+        "Beauty/Fashion": "Beauty/Fashion",
+        "Business": "Business/Finance",
+        "Food & Drink": "Food and drink",
+        "Healthcare/Medical": "Healthcare/Medical",
+        "Holidays": "Holidays",
+        "Industrial": "Industrial",
+        "Interiors": "Interiors",
+        "Miscellaneous": "Miscellaneous",
+        "Nature": "Nature",
+        "Objects": "Objects",
+        "Parks/Outdoor": "Parks/Outdoor",
+        "People": "People",
+        "Religion": "Religion",
+        "Science": "Science",
+        "Signs/Symbols": "Signs/Symbols",
+        "Sports/Recreation": "Sports/Recreation",
+        "Technology": "Technology",
+        "The Arts": "Arts",
+        "Transportation": "Transportation",
+        "Travel": "Parks/Outdoor",
+        "Vectors": "Abstract",
+    }
+
+    def row(self, filename, title, keywords, category):
+        illustration = "yes" if filename.lower().endswith(VECTOR_EXTENSIONS) else "no"
+        return [filename, self.title(title), self.keywords(keywords),
+                self.categories.get(category, ""), "no", "no", illustration]
+
+
+class FreepikExporter(Exporter):
+    name = "freepik"
+    label = "Freepik"
+    filename = "freepik_export.csv"
+    header = ["Filename", "Title", "Keywords"]
+    delimiter = ";"
+    max_keywords = 50
+    max_title = 100
+
+    def row(self, filename, title, keywords, category):
+        return [filename, self.title(title), self.keywords(keywords)]
+
+
+class GettyExporter(Exporter):
+    # iStock / Getty ESP batch upload sheet; no category column
+    name = "getty"
+    label = "Getty/iStock"
+    filename = "getty_export.csv"
+    header = ["file name", "created date", "description", "country", "brief code", "title", "keywords"]
+    max_keywords = 50
+    max_title = 100
+
+    def row(self, filename, title, keywords, category):
+        return [filename, "", trim_title(title, 200), "", "", self.title(title), self.keywords(keywords)]
+
+
+EXPORTERS = {exporter.name: exporter for exporter in
+             (AdobeStockExporter, ShutterstockExporter, FreepikExporter, GettyExporter)}
+
+
+def get_exporters(names):
+    # Accepts a list or a comma-separated string; unknown names raise ValueError
+    if isinstance(names, str):
+        names = names.split(",")
+    exporters = []
+    for name in names:
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in EXPORTERS:
+            raise ValueError(f"Unknown exporter '{name}' (choose from {', '.join(EXPORTERS)})")
+        if name not in [e.name for e in exporters]:
+            exporters.append(EXPORTERS[name]())
+    return exporters
@@ -0,0 +1,159 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+JOURNAL_FILENAME = ".kyugen_journal.sqlite"
+
+# Per-file states, in pipeline order. "moved" means the file sits in the
+# output folder but its CSV rows may not have been flushed yet.
+QUEUED = "queued"
+PREPROCESSED = "preprocessed"
+DESCRIBED = "described"
+MOVED = "moved"
+EXPORTED = "exported"
+ERROR = "error"
+
+DONE_STATES = (MOVED, EXPORTED)
+
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_identity(file_path):
+    st = os.stat(file_path)
+    return st.st_size, st.st_mtime_ns
+
+
+# Where every input file got to, keyed by its input path. Lives in the output
+# folder next to the cache. A restarted run finishes files that were already
+# described without calling the API again and re-exports rows for files that
+# were moved but never flushed to the CSVs. In incremental mode, files that
+# were already completed and haven't changed since (same size and mtime, or
+# same content hash when only the mtime moved) are left out of the run.
+class JobJournal:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                hash TEXT,
+                state TEXT NOT NULL,
+                title TEXT NOT NULL DEFAULT '',
+                keywords TEXT NOT NULL DEFAULT '',
+                category TEXT NOT NULL DEFAULT '',
+                filename TEXT NOT NULL DEFAULT '',
+                error TEXT NOT NULL DEFAULT '',
+                updated REAL NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_state ON files (state)")
+
+    @classmethod
+    def for_output(cls, output_path):
+        return cls(os.path.join(output_path, JOURNAL_FILENAME))
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def entry(self, file_path):
+        rows = self._execute(
+            "SELECT size, mtime, hash, state, title, keywords, category, filename FROM files WHERE path = ?",
+            (file_path,))
+        return rows[0] if rows else None
+
+    def unchanged(self, file_path, entry):
+        try:
+            size, mtime = file_identity(file_path)
+        except OSError:
+            return False
+        if size != entry[0]:
+            return False
+        if mtime == entry[1]:
+            return True
+        # Touched or copied with a new mtime: same content is still unchanged
+        return bool(entry[2]) and file_hash(file_path) == entry[2]
+
+    def completed(self, file_path):
+        # The output filename of a file that was completed in an earlier run
+        # and hasn't changed since, else None
+        entry = self.entry(file_path)
+        if entry is None or entry[3] not in DONE_STATES or not self.unchanged(file_path, entry):
+            return None
+        return entry[7]
+
+    def restore(self, file_path):
+        # (title, keyword_text, category_text) of a file that was described
+        # in an earlier run and hasn't changed since, else None
+        entry = self.entry(file_path)
+        if entry is None or entry[3] != DESCRIBED or not self.unchanged(file_path, entry):
+            return None
+        return entry[4], entry[5], entry[6]
+
+    def queued(self, file_path):
+        try:
+            size, mtime = file_identity(file_path)
+        except OSError:
+            return
+        entry = self.entry(file_path)
+        if entry is not None and entry[3] == DESCRIBED and (size, mtime) == entry[:2]:
+            # Keep the description for restore()
+            return
+        self._execute("""
+            INSERT INTO files (path, size, mtime, state, updated) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, hash = NULL,
+                state = excluded.state, title = '', keywords = '', category = '', filename = '', error = '',
+                updated = excluded.updated""", (file_path, size, mtime, QUEUED, time.time()))
+
+    def preprocessed(self, file_path, content_hash=None):
+        self._execute("UPDATE files SET state = ?, hash = COALESCE(?, hash), updated = ? WHERE path = ?",
+                      (PREPROCESSED, content_hash, time.time(), file_path))
+
+    def described(self, file_path, title, keyword_text, category_text):
+        self._execute("UPDATE files SET state = ?, title = ?, keywords = ?, category = ?, updated = ? WHERE path = ?",
+                      (DESCRIBED, title, keyword_text, category_text, time.time(), file_path))
+
+    def moved(self, file_path, filename, title, keywords, category):
+        self._execute("""
+            UPDATE files SET state = ?, filename = ?, title = ?, keywords = ?, category = ?, updated = ?
+            WHERE path = ?""", (MOVED, filename, title, keywords, category, time.time(), file_path))
+
+    def failed(self, file_path, error):
+        self._execute("UPDATE files SET state = ?, error = ?, updated = ? WHERE path = ?",
+                      (ERROR, error, time.time(), file_path))
+
+    def unexported(self):
+        # (path, filename, title, keywords, category) for every moved file
+        # whose CSV rows may not have reached the disk
+        return self._execute("SELECT path, filename, title, keywords, category FROM files WHERE state = ?", (MOVED,))
+
+    def mark_exported(self, unsaved=()):
+        # Called once the CSV writers have been flushed and closed. Files
+        # whose rows couldn't be written (by output filename) stay "moved",
+        # so the next run exports them again.
+        if not unsaved:
+            self._execute("UPDATE files SET state = ?, updated = ? WHERE state = ?", (EXPORTED, time.time(), MOVED))
+            return
+        now = time.time()
+        with self.lock:
+            rows = self.conn.execute("SELECT path, filename FROM files WHERE state = ?", (MOVED,)).fetchall()
+            self.conn.execute("BEGIN")
+            self.conn.executemany("UPDATE files SET state = ?, updated = ? WHERE path = ?",
+                                  [(EXPORTED, now, path) for path, filename in rows if filename not in unsaved])
+            self.conn.execute("COMMIT")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import date, datetime, timedelta
+
+from kyugen.ratelimit import RateLimiter
+from kyugen.retry import ApiError, QUOTA
+
+KEYS_FILENAME = ".kyugen_keys.json"
+
+# Seconds a key sits out after a per-minute 429
+THROTTLE_BACKOFF = 10
+
+_DAILY_MESSAGES = ("per day", "perday", "per_day", "daily")
+
+
+class QuotaExhausted(ApiError):
+    # Every key is out of daily quota; resume_at is the earliest reset
+    def __init__(self, resume_at):
+        super().__init__(QUOTA, f"every API key is out of daily quota until "
+                                f"{datetime.fromtimestamp(resume_at):%Y-%m-%d %H:%M}")
+        self.resume_at = resume_at
+
+
+def key_label(api_key):
+    # Stable name for logs, metrics and the state file that doesn't reveal
+    # the key
+    return "key-" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+
+def is_daily_quota_error(error):
+    message = str(error).lower()
+    return any(m in message for m in _DAILY_MESSAGES)
+
+
+def next_quota_reset():
+    # Gemini daily quotas reset at midnight Pacific time; a day from now if
+    # the time zone database isn't available
+    try:
+        from zoneinfo import ZoneInfo
+
+        now = datetime.now(ZoneInfo("America/Los_Angeles"))
+    except Exception:
+        return time.time() + 24 * 3600
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight.timestamp()
+
+
+def key_entries(config):
+    # The pool's keys: `api_key` with the run's model and limits, then every
+    # `api_keys` entry, either "KEY" / "KEY@model" or an object with "key"
+    # and optionally "model", "rpm" and "tpm". Duplicates are dropped.
+    items = [config["api_key"]] + list(config.get("api_keys") or [])
+    entries = []
+    seen = set()
+    for item in items:
+        if isinstance(item, str):
+            key, _, model = item.strip().partition("@")
+            item = {"key": key.strip(), "model": model.strip()}
+        key = item.get("key", "")
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        entries.append({"key": key, "model": item.get("model") or config["model"],
+                        "rpm": item.get("rpm", config["rpm"]), "tpm": item.get("tpm", config["tpm"])})
+    return entries
+
+
+class KeySlot:
+    # One API key (and model) with its own quota, rate limiter, observed
+    # latency and usage
+    def __init__(self, label, session, rpm, tpm):
+        self.label = label
+        self.session = session
+        self.limiter = RateLimiter(rpm, tpm)
+        self.latency = None
+        self.in_flight = 0
+        self.resume_at = 0.0
+        self.exhausted = False
+        self.requests = 0
+        self.tokens = 0
+        self.errors = 0
+        self.quota_errors = 0
+
+    def cost(self):
+        # Expected seconds until a request sent through this key comes back.
+        # Keys that haven't answered yet count as fast, so each gets tried
+        # and measured.
+        latency = self.latency or 0.0
+        return self.limiter.delay() + latency * (self.in_flight + 1)
+
+
+# Spreads requests over several API keys (typically one per project, each
+# with its own quota) and models. Each request goes to the key expected to
+# answer soonest given its remaining rate-limit headroom, requests in flight
+# and observed latency. A key answering 429 sits out for a while; one that
+# ran out of daily quota is out until the quota resets, which is remembered
+# in the output folder so the next run doesn't try it again. With a single
+# key this is just that key's rate limiter.
+class KeyPool:
+    def __init__(self, slots, state_path=None):
+        if not slots:
+            raise ValueError("no API keys")
+        self.slots = slots
+        self.state_path = state_path
+        self.lock = threading.Lock()
+        self.day = date.today().isoformat()
+        self.usage = {}
+        self._load_state()
+
+    @classmethod
+    def from_config(cls, config, session_factory, state_path=None):
+        # session_factory(key, model, own_client) -> GeminiSession
+        entries = key_entries(config)
+        own_client = len(entries) > 1
+        slots = [KeySlot(key_label(e["key"]), session_factory(e["key"], e["model"], own_client), e["rpm"], e["tpm"])
+                 for e in entries]
+        return cls(slots, state_path)
+
+    @property
+    def primary(self):
+        return self.slots[0]
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _load_state(self):
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for slot in self.slots:
+            saved = state.get(slot.label, {})
+            if saved.get("exhausted_until", 0) > now:
+                slot.exhausted = True
+                slot.resume_at = saved["exhausted_until"]
+                print(f"[KEYS] {slot.label} is out of daily quota until "
+                      f"{datetime.fromtimestamp(slot.resume_at):%Y-%m-%d %H:%M}")
+            if saved.get("day") == self.day:
+                self.usage[slot.label] = {"requests": saved.get("requests", 0), "tokens": saved.get("tokens", 0)}
+
+    def save_state(self):
+        # Per-key usage for today and daily-quota exhaustion, merged into
+        # whatever other runs recorded for keys not in this pool
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        with self.lock:
+            for slot in self.slots:
+                usage = self.usage.get(slot.label, {})
+                state[slot.label] = {
+                    "day": self.day,
+                    "requests": usage.get("requests", 0) + slot.requests,
+                    "tokens": usage.get("tokens", 0) + slot.tokens,
+                    "exhausted_until": slot.resume_at if slot.exhausted else 0,
+                }
+        temp_path = self.state_path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, indent=2)
+            os.replace(temp_path, self.state_path)
+        except OSError as e:
+            print(f"[KEYS] Could not write {self.state_path}: {e}")
+
+    def check_connection(self):
+        # Keys that fail the check are dropped with a warning; only an error
+        # if none is left
+        working = []
+        error = None
+        for slot in self.slots:
+            try:
+                slot.session.check_connection()
+            except Exception as e:
+                print(f"[KEYS] {slot.label} ({slot.session.model_name}) is not usable: {e}")
+                error = e
+            else:
+                working.append(slot)
+        if not working:
+            raise error
+        with self.lock:
+            self.slots = working
+
+    def reserve(self, wait_for_reset=False):
+        # Picks a key and charges its rate limiter. Returns (slot, estimate,
+        # wait): the caller waits `wait` seconds, then sends through
+        # slot.session and reports back with succeeded()/failed(), or gives
+        # the slot back with release(). slot is None while every key is
+        # sitting out; `wait` is then how long until one is back. Raises
+        # QuotaExhausted once every key is out of daily quota, unless
+        # wait_for_reset is set: then that is waited out like any rest.
+        with self.lock:
+            now = time.time()
+            active = [slot for slot in self.slots if slot.resume_at <= now]
+            if not active:
+                resume_at = min(slot.resume_at for slot in self.slots)
+                if not wait_for_reset and all(slot.exhausted for slot in self.slots):
+                    raise QuotaExhausted(resume_at)
+                return None, None, resume_at - now
+            for slot in active:
+                slot.exhausted = False
+            # Ties go to the least used key
+            slot = min(active, key=lambda s: (s.cost(), s.requests))
+            slot.in_flight += 1
+        estimate, wait = slot.limiter.reserve()
+        return slot, estimate, wait
+
+    def acquire(self, stop_flag_func=None, wait_for_reset=False):
+        # Blocking reserve(): (slot, estimate) once a request may be sent, or
+        # None if stop_flag_func fired while waiting
+        while True:
+            slot, estimate, wait = self.reserve(wait_for_reset)
+            deadline = time.monotonic() + wait
+            while True:
+                if stop_flag_func and stop_flag_func():
+                    if slot:
+                        self.release(slot, estimate)
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(min(remaining, 0.5))
+            if slot:
+                return slot, estimate
+
+    def release(self, slot, estimate):
+        slot.limiter.release(estimate)
+        with self.lock:
+            slot.in_flight -= 1
+
+    def succeeded(self, slot, estimate, tokens, seconds):
+        slot.limiter.record_usage(estimate, tokens)
+        with self.lock:
+            slot.in_flight -= 1
+            slot.requests += 1
+            slot.tokens += tokens
+            slot.latency = seconds if slot.latency is None else 0.8 * slot.latency + 0.2 * seconds
+
+    def failed(self, slot, error, kind):
+        # Takes a key out of rotation after a quota error: until the daily
+        # reset if the daily quota is spent, otherwise for THROTTLE_BACKOFF
+        # seconds
+        daily = kind == QUOTA and is_daily_quota_error(error)
+        with self.lock:
+            slot.in_flight -= 1
+            slot.requests += 1
+            slot.errors += 1
+            if kind != QUOTA:
+                return
+            slot.quota_errors += 1
+            if daily:
+                slot.exhausted = True
+                slot.resume_at = next_quota_reset()
+                print(f"[KEYS] {slot.label} is out of daily quota until "
+                      f"{datetime.fromtimestamp(slot.resume_at):%Y-%m-%d %H:%M}; "
+                      f"{sum(1 for s in self.slots if not s.exhausted)} of {len(self.slots)} keys left")
+            else:
+                slot.resume_at = max(slot.resume_at, time.time() + THROTTLE_BACKOFF)
+                print(f"[RATE LIMIT] {slot.label}: {error}; resting it for {THROTTLE_BACKOFF}s")
+        if daily:
+            self.save_state()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                slot.label: {"model": slot.session.model_name, "requests": slot.requests, "tokens": slot.tokens,
+                             "errors": slot.errors, "quota_errors": slot.quota_errors,
+                             "latency": slot.latency or 0.0, "in_flight": slot.in_flight,
+                             "available": slot.resume_at <= time.time()}
+                for slot in self.slots
+            }
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+TRACE_FILENAME = ".kyugen_trace.jsonl"
+METRICS_FILENAME = ".kyugen_metrics.prom"
+
+# Pipeline stages that get timed, in order
+STAGES = ("preprocess", "quality", "local", "throttle", "api", "parse", "move", "embed", "csv")
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Stage:
+    __slots__ = ("count", "seconds", "cpu", "recent")
+
+    def __init__(self, window):
+        self.count = 0
+        self.seconds = 0.0
+        self.cpu = 0.0
+        self.recent = deque(maxlen=window)
+
+
+# Run telemetry. Stage timings (wall and CPU time of the thread doing the
+# work), per-file latency, API calls, error classes and token usage. Live
+# percentiles come from a window of recent samples so the dashboard stays
+# cheap on long runs; counts and sums cover the whole run. Each finished file
+# is appended to a JSON-lines trace, and snapshot() is written out as a
+# Prometheus text file every `write_interval` seconds and at the end.
+class Metrics:
+    def __init__(self, trace_path=None, metrics_path=None, window=1000, write_interval=10.0):
+        self.trace_path = trace_path
+        self.metrics_path = metrics_path
+        self.window = window
+        self.write_interval = write_interval
+        self.lock = threading.Lock()
+        # Per thread and per asyncio task
+        self.current_job = contextvars.ContextVar("current_job", default=None)
+        self.stages = {name: _Stage(window) for name in STAGES}
+        self.latencies = deque(maxlen=window)
+        self.counts = {"ok": 0, "error": 0, "rejected": 0, "skipped": 0}
+        self.errors = {}
+        self.api_calls = 0
+        self.upload_bytes = 0
+        self.tokens = {"prompt": 0, "output": 0, "total": 0}
+        # Per-key usage from the engine's key pool, when it has one
+        self.keys = None
+        self.started = time.time()
+        self.last_write = time.monotonic()
+        self.trace = open(trace_path, "a", encoding="utf-8") if trace_path else None
+        if self.trace:
+            self._trace({"event": "run", "started": self.started})
+
+    @classmethod
+    def for_output(cls, output_path, config):
+        if not config.get("metrics_enabled", True):
+            return cls()
+        return cls(config.get("trace_path") or os.path.join(output_path, TRACE_FILENAME),
+                   config.get("metrics_path") or os.path.join(output_path, METRICS_FILENAME))
+
+    @contextmanager
+    def bind(self, job):
+        # Stage timings and tokens recorded on this thread (or asyncio task)
+        # are also added to `job`, for its trace line
+        token = self.current_job.set(job)
+        try:
+            yield job
+        finally:
+            self.current_job.reset(token)
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, time.thread_time() - cpu)
+
+    def observe(self, stage, seconds, cpu=0.0):
+        with self.lock:
+            entry = self.stages[stage]
+            entry.count += 1
+            entry.seconds += seconds
+            entry.cpu += cpu
+            entry.recent.append(seconds)
+        job = self.current_job.get()
+        if job is not None:
+            job.timings[stage] = job.timings.get(stage, 0.0) + seconds
+
+    def api_call(self, upload_bytes=0):
+        with self.lock:
+            self.api_calls += 1
+            self.upload_bytes += upload_bytes
+
+    def api_error(self, kind):
+        with self.lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def usage(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if not usage:
+            return
+        prompt = getattr(usage, "prompt_token_count", 0) or 0
+        output = getattr(usage, "candidates_token_count", 0) or 0
+        total = getattr(usage, "total_token_count", 0) or prompt + output
+        with self.lock:
+            self.tokens["prompt"] += prompt
+            self.tokens["output"] += output
+            self.tokens["total"] += total
+        job = self.current_job.get()
+        if job is not None:
+            job.tokens += total
+
+    def file_done(self, result, job=None):
+        latency = time.monotonic() - job.started if job is not None else None
+        with self.lock:
+            self.counts[result.status] = self.counts.get(result.status, 0) + 1
+            if latency is not None and result.status != "skipped":
+                self.latencies.append(latency)
+        if self.trace:
+            record = {"event": "file", "time": time.time(), "index": result.index, "file": result.source,
+                      "status": result.status, "output": result.filename, "error": result.error}
+            if job is not None:
+                record["latency"] = round(latency, 4)
+                record["stages"] = {k: round(v, 4) for k, v in job.timings.items()}
+                record["tokens"] = job.tokens
+            self._trace(record)
+        if time.monotonic() - self.last_write >= self.write_interval:
+            self.write_prometheus()
+
+    def _trace(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.trace.write(line)
+
+    def snapshot(self):
+        keys = self.keys() if self.keys else {}
+        with self.lock:
+            elapsed = max(1e-9, time.time() - self.started)
+            finished = self.counts["ok"] + self.counts["error"]
+            latencies = list(self.latencies)
+            stages = {
+                name: {"count": s.count, "seconds": s.seconds, "cpu": s.cpu,
+                       "p50": percentile(s.recent, 0.5), "p95": percentile(s.recent, 0.95)}
+                for name, s in self.stages.items()
+            }
+            return {
+                "elapsed": elapsed,
+                "counts": dict(self.counts),
+                "files_per_min": finished / elapsed * 60,
+                "p50": percentile(latencies, 0.5),
+                "p95": percentile(latencies, 0.95),
+                "error_rate": self.counts["error"] / finished if finished else 0.0,
+                "errors": dict(self.errors),
+                "api_calls": self.api_calls,
+                "upload_bytes": self.upload_bytes,
+                "tokens": dict(self.tokens),
+                "stages": stages,
+                "keys": keys,
+            }
+
+    def prometheus_text(self):
+        snap = self.snapshot()
+        lines = [
+            "# HELP kyugen_files_total Files finished, by status.",
+            "# TYPE kyugen_files_total counter",
+        ]
+        lines += [f'kyugen_files_total{{status="{k}"}} {v}' for k, v in snap["counts"].items()]
+        lines += [
+            "# HELP kyugen_files_per_minute Throughput since the run started.",
+            "# TYPE kyugen_files_per_minute gauge",
+            f"kyugen_files_per_minute {snap['files_per_min']:.3f}",
+            "# HELP kyugen_file_latency_seconds Time from queueing to finalizing a file (recent files).",
+            "# TYPE kyugen_file_latency_seconds summary",
+            f'kyugen_file_latency_seconds{{quantile="0.5"}} {snap["p50"]:.4f}',
+            f'kyugen_file_latency_seconds{{quantile="0.95"}} {snap["p95"]:.4f}',
+            "# HELP kyugen_error_ratio Share of finished files that failed.",
+            "# TYPE kyugen_error_ratio gauge",
+            f"kyugen_error_ratio {snap['error_rate']:.4f}",
+            "# HELP kyugen_api_calls_total Requests sent to the model.",
+            "# TYPE kyugen_api_calls_total counter",
+            f"kyugen_api_calls_total {snap['api_calls']}",
+            "# HELP kyugen_upload_bytes_total Image bytes sent to the model.",
+            "# TYPE kyugen_upload_bytes_total counter",
+            f"kyugen_upload_bytes_total {snap['upload_bytes']}",
+            "# HELP kyugen_api_errors_total Failed requests, by error class.",
+            "# TYPE kyugen_api_errors_total counter",
+        ]
+        lines += [f'kyugen_api_errors_total{{kind="{k}"}} {v}' for k, v in snap["errors"].items()]
+        lines += ["# HELP kyugen_tokens_total Tokens reported by the API.", "# TYPE kyugen_tokens_total counter"]
+        lines += [f'kyugen_tokens_total{{type="{k}"}} {v}' for k, v in snap["tokens"].items()]
+        lines += ["# HELP kyugen_stage_seconds Wall time per pipeline stage.",
+                  "# TYPE kyugen_stage_seconds summary"]
+        for name, s in snap["stages"].items():
+            lines += [f'kyugen_stage_seconds{{stage="{name}",quantile="0.5"}} {s["p50"]:.4f}',
+                      f'kyugen_stage_seconds{{stage="{name}",quantile="0.95"}} {s["p95"]:.4f}',
+                      f'kyugen_stage_seconds_sum{{stage="{name}"}} {s["seconds"]:.4f}',
+                      f'kyugen_stage_seconds_count{{stage="{name}"}} {s["count"]}']
+        lines += ["# HELP kyugen_stage_cpu_seconds_total CPU time per pipeline stage.",
+                  "# TYPE kyugen_stage_cpu_seconds_total counter"]
+        lines += [f'kyugen_stage_cpu_seconds_total{{stage="{name}"}} {s["cpu"]:.4f}'
+                  for name, s in snap["stages"].items()]
+        if snap["keys"]:
+            lines += ["# HELP kyugen_key_requests_total Requests sent per API key.",
+                      "# TYPE kyugen_key_requests_total counter"]
+            lines += [f'kyugen_key_requests_total{{key="{k}",model="{v["model"]}"}} {v["requests"]}'
+                      for k, v in snap["keys"].items()]
+            lines += ["# HELP kyugen_key_errors_total Failed requests per API key.",
+                      "# TYPE kyugen_key_errors_total counter"]
+            lines += [f'kyugen_key_errors_total{{key="{k}",quota="{q}"}} {n}'
+                      for k, v in snap["keys"].items()
+                      for q, n in (("true", v["quota_errors"]), ("false", v["errors"] - v["quota_errors"]))]
+            lines += ["# HELP kyugen_key_tokens_total Tokens reported per API key.",
+                      "# TYPE kyugen_key_tokens_total counter"]
+            lines += [f'kyugen_key_tokens_total{{key="{k}"}} {v["tokens"]}' for k, v in snap["keys"].items()]
+            lines += ["# HELP kyugen_key_latency_seconds Smoothed request latency per API key.",
+                      "# TYPE kyugen_key_latency_seconds gauge"]
+            lines += [f'kyugen_key_latency_seconds{{key="{k}"}} {v["latency"]:.4f}' for k, v in snap["keys"].items()]
+            lines += ["# HELP kyugen_key_available Whether the key is in rotation (0 while resting or out of quota).",
+                      "# TYPE kyugen_key_available gauge"]
+            lines += [f'kyugen_key_available{{key="{k}"}} {int(v["available"])}' for k, v in snap["keys"].items()]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        # Atomic replace so a scraper never reads a half-written file
+        self.last_write = time.monotonic()
+        if not self.metrics_path:
+            return
+        temp_path = self.metrics_path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(temp_path, self.metrics_path)
+        except OSError as e:
+            print(f"[METRICS] Could not write {self.metrics_path}: {e}")
+
+    def close(self):
+        self.write_prometheus()
+        if self.trace:
+            with self.lock:
+                self.trace.close()
+            self.trace = None
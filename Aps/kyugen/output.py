@@ -0,0 +1,124 @@
+import os
+import errno
+import shutil
+import threading
+from datetime import datetime
+
+from kyugen.exporters import clean_title
+
+COPY_CHUNK = 1024 * 1024
+
+
+# Names in the output folder, reserved in memory so workers never stat the
+# disk to find a free one and never pick the same name. Seeded once from a
+# listing of the folder plus any names the caller already knows (the CSV
+# files' rows, whose files may have been moved away since). Keeps the next
+# free `_N` per title, so thousands of files with the same title don't probe
+# `_1`, `_2`, ... each time. Compared case-insensitively, as on Windows and
+# macOS. Assumes nothing else creates files in the output folder during the
+# run, unless `exclusive` is set: then each reserved name is also created as
+# an empty placeholder with O_EXCL, which the move replaces, so processes on
+# other machines sharing the folder can never pick the same name either.
+# Error/ and Rejected/ get an index of their own, where files keep their
+# original names.
+class NameIndex:
+    def __init__(self, output_path, known=(), exclusive=False):
+        self.output_path = output_path
+        self.exclusive = exclusive
+        self.lock = threading.Lock()
+        self.names = {name.lower() for name in known}
+        self.next_suffix = {}
+        try:
+            with os.scandir(output_path) as it:
+                self.names.update(entry.name.lower() for entry in it)
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, filename):
+        with self.lock:
+            return filename.lower() in self.names
+
+    def _create(self, filename):
+        # False if someone else already took the name on disk
+        try:
+            os.close(os.open(os.path.join(self.output_path, filename), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            self.names.add(filename.lower())
+            return False
+        return True
+
+    def reserve(self, title, ext, max_title):
+        # Same scheme as ever: YYYYMMDD_Title.ext, then YYYYMMDD_Title_1.ext,
+        # YYYYMMDD_Title_2.ext, ...
+        date_prefix = datetime.now().strftime("%Y%m%d")
+        safe_title = "_".join(clean_title(title).split())[:max_title] or "untitled"
+        return self._reserve(f"{date_prefix}_{safe_title}", ext)
+
+    def reserve_original(self, filename):
+        # The file's own name, then name_1.ext, name_2.ext, ... so a second
+        # IMG_0001.jpg never replaces the first
+        stem, ext = os.path.splitext(filename)
+        return self._reserve(stem, ext)
+
+    def _reserve(self, stem, ext):
+        filename = f"{stem}{ext}"
+        with self.lock:
+            key = filename.lower()
+            counter = self.next_suffix.get(key, 1)
+            while filename.lower() in self.names or (self.exclusive and not self._create(filename)):
+                filename = f"{stem}_{counter}{ext}"
+                counter += 1
+            self.next_suffix[key] = counter
+            self.names.add(filename.lower())
+        return filename
+
+    def release(self, filename):
+        # A reserved name whose file never made it to the folder
+        with self.lock:
+            self.names.discard(filename.lower())
+        if self.exclusive:
+            path = os.path.join(self.output_path, filename)
+            try:
+                if os.path.getsize(path) == 0:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def move_file(source, target, on_progress=None):
+    # Atomic rename when both paths are on the same volume. Across volumes
+    # the file is streamed to a temporary name next to the target, fsynced,
+    # renamed into place and only then deleted from the source, so neither
+    # side is ever left with a partial file. on_progress(copied, total) is
+    # called after each chunk of such a copy.
+    try:
+        os.replace(source, target)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    total = os.path.getsize(source)
+    temp_path = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.part")
+    try:
+        with open(source, "rb") as src, open(temp_path, "wb") as dst:
+            copied = 0
+            while True:
+                chunk = src.read(COPY_CHUNK)
+                if not chunk:
+                    break
+                dst.write(chunk)
+                copied += len(chunk)
+                if on_progress:
+                    on_progress(copied, total)
+            dst.flush()
+            os.fsync(dst.fileno())
+        shutil.copystat(source, temp_path)
+        os.replace(temp_path, target)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    os.remove(source)
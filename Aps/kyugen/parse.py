@@ -0,0 +1,117 @@
+import re
+import json
+
+from kyugen.constants import CATEGORY_MAP
+
+# Tolerates markdown drift such as "**Title:**", "## Keywords:" or
+# "- Category :"; a field's value runs until the next field label, so
+# keywords wrapped over several lines are kept.
+_FIELD_LABEL = re.compile(r"^[\s*#_>-]*(Title|Keywords|Category)[\s*_]*:[\s*_]*", re.IGNORECASE | re.MULTILINE)
+_IMAGE_MARKER = re.compile(r"^[\s*#_]*Image\s*(\d+)[\s*#_:.)-]*$", re.IGNORECASE | re.MULTILINE)
+_JSON_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_CATEGORY_LOOKUP = {name.lower(): name for name in CATEGORY_MAP}
+
+
+def parse_text_fields(result):
+    fields = {}
+    labels = list(_FIELD_LABEL.finditer(result))
+    for label, following in zip(labels, labels[1:] + [None]):
+        name = label.group(1).capitalize()
+        end = following.start() if following else len(result)
+        value = " ".join(result[label.end():end].split()).strip(" *_")
+        if name not in fields and value:
+            fields[name] = value
+    return fields
+
+
+def _load_json(result):
+    text = _JSON_FENCE.sub("", result.strip())
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def validate_json(data):
+    # (title, keyword_text, category) from a structured answer, with any
+    # invalid field returned empty
+    if not isinstance(data, dict):
+        return "", "", ""
+    title = data.get("title")
+    title = " ".join(title.split()) if isinstance(title, str) else ""
+
+    keywords = data.get("keywords")
+    if isinstance(keywords, str):
+        keywords = re.split(r"[,;\n]+", keywords)
+    if isinstance(keywords, list):
+        keywords = [k.strip() for k in keywords if isinstance(k, str) and k.strip()]
+    else:
+        keywords = []
+
+    category = data.get("category")
+    category = match_category(category) if isinstance(category, str) else ""
+    return title, ", ".join(keywords), category
+
+
+def match_category(text):
+    text = text.strip().lower()
+    if text in _CATEGORY_LOOKUP:
+        return _CATEGORY_LOOKUP[text]
+    for key, name in _CATEGORY_LOOKUP.items():
+        if key in text:
+            return name
+    return ""
+
+
+def parse_description(result):
+    # Structured JSON answers first; the labelled text format is the fallback
+    # for text mode or a model that ignored the schema.
+    data = _load_json(result)
+    if data is not None:
+        return validate_json(data)
+    fields = parse_text_fields(result)
+    return fields.get("Title", ""), fields.get("Keywords", ""), fields.get("Category", "")
+
+
+def split_batch_response(result, count):
+    # One answer per image, in order; "" for any image the model skipped.
+    # Structured batches are a JSON array of objects carrying their "image"
+    # number; text batches use "Image N" marker lines.
+    data = _load_json(result)
+    if isinstance(data, list):
+        blocks = {}
+        for position, item in enumerate(data, 1):
+            if not isinstance(item, dict):
+                continue
+            number = item.get("image", position)
+            if isinstance(number, int) and 1 <= number <= count and number not in blocks:
+                blocks[number] = json.dumps(item)
+        return [blocks.get(number, "") for number in range(1, count + 1)]
+
+    blocks = {}
+    markers = list(_IMAGE_MARKER.finditer(result))
+    for marker, following in zip(markers, markers[1:] + [None]):
+        number = int(marker.group(1))
+        end = following.start() if following else len(result)
+        if 1 <= number <= count and number not in blocks:
+            blocks[number] = result[marker.end():end].strip()
+    return [blocks.get(number, "") for number in range(1, count + 1)]
+
+
+def response_schema(batch=False, title_only=False):
+    item = {
+        "type": "OBJECT",
+        "properties": {
+            "title": {"type": "STRING"},
+            "keywords": {"type": "ARRAY", "items": {"type": "STRING"}},
+            "category": {"type": "STRING", "enum": list(CATEGORY_MAP)},
+        },
+        "required": ["title", "keywords", "category"],
+    }
+    if title_only:
+        item = {"type": "OBJECT", "properties": {"title": {"type": "STRING"}}, "required": ["title"]}
+    if not batch:
+        return item
+    item["properties"]["image"] = {"type": "INTEGER"}
+    item["required"].append("image")
+    return {"type": "ARRAY", "items": item}
@@ -0,0 +1,137 @@
+import io
+import os
+from collections import namedtuple
+
+from kyugen.quality import measure_quality
+from kyugen.tagger import clip_pixels
+
+# Bytes ready to send to the API, with their real MIME type, the quality
+# pre-filter's statistics and the local model's input pixels when those are on
+Upload = namedtuple("Upload", ["data", "mime_type", "width", "height", "image_stats", "pixels"],
+                    defaults=(None, None))
+
+UPLOAD_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+VIDEO_EXTENSIONS = (".mp4", ".mov")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class PreprocessError(Exception):
+    pass
+
+
+def configure_ghostscript():
+    # Bundled Ghostscript next to the app on Windows; PATH is used elsewhere
+    from PIL import EpsImagePlugin
+
+    gs_local = os.path.join(APP_DIR, "gswin64c.exe")
+    if os.path.exists(gs_local):
+        os.environ["GHOSTSCRIPT_PATH"] = gs_local
+        EpsImagePlugin.gs_windows_binary = gs_local
+
+
+def read_video_frame(file_path):
+    import cv2
+    from PIL import Image
+
+    cap = cv2.VideoCapture(file_path)
+    try:
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        middle_frame = frame_count // 2
+        cap.set(cv2.CAP_PROP_POS_FRAMES, middle_frame)
+        success, frame = cap.read()
+    finally:
+        cap.release()
+    if not success:
+        raise PreprocessError(f"Could not read frame from {os.path.basename(file_path)}")
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+def read_video(file_path, size=None, mode="sharpest", samples=5):
+    # Keyframe sampling through ffmpeg; OpenCV's middle-frame seek is the
+    # fallback when ffmpeg is missing or can't read the clip.
+    from kyugen.video import read_video_keyframes
+
+    try:
+        img = read_video_keyframes(file_path, size or 1024, mode, samples)
+    except Exception as e:
+        print(f"[VIDEO] ffmpeg sampling failed for {os.path.basename(file_path)}, using OpenCV: {e}")
+        img = None
+    return img if img is not None else read_video_frame(file_path)
+
+
+def read_eps(file_path, size=None):
+    import math
+    from PIL import Image
+
+    configure_ghostscript()
+    try:
+        img = Image.open(file_path)
+        # Ghostscript renders the bounding box at 72 dpi times `scale`. Tiny
+        # artboards are scaled up to about upload resolution; larger ones
+        # render at their own size and are shrunk by encode_image().
+        img.load(scale=max(1, math.floor(size / max(img.size))) if size else 1)
+    except Exception as e:
+        raise PreprocessError(f"{os.path.basename(file_path)}: {e}") from e
+    return img
+
+
+def to_rgb(img):
+    # Flatten transparency onto white; a plain convert("RGB") turns transparent
+    # areas black, which the model then happily describes.
+    from PIL import Image
+
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def load_image(file_path, size=None, video_mode="sharpest", video_samples=5):
+    # `size` is a hint: decoders that can produce a smaller image cheaply
+    # (JPEG DCT scaling, EPS render resolution) stop at or just above it.
+    from PIL import Image
+
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in VIDEO_EXTENSIONS:
+        return read_video(file_path, size, video_mode, video_samples)
+    if ext == ".eps":
+        return read_eps(file_path, size)
+    if ext in IMAGE_EXTENSIONS:
+        img = Image.open(file_path)
+        # Before draft() shrinks it; the quality checks need the real size
+        img.info["source_size"] = img.size
+        if size and img.format == "JPEG":
+            img.draft(None, (size, size))
+        return img
+    raise PreprocessError(f"Unsupported file type: {ext}")
+
+
+def encode_image(img, size=1024, upload_format="jpeg", quality=85, measure=False, local_pixels=False):
+    pil_format, mime_type = UPLOAD_FORMATS[upload_format]
+    source_size = img.info.get("source_size")
+    img = to_rgb(img)
+    img.thumbnail((size, size))
+    # Measured on the thumbnail that is decoded anyway, so it costs
+    # milliseconds
+    stats = measure_quality(img, source_size) if measure else None
+    pixels = clip_pixels(img) if local_pixels else None
+    buffer = io.BytesIO()
+    img.save(buffer, pil_format, quality=quality)
+    return Upload(buffer.getvalue(), mime_type, img.width, img.height, stats, pixels)
+
+
+def preprocess_file(file_path, size=1024, upload_format="jpeg", quality=85, video_mode="sharpest", video_samples=5,
+                    measure=False, local_pixels=False):
+    # Decode any supported input and return upload bytes, entirely in memory.
+    # Top-level and picklable so it can run in a process pool.
+    return encode_image(load_image(file_path, size, video_mode, video_samples), size, upload_format, quality,
+                        measure, local_pixels)
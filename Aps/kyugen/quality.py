@@ -0,0 +1,86 @@
+import time
+
+REJECTED_FOLDER = "Rejected"
+REJECTED_FILENAME = "rejected.csv"
+REJECTED_HEADER = ["Filename", "Reason", "Sharpness", "Brightness", "Contrast", "Megapixels", "Aspect"]
+
+# Largest side the checks look at; larger thumbnails are reduced first so the
+# sharpness threshold means the same whatever upload_size is
+ANALYSIS_SIZE = 1024
+# Sharpness is taken from the sharpest cell of a GRID x GRID split, so a sharp
+# subject on a plain studio background isn't mistaken for a blurred frame
+GRID = 8
+# Exposure: an image whose brightest 1% is still this dark, or whose darkest
+# 1% is already this bright, is a black or white frame
+DARK_LEVEL = 40
+BRIGHT_LEVEL = 235
+# Difference between the 1st and 99th luminance percentiles below which the
+# image is a blank or near-uniform frame
+MIN_CONTRAST = 12
+
+
+def measure_quality(img, source_size=None):
+    # Cheap statistics of an already decoded (and usually downscaled) image,
+    # all vectorized: Laplacian sharpness, luminance percentiles, resolution
+    # and aspect ratio. source_size is the original pixel size when known;
+    # img.size is used for the aspect ratio otherwise, and megapixels are None.
+    import numpy as np
+
+    started = time.perf_counter()
+    gray = img.convert("L")
+    if max(gray.size) > ANALYSIS_SIZE:
+        gray.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE))
+    pixels = np.asarray(gray, dtype=np.float32)
+
+    # 4-neighbour Laplacian on the interior, as slices of the same array
+    laplacian = (pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+                 - 4 * pixels[1:-1, 1:-1])
+    height, width = laplacian.shape
+    cell_h, cell_w = height // GRID, width // GRID
+    if cell_h >= 4 and cell_w >= 4:
+        cells = laplacian[:cell_h * GRID, :cell_w * GRID].reshape(GRID, cell_h, GRID, cell_w)
+        sharpness = float(cells.var(axis=(1, 3)).max())
+    else:
+        sharpness = float(laplacian.var()) if laplacian.size else 0.0
+
+    histogram = np.asarray(gray.histogram(), dtype=np.float64)
+    cumulative = np.cumsum(histogram) / max(1.0, histogram.sum())
+    low, high = (int(v) for v in np.searchsorted(cumulative, (0.01, 0.99)))
+    brightness = float(np.dot(histogram, np.arange(256)) / max(1.0, histogram.sum()))
+
+    width, height = source_size or img.size
+    return {
+        "sharpness": sharpness,
+        "brightness": brightness,
+        "low": low,
+        "high": high,
+        "megapixels": width * height / 1e6 if source_size else None,
+        "aspect": max(width, height) / max(1, min(width, height)),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def rejection_reason(stats, min_megapixels=0.0, max_aspect=0.0, min_sharpness=0.0):
+    # Why agencies would refuse the file, or "" if it looks acceptable. A
+    # limit of 0 turns its check off.
+    megapixels = stats["megapixels"]
+    if min_megapixels and megapixels is not None and megapixels < min_megapixels:
+        return f"resolution {megapixels:.2f} MP is below {min_megapixels:g} MP"
+    if max_aspect and stats["aspect"] > max_aspect:
+        return f"aspect ratio {stats['aspect']:.1f}:1 is above {max_aspect:g}:1"
+    if stats["high"] - stats["low"] < MIN_CONTRAST:
+        return "blank or flat image"
+    if stats["high"] < DARK_LEVEL:
+        return "underexposed"
+    if stats["low"] > BRIGHT_LEVEL:
+        return "overexposed"
+    if min_sharpness and stats["sharpness"] < min_sharpness:
+        return f"blurred (sharpness {stats['sharpness']:.0f} is below {min_sharpness:g})"
+    return ""
+
+
+def rejected_row(filename, reason, stats):
+    megapixels = stats["megapixels"]
+    return [filename, reason, f"{stats['sharpness']:.1f}", f"{stats['brightness']:.1f}",
+            str(stats["high"] - stats["low"]), "" if megapixels is None else f"{megapixels:.2f}",
+            f"{stats['aspect']:.2f}"]
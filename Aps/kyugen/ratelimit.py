@@ -0,0 +1,145 @@
+import time
+import threading
+
+# Rough cost of one describe request (prompt + image + answer), used until the
+# API reports real usage.
+DEFAULT_TOKENS_PER_REQUEST = 1000
+
+
+class TokenBucket:
+    # Classic token bucket: refills continuously at `rate` per second up to
+    # `capacity`. Amounts larger than the capacity are allowed and simply put
+    # the bucket into debt, so one oversized request can't deadlock callers.
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        # Takes `amount` now and returns how long the caller must wait before
+        # the bucket is back out of debt.
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def wait_time(self, amount):
+        # How long reserve(amount) would have to wait, without taking anything
+        with self.lock:
+            self._refill(time.monotonic())
+            return max(0.0, amount - self.tokens) / self.rate
+
+    def adjust(self, amount):
+        # Positive refunds tokens, negative charges extra (e.g. real usage
+        # turned out higher than the estimate).
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    # One key's requests/min and tokens/min limits, shared by all workers.
+    # A request only waits when the quota is actually spent, so throughput
+    # sits at the configured rate instead of a fixed per-file sleep. KeyPool
+    # reserves through it and does the waiting.
+    def __init__(self, rpm, tpm=0, tokens_per_request=DEFAULT_TOKENS_PER_REQUEST):
+        self.requests = TokenBucket(rpm / 60.0, max(1.0, rpm / 60.0 * 5)) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm / 60.0, max(tokens_per_request, tpm / 60.0 * 5)) if tpm > 0 else None
+        self.tokens_per_request = tokens_per_request
+        self.token_estimate = float(tokens_per_request)
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        # Charges one request now. Returns (estimate, wait): the token
+        # estimate to pass back to record_usage() and how long the caller
+        # has to wait before sending.
+        estimate = self.token_estimate
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens:
+            wait = max(wait, self.tokens.reserve(estimate))
+        return estimate, wait
+
+    def delay(self):
+        # Seconds until a request could be sent, without reserving it
+        wait = 0.0
+        if self.requests:
+            wait = self.requests.wait_time(1)
+        if self.tokens:
+            wait = max(wait, self.tokens.wait_time(self.token_estimate))
+        return wait
+
+    def release(self, estimate):
+        # Give back a slot that was reserved but never used.
+        if self.requests:
+            self.requests.adjust(1)
+        if self.tokens:
+            self.tokens.adjust(estimate)
+
+    def record_usage(self, estimate, actual_tokens):
+        if not actual_tokens:
+            return
+        if self.tokens:
+            self.tokens.adjust(estimate - actual_tokens)
+        with self.lock:
+            # Moving average so the next reservations track real usage
+            self.token_estimate = 0.8 * self.token_estimate + 0.2 * actual_tokens
+
+
+class AdaptiveConcurrency:
+    # AIMD limit on in-flight API calls: grows by one after a full window of
+    # successes and halves on a 429/quota error, between `minimum` and
+    # `maximum`.
+    def __init__(self, maximum, initial=None, minimum=1):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(self.maximum, max(self.minimum, initial or self.maximum))
+        self.in_flight = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+        return False
+
+    def on_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify()
+
+    def on_throttle(self):
+        with self.condition:
+            self.limit = max(self.minimum, self.limit // 2)
+            self.successes = 0
+
+
+def is_rate_limit_error(error):
+    # google.api_core raises ResourceExhausted (HTTP 429) for both per-minute
+    # rate limits and daily quota; match on the message too since the REST
+    # transport sometimes surfaces it as a plain error.
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "resource has been exhausted" in message or "rate limit" in message
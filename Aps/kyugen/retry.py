@@ -0,0 +1,136 @@
+import re
+import time
+import random
+import threading
+
+from kyugen.ratelimit import is_rate_limit_error
+
+# Error classes. Transient and quota errors are retried; blocked, parse and
+# fatal ones fail the file straight away since asking again won't help.
+TRANSIENT = "transient"
+QUOTA = "quota"
+BLOCKED = "blocked"
+PARSE = "parse"
+FATAL = "fatal"
+
+_TRANSIENT_NAMES = ("ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "GatewayTimeout",
+                    "BadGateway", "Aborted", "RetryError", "Timeout", "ReadTimeout", "ConnectTimeout")
+_TRANSIENT_STATUS = re.compile(r"\b(500|502|503|504)\b")
+_TRANSIENT_MESSAGES = ("timeout", "timed out", "unavailable", "overloaded",
+                       "connection reset", "connection aborted", "temporarily", "try again")
+_BLOCKED_NAMES = ("BlockedPromptException", "StopCandidateException")
+_BLOCKED_MESSAGES = ("safety", "blocked", "finish_reason", "response.text")
+
+
+class ApiError(Exception):
+    def __init__(self, kind, message):
+        super().__init__(f"{kind}: {message}")
+        self.kind = kind
+
+
+def classify_error(error):
+    if isinstance(error, ApiError):
+        return error.kind
+    if is_rate_limit_error(error):
+        return QUOTA
+    name = type(error).__name__
+    message = str(error).lower()
+    if name in _BLOCKED_NAMES or any(m in message for m in _BLOCKED_MESSAGES):
+        return BLOCKED
+    if (name in _TRANSIENT_NAMES or isinstance(error, (ConnectionError, TimeoutError))
+            or _TRANSIENT_STATUS.search(message) or any(m in message for m in _TRANSIENT_MESSAGES)):
+        return TRANSIENT
+    return FATAL
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    # Exponential backoff with full jitter, so workers that failed together
+    # don't all come back at the same moment
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RetryBudget:
+    # Caps the retries one run may spend in total, so a long outage costs a
+    # bounded amount of time and quota. 0 means unlimited.
+    def __init__(self, total):
+        self.total = total
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            if self.total and self.used >= self.total:
+                return False
+            self.used += 1
+            return True
+
+
+# Stops every worker from hammering an API that is clearly down. After
+# `threshold` transient failures in a row the breaker opens and all calls
+# wait out the cooldown; then a single probe call is let through. A good
+# answer closes the breaker, another failure reopens it with a doubled
+# cooldown (up to max_cooldown).
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold=5, cooldown=30.0, max_cooldown=300.0):
+        self.threshold = max(1, threshold)
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.condition = threading.Condition()
+
+    def _ready(self):
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() >= self.open_until:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def ready(self):
+        # Non-blocking wait(): True if a call may go out now (taking the
+        # probe slot when half-open)
+        with self.condition:
+            return self._ready()
+
+    def wait(self, stop_flag_func=None):
+        # Blocks while the breaker is open. Returns False if stop_flag_func
+        # fired while waiting.
+        with self.condition:
+            while True:
+                if stop_flag_func and stop_flag_func():
+                    return False
+                if self._ready():
+                    return True
+                timeout = self.open_until - time.monotonic() if self.state == self.OPEN else 0.5
+                self.condition.wait(min(max(timeout, 0.05), 0.5))
+
+    def record_success(self):
+        with self.condition:
+            if self.state != self.CLOSED:
+                print("[CIRCUIT] API is answering again, resuming")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probing = False
+            self.cooldown = self.base_cooldown
+            self.condition.notify_all()
+
+    def record_failure(self):
+        with self.condition:
+            self.failures += 1
+            if self.probing or (self.state == self.CLOSED and self.failures >= self.threshold):
+                self.state = self.OPEN
+                self.open_until = time.monotonic() + self.cooldown
+                print(f"[CIRCUIT] API looks down, pausing all workers for {self.cooldown:.0f}s")
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self.probing = False
+                self.condition.notify_all()
@@ -0,0 +1,34 @@
+import os
+
+MEDIA_EXTENSIONS = (".jpg", ".jpeg", ".png", ".eps", ".mov", ".mp4")
+
+
+def iter_media_files(input_path, extensions=MEDIA_EXTENSIONS):
+    # Streaming os.scandir walk. Yields paths as soon as each directory has
+    # been listed instead of materializing the whole tree; entries are sorted
+    # per directory so burst sequences stay adjacent. scandir's cached
+    # d_type means no extra stat per entry on most filesystems.
+    stack = [input_path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            print(f"[SCAN ERROR] {directory}: {e}")
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.lower().endswith(extensions) and entry.is_file():
+                    yield entry.path
+            except OSError:
+                continue
+        # Reversed so subdirectories are visited in name order
+        stack.extend(reversed(subdirs))
+
+
+def scan_media_files(input_path):
+    return list(iter_media_files(input_path))
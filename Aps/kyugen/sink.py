@@ -0,0 +1,160 @@
+import io
+import os
+import csv
+import queue
+import threading
+import time
+
+_CLOSE = object()
+
+
+def complete_rows(data, delimiter=","):
+    # Parses CSV bytes into (rows, end): the complete records, and the byte
+    # offset just past the last one. Quoted fields may span lines, so records
+    # are found with the csv module rather than by splitting on newlines. A
+    # record cut off by a crash (no final newline, or an unclosed quote at
+    # the end) is left out. A file that is malformed further up, e.g. edited
+    # by hand, is read leniently and nothing is cut.
+    consumed = [0]
+
+    def lines():
+        for line in data.splitlines(keepends=True):
+            consumed[0] += len(line)
+            yield line.decode("utf-8", errors="replace")
+
+    rows = []
+    end = 0
+    try:
+        for row in csv.reader(lines(), delimiter=delimiter, strict=True):
+            if data[consumed[0] - 1:consumed[0]] != b"\n":
+                break
+            rows.append(row)
+            end = consumed[0]
+    except csv.Error:
+        if consumed[0] < len(data):
+            text = data.decode("utf-8", errors="replace").splitlines(keepends=True)
+            return list(csv.reader(text, delimiter=delimiter)), len(data)
+    return rows, end
+
+
+# Append-only CSV owned by one writer thread. Workers hand rows over with
+# write() and never touch the file; the writer flushes them in batches every
+# flush_rows rows or flush_interval seconds and fsyncs after each batch, so a
+# crash loses at most the last unflushed batch. A batch that fails to write
+# (disk full, share gone) is cut back off the file and kept for the next
+# flush; rows still unsaved after close() are left in `unsaved`. On open, a
+# row torn by a crash is cut off and the filenames already in the file are
+# loaded, so a resumed run never writes the same file twice.
+class CsvSink:
+    def __init__(self, path, header, flush_rows=200, flush_interval=2.0, delimiter=",", on_flush=None):
+        self.path = path
+        self.header = header
+        self.delimiter = delimiter
+        self.on_flush = on_flush
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.filenames = self._recover()
+        self.queue = queue.Queue()
+        # Unbuffered, so a failed write leaves nothing behind in memory to
+        # be written again later
+        self.file = open(path, mode="ab", buffering=0)
+        # Bytes known to be on disk
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.unsaved = []
+        self.failures = 0
+        if self.size == 0:
+            self._append(self._format([header]))
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _recover(self):
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, "rb+") as file:
+            data = file.read()
+            rows, end = complete_rows(data, self.delimiter)
+            if end < len(data):
+                # Partial last row from an interrupted write
+                file.truncate(end)
+        return {row[0] for row in rows[1:] if row}
+
+    def write(self, row):
+        # Returns False for a file that already has a row
+        with self.lock:
+            if row[0] in self.filenames:
+                return False
+            self.filenames.add(row[0])
+        self.queue.put(row)
+        return True
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                row = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                row = None
+            if row is _CLOSE:
+                break
+            if row is not None:
+                batch.append(row)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch and (len(batch) >= self.flush_rows or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                deadline = None
+        self._flush(batch)
+
+    def _format(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, delimiter=self.delimiter).writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+    def _append(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[self.file.write(view):]
+        os.fsync(self.file.fileno())
+        self.size += len(data)
+
+    def _cut(self):
+        # Drops whatever part of a failed batch reached the file
+        self.file.truncate(self.size)
+        os.fsync(self.file.fileno())
+
+    def _flush(self, batch):
+        rows = self.unsaved + batch
+        if not rows:
+            return
+        started = time.perf_counter()
+        try:
+            if self.unsaved:
+                self._cut()
+            self._append(self._format(rows))
+        except OSError as e:
+            self.unsaved = rows
+            self.failures += 1
+            try:
+                self._cut()
+            except OSError:
+                pass
+            print(f"[CSV ERROR] Could not write {len(rows)} rows to {self.path}, retrying with the next batch: {e}")
+            return
+        self.unsaved = []
+        if self.on_flush:
+            self.on_flush(len(rows), time.perf_counter() - started)
+
+    def unsaved_filenames(self):
+        return {row[0] for row in self.unsaved}
+
+    def close(self):
+        # Flushes what is queued; one more try for rows that failed before
+        if self.thread.is_alive():
+            self.queue.put(_CLOSE)
+            self.thread.join()
+            self._flush([])
+        self.file.close()
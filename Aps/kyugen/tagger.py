@@ -0,0 +1,242 @@
+import os
+import json
+import hashlib
+
+from kyugen.constants import CATEGORY_MAP
+
+LABELS_FILENAME = "labels.npz"
+IMAGE_MODEL_NAMES = ("image.onnx", "vision_model.onnx")
+TEXT_MODEL_NAMES = ("text.onnx", "text_model.onnx")
+TOKENIZER_NAMES = ("tokenizer.json",)
+
+# CLIP's input resolution and pixel normalization
+INPUT_SIZE = 224
+MEAN = (0.48145466, 0.4578275, 0.40821073)
+STD = (0.26862954, 0.26130258, 0.27577711)
+
+# What each Adobe Stock category looks like, in words CLIP was trained on
+CATEGORY_DESCRIPTIONS = {
+    "Animals": "animals",
+    "Architecture": "architecture and buildings",
+    "Backgrounds/Textures": "an abstract background or texture",
+    "Beauty/Fashion": "beauty and fashion",
+    "Business": "business and office work",
+    "Food & Drink": "food and drink",
+    "Healthcare/Medical": "healthcare and medicine",
+    "Holidays": "a holiday celebration",
+    "Industrial": "industry and manufacturing",
+    "Interiors": "a room interior",
+    "Miscellaneous": "everyday things",
+    "Nature": "nature and landscapes",
+    "Objects": "an object isolated on a plain background",
+    "Parks/Outdoor": "a park or outdoor leisure",
+    "People": "people",
+    "Religion": "religion and worship",
+    "Science": "science and research",
+    "Signs/Symbols": "a sign or symbol",
+    "Sports/Recreation": "sports and recreation",
+    "Technology": "technology and electronics",
+    "The Arts": "art, music and performance",
+    "Transportation": "vehicles and transportation",
+    "Travel": "travel and tourism",
+    "Vectors": "a flat vector illustration",
+}
+CATEGORY_TEMPLATES = ("a stock photo of {}.", "an image showing {}.")
+KEYWORD_TEMPLATE = "a photo of {}."
+
+# Keyword candidates when no local_vocabulary file is given
+DEFAULT_VOCABULARY = (
+    "abstract", "adult", "agriculture", "airplane", "animal", "apple", "architecture", "art", "autumn", "baby",
+    "background", "beach", "beautiful", "beauty", "bicycle", "bird", "birthday", "black", "blue", "boat", "book",
+    "bread", "bridge", "building", "business", "cake", "camera", "car", "cat", "celebration", "child", "christmas",
+    "church", "city", "cityscape", "closeup", "cloud", "coffee", "colorful", "computer", "concept", "construction",
+    "cooking", "couple", "cow", "cup", "dark", "decoration", "desert", "design", "dessert", "dinner", "doctor",
+    "dog", "drink", "education", "elegant", "energy", "engineering", "environment", "factory", "family", "farm",
+    "fashion", "field", "finance", "fish", "fitness", "flower", "food", "forest", "fresh", "friends", "fruit",
+    "furniture", "garden", "geometric", "girl", "glass", "gold", "grass", "green", "hands", "happy", "health",
+    "healthy", "hill", "historic", "holiday", "home", "horse", "hospital", "house", "ice", "illustration",
+    "industry", "interior", "isolated", "kitchen", "lake", "landmark", "landscape", "laptop", "leaf", "leisure",
+    "light", "lifestyle", "luxury", "man", "meal", "medical", "medicine", "meeting", "minimal", "modern",
+    "money", "morning", "mountain", "music", "natural", "nature", "night", "ocean", "office", "old", "orange",
+    "outdoor", "painting", "panorama", "paper", "park", "pattern", "people", "pet", "phone", "pink", "plant",
+    "plate", "portrait", "purple", "rain", "red", "relaxation", "religion", "restaurant", "retro", "river",
+    "road", "rock", "romantic", "room", "rural", "science", "sea", "season", "shadow", "ship", "shopping",
+    "sign", "silhouette", "sky", "smile", "snow", "space", "sport", "spring", "street", "student", "summer",
+    "sunlight", "sunset", "symbol", "table", "team", "technology", "texture", "traditional", "train", "transport",
+    "travel", "tree", "tropical", "urban", "vacation", "vector", "vegetable", "vintage", "water", "wedding",
+    "white", "wildlife", "window", "winter", "woman", "wood", "work", "yellow", "young",
+)
+
+
+class LocalModelError(Exception):
+    pass
+
+
+def _find(model_dir, names):
+    for folder in (model_dir, os.path.join(model_dir, "onnx")):
+        for name in names:
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                return path
+    return None
+
+
+def load_vocabulary(path=""):
+    # One keyword per line; blank lines and "#" comments are skipped
+    if not path:
+        return list(DEFAULT_VOCABULARY)
+    with open(path, "r", encoding="utf-8") as f:
+        words = [line.strip() for line in f]
+    return list(dict.fromkeys(w for w in words if w and not w.startswith("#")))
+
+
+def clip_pixels(img):
+    # RGB image -> INPUT_SIZE x INPUT_SIZE uint8 array: shortest side scaled
+    # to INPUT_SIZE, then center-cropped, as CLIP expects. Small enough to
+    # send back from a preprocess process with the upload.
+    import numpy as np
+    from PIL import Image
+
+    scale = INPUT_SIZE / min(img.size)
+    width, height = max(INPUT_SIZE, round(img.width * scale)), max(INPUT_SIZE, round(img.height * scale))
+    img = img.resize((width, height), Image.BICUBIC)
+    left, top = (width - INPUT_SIZE) // 2, (height - INPUT_SIZE) // 2
+    return np.asarray(img.crop((left, top, left + INPUT_SIZE, top + INPUT_SIZE)), dtype=np.uint8)
+
+
+def _normalize(vectors):
+    import numpy as np
+
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def _signature(vocabulary, text_model_path):
+    data = json.dumps([CATEGORY_DESCRIPTIONS, CATEGORY_TEMPLATES, KEYWORD_TEMPLATE, vocabulary,
+                       os.path.getsize(text_model_path) if text_model_path else 0])
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def build_labels(model_dir, vocabulary, threads=0):
+    # Text embeddings for the categories and the keyword vocabulary, computed
+    # once with the text encoder and saved next to the model; the image
+    # side never needs the text encoder or the tokenizer.
+    import numpy as np
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+
+    text_model_path = _find(model_dir, TEXT_MODEL_NAMES)
+    tokenizer_path = _find(model_dir, TOKENIZER_NAMES)
+    if not text_model_path or not tokenizer_path:
+        raise LocalModelError(f"{model_dir} has no text model and tokenizer.json to build {LABELS_FILENAME} from")
+    tokenizer = Tokenizer.from_file(tokenizer_path)
+    session = ort.InferenceSession(text_model_path, _session_options(threads), providers=["CPUExecutionProvider"])
+    inputs = {i.name for i in session.get_inputs()}
+    outputs = [o.name for o in session.get_outputs()]
+    output = "text_embeds" if "text_embeds" in outputs else outputs[0]
+
+    def embed(texts):
+        vectors = []
+        # One text at a time: no padding, so pooling always finds the real
+        # end-of-text token
+        for text in texts:
+            ids = np.asarray([tokenizer.encode(text).ids], dtype=np.int64)
+            feed = {"input_ids": ids}
+            if "attention_mask" in inputs:
+                feed["attention_mask"] = np.ones_like(ids)
+            vectors.append(session.run([output], feed)[0][0])
+        return _normalize(np.asarray(vectors, dtype=np.float32))
+
+    categories = np.stack([
+        _normalize(embed([t.format(CATEGORY_DESCRIPTIONS[name]) for t in CATEGORY_TEMPLATES]).mean(axis=0))
+        for name in CATEGORY_MAP
+    ])
+    keywords = embed([KEYWORD_TEMPLATE.format(word) for word in vocabulary])
+    path = os.path.join(model_dir, LABELS_FILENAME)
+    np.savez(path, categories=categories, keywords=keywords, keyword_names=np.asarray(vocabulary),
+             signature=np.asarray(_signature(vocabulary, text_model_path)))
+    return path
+
+
+def _session_options(threads):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+    return options
+
+
+# CLIP-style zero-shot tagging on the CPU: an ONNX image encoder, plus text
+# embeddings for the 24 categories and a keyword vocabulary that are computed
+# once and cached in labels.npz. Images are embedded in batches; categories
+# and keywords are the labels closest to each image.
+class LocalTagger:
+    def __init__(self, model_dir, vocabulary_path="", threads=0):
+        try:
+            import numpy as np
+            import onnxruntime as ort
+        except ImportError as e:
+            raise LocalModelError(f"The local model needs onnxruntime ({e})") from e
+
+        image_model_path = _find(model_dir, IMAGE_MODEL_NAMES)
+        if not image_model_path:
+            raise LocalModelError(f"No image model ({' or '.join(IMAGE_MODEL_NAMES)}) in {model_dir}")
+        vocabulary = load_vocabulary(vocabulary_path)
+        labels_path = os.path.join(model_dir, LABELS_FILENAME)
+        text_model_path = _find(model_dir, TEXT_MODEL_NAMES)
+        labels = np.load(labels_path) if os.path.exists(labels_path) else None
+        if labels is None or (text_model_path and str(labels["signature"]) != _signature(vocabulary, text_model_path)):
+            print(f"[LOCAL] Embedding {len(CATEGORY_MAP)} categories and {len(vocabulary)} keywords")
+            try:
+                labels = np.load(build_labels(model_dir, vocabulary, threads))
+            except ImportError as e:
+                raise LocalModelError(f"Building {LABELS_FILENAME} needs the tokenizers package ({e})") from e
+            except LocalModelError:
+                raise
+            except Exception as e:
+                raise LocalModelError(f"Could not embed the labels with {text_model_path}: {e}") from e
+        self.categories = labels["categories"]
+        self.keyword_embeddings = labels["keywords"]
+        self.keyword_names = [str(k) for k in labels["keyword_names"]]
+
+        try:
+            self.session = ort.InferenceSession(image_model_path, _session_options(threads),
+                                                providers=["CPUExecutionProvider"])
+        except Exception as e:
+            raise LocalModelError(f"Could not load {image_model_path}: {e}") from e
+        self.input_name = self.session.get_inputs()[0].name
+        outputs = [o.name for o in self.session.get_outputs()]
+        self.output_name = "image_embeds" if "image_embeds" in outputs else outputs[0]
+        # Identifies the model in embedding cache keys
+        digest = hashlib.sha256()
+        with open(image_model_path, "rb") as f:
+            digest.update(f.read(1024 * 1024))
+        self.model_id = f"{digest.hexdigest()[:16]}-{os.path.getsize(image_model_path)}"
+        self.mean = np.asarray(MEAN, dtype=np.float32)
+        self.std = np.asarray(STD, dtype=np.float32)
+
+    def embed(self, pixels):
+        # uint8 H x W x 3 arrays from clip_pixels() -> normalized embeddings,
+        # one batched inference
+        import numpy as np
+
+        batch = (np.stack(pixels).astype(np.float32) / 255.0 - self.mean) / self.std
+        batch = np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+        return _normalize(self.session.run([self.output_name], {self.input_name: batch})[0].astype(np.float32))
+
+    def tag(self, embeddings, max_keywords=15):
+        # [(category, confidence, keywords)] per embedding, keywords most
+        # similar first
+        import numpy as np
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        logits = 100.0 * embeddings @ self.categories.T
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        names = list(CATEGORY_MAP)
+        similarity = embeddings @ self.keyword_embeddings.T
+        count = min(max_keywords, similarity.shape[1])
+        top = np.argsort(-similarity, axis=1)[:, :count]
+        return [(names[int(p.argmax())], float(p.max()), [self.keyword_names[i] for i in row])
+                for p, row in zip(probabilities, top)]
@@ -0,0 +1,103 @@
+import io
+import math
+
+VIDEO_MODES = ("sharpest", "sheet")
+
+
+def probe_duration(file_path):
+    import ffmpeg
+
+    info = ffmpeg.probe(file_path)
+    duration = info.get("format", {}).get("duration")
+    if duration is None:
+        video = next((s for s in info.get("streams", []) if s.get("codec_type") == "video"), {})
+        duration = video.get("duration")
+    return float(duration) if duration else 0.0
+
+
+def grab_keyframe(file_path, timestamp, size):
+    # Input-side seek to the nearest keyframe at or before `timestamp`, with
+    # every non-key frame skipped by the decoder: one I-frame decoded per
+    # sample however long the GOP is. Scaled down by ffmpeg before it reaches
+    # Python.
+    import ffmpeg
+    from PIL import Image
+
+    out, _ = (
+        ffmpeg
+        .input(file_path, ss=f"{timestamp:.3f}", skip_frame="nokey", noaccurate_seek=None)
+        .output("pipe:", vframes=1, format="image2pipe", vcodec="bmp",
+                vf=f"scale='min({size},iw)':'min({size},ih)':force_original_aspect_ratio=decrease")
+        .run(capture_stdout=True, capture_stderr=True, quiet=True)
+    )
+    if not out:
+        return None
+    img = Image.open(io.BytesIO(out))
+    img.load()
+    return img
+
+
+def sample_keyframes(file_path, count=5, size=1024):
+    # Keyframes spread evenly over the clip, avoiding the first and last
+    # moments where fades to black usually sit
+    duration = probe_duration(file_path)
+    if duration <= 0:
+        timestamps = [0.0]
+    else:
+        timestamps = [duration * (i + 0.5) / count for i in range(count)]
+    frames = []
+    seen = set()
+    for timestamp in timestamps:
+        frame = grab_keyframe(file_path, timestamp, size)
+        if frame is None:
+            continue
+        # Short GOP-less clips snap several timestamps to the same keyframe
+        key = frame.tobytes()[:4096]
+        if key not in seen:
+            seen.add(key)
+            frames.append(frame)
+    return frames
+
+
+def sharpness(img):
+    # Variance of a 4-neighbour Laplacian on a small grayscale copy. Black,
+    # faded and motion-blurred frames score near zero.
+    import numpy as np
+
+    gray = img.convert("L")
+    gray.thumbnail((256, 256))
+    a = np.asarray(gray, dtype=np.float32)
+    if a.shape[0] < 3 or a.shape[1] < 3:
+        return 0.0
+    laplacian = a[:-2, 1:-1] + a[2:, 1:-1] + a[1:-1, :-2] + a[1:-1, 2:] - 4 * a[1:-1, 1:-1]
+    return float(laplacian.var())
+
+
+def contact_sheet(frames, size=1024):
+    # Frames tiled in a grid that fits within size x size
+    from PIL import Image
+
+    columns = math.ceil(math.sqrt(len(frames)))
+    rows = math.ceil(len(frames) / columns)
+    aspect = frames[0].width / frames[0].height
+    cell_w = size // columns
+    cell_h = max(1, min(size // rows, round(cell_w / aspect)))
+    sheet = Image.new("RGB", (cell_w * columns, cell_h * rows), (0, 0, 0))
+    for i, frame in enumerate(frames):
+        tile = frame.convert("RGB")
+        tile.thumbnail((cell_w, cell_h))
+        x = (i % columns) * cell_w + (cell_w - tile.width) // 2
+        y = (i // columns) * cell_h + (cell_h - tile.height) // 2
+        sheet.paste(tile, (x, y))
+    return sheet
+
+
+def read_video_keyframes(file_path, size=1024, mode="sharpest", count=5):
+    # The image to describe for a clip: its sharpest sampled keyframe, or a
+    # contact sheet of all of them. None if ffmpeg produced no frame.
+    frames = sample_keyframes(file_path, count, size)
+    if not frames:
+        return None
+    if mode == "sheet" and len(frames) > 1:
+        return contact_sheet(frames, size)
+    return max(frames, key=sharpness)
@@ -0,0 +1,184 @@
+import os
+import time
+import queue
+import threading
+
+from kyugen.scan import MEDIA_EXTENSIONS, iter_media_files
+
+
+def _identity(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+# Long-running source of input files for MetadataEngine.run(). Files already
+# in the folder come first, then new arrivals as they are reported by
+# filesystem events (watchdog: inotify, FSEvents, ReadDirectoryChangesW), or
+# by polling when watchdog isn't installed or can't watch the folder. Polling
+# only re-lists directories whose mtime changed, so huge trees aren't
+# rescanned. A file is handed out once its size and mtime have stayed the
+# same for `settle` seconds, i.e. once whatever is copying it is done.
+# Processed files are moved out of the folder by the engine; a new file that
+# shows up under the same name later is picked up again.
+class FolderWatcher:
+    TICK = 0.25
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(self, input_path, settle=2.0, poll_interval=5.0, extensions=MEDIA_EXTENSIONS, ignore=(),
+                 use_events=True):
+        self.input_path = os.path.abspath(input_path)
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.extensions = extensions
+        self.ignore = [os.path.abspath(p) + os.sep for p in ignore if p]
+        self.use_events = use_events
+        self.events = queue.SimpleQueue()
+        self.closed = threading.Event()
+        self.candidates = {}
+        self.handed_out = {}
+        self.dir_mtimes = {}
+        self.observer = None
+
+    def close(self):
+        # Stops handing out files; the generator returns at its next tick
+        self.closed.set()
+
+    def _wanted(self, path):
+        name = os.path.basename(path)
+        if name.startswith(".") or not name.lower().endswith(self.extensions):
+            return False
+        if not path.startswith(self.input_path + os.sep):
+            # Moved out of the folder
+            return False
+        return not any(path.startswith(prefix) for prefix in self.ignore)
+
+    def _touch(self, path):
+        if not self._wanted(path) or path in self.candidates:
+            return
+        try:
+            identity = _identity(path)
+        except OSError:
+            return
+        if self.handed_out.get(path) == identity:
+            return
+        self.candidates[path] = (identity, time.monotonic())
+
+    def _start_events(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            print("[WATCH] watchdog is not installed; polling for new files")
+            return False
+
+        events = self.events
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                path = getattr(event, "dest_path", "") or event.src_path
+                events.put(os.fsdecode(path))
+
+        observer = Observer()
+        try:
+            observer.schedule(Handler(), self.input_path, recursive=True)
+            observer.start()
+        except OSError as e:
+            # e.g. inotify watch limit reached, or a network share
+            print(f"[WATCH] Cannot watch {self.input_path} for events ({e}); polling instead")
+            return False
+        self.observer = observer
+        return True
+
+    def _list(self, directory):
+        # Lists one directory for polling; new subdirectories are listed
+        # right away
+        try:
+            self.dir_mtimes[directory] = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            self.dir_mtimes.pop(directory, None)
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path not in self.dir_mtimes:
+                        self._list(entry.path)
+                elif entry.is_file():
+                    self._touch(entry.path)
+            except OSError:
+                continue
+
+    def _poll(self):
+        for directory, mtime in list(self.dir_mtimes.items()):
+            try:
+                changed = os.stat(directory).st_mtime_ns != mtime
+            except OSError:
+                self.dir_mtimes.pop(directory, None)
+                continue
+            if changed:
+                self._list(directory)
+
+    def _ready(self):
+        # Candidates whose size and mtime haven't changed for `settle`
+        # seconds; only those due for a check are stat'ed
+        now = time.monotonic()
+        ready = []
+        for path, (identity, since) in list(self.candidates.items()):
+            if now - since < self.settle:
+                continue
+            try:
+                current = _identity(path)
+            except OSError:
+                del self.candidates[path]
+                continue
+            if current == identity:
+                del self.candidates[path]
+                self.handed_out[path] = current
+                ready.append(path)
+            else:
+                self.candidates[path] = (current, now)
+        return sorted(ready)
+
+    def _prune(self):
+        # Forget files that have since been moved out of the folder
+        for path in list(self.handed_out):
+            if not os.path.exists(path):
+                del self.handed_out[path]
+
+    def __iter__(self):
+        return self.iter_files()
+
+    def iter_files(self, stop_flag_func=None):
+        events = self.use_events and self._start_events()
+        if events:
+            for path in iter_media_files(self.input_path, self.extensions):
+                self._touch(path)
+        else:
+            self._list(self.input_path)
+        print(f"[WATCH] Watching {self.input_path} ({'events' if events else 'polling'}); "
+              f"{len(self.candidates)} files waiting")
+        last_poll = last_prune = time.monotonic()
+        try:
+            while not self.closed.is_set() and not (stop_flag_func and stop_flag_func()):
+                while True:
+                    try:
+                        self._touch(self.events.get_nowait())
+                    except queue.Empty:
+                        break
+                now = time.monotonic()
+                if not events and now - last_poll >= self.poll_interval:
+                    self._poll()
+                    last_poll = now
+                if now - last_prune >= self.PRUNE_INTERVAL:
+                    self._prune()
+                    last_prune = now
+                yield from self._ready()
+                self.closed.wait(self.TICK)
+        finally:
+            if self.observer:
+                self.observer.stop()
+                self.observer.join()
+                self.observer = None
@@ -1,275 +1,97 @@
 import sys
 import json
-import time
 import os
-import csv
-import re
-import datetime
-import tempfile
-import shutil
+import multiprocessing
+from collections import deque
 from datetime import datetime
-from PIL import Image, EpsImagePlugin
-from PIL.ExifTags import TAGS
-import pandas as pd
-import cv2
-from pathlib import Path
-import google.generativeai as genai
-import ffmpeg
-import subprocess
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                            QLabel, QLineEdit, QPushButton, QComboBox, QSpinBox, QProgressBar,
-                           QFileDialog, QGridLayout, QMessageBox)
-from PyQt5.QtCore import Qt, QThreadPool, QRunnable, pyqtSignal, QObject
+                           QFileDialog, QGridLayout, QMessageBox, QCheckBox, QScrollArea, QSizeGrip)
+from PyQt5.QtCore import Qt, QThreadPool, QRunnable, QTimer, pyqtSignal, QObject
 from PyQt5.QtGui import QIcon, QFont
-from threading import Lock
-
-# Define available Gemini models
-GEMINI_MODELS = [
-    "gemini-2.0-flash", "gemini-2.5-pro-exp-03-25", "gemini-2.0-pro",
-    "gemini-2.0-flash-lite", "gemini-1.5-pro", "gemini-1.5-flash", "gemini-1.5-flash-8b"
-]
-
-# Category mapping for Adobe Stock
-CATEGORY_MAP = {
-    "Animals": "1",
-    "Architecture": "2",
-    "Backgrounds/Textures": "3",
-    "Beauty/Fashion": "4",
-    "Business": "5",
-    "Food & Drink": "6",
-    "Healthcare/Medical": "7",
-    "Holidays": "8",
-    "Industrial": "9",
-    "Interiors": "10",
-    "Miscellaneous": "11",
-    "Nature": "12",
-    "Objects": "13",
-    "Parks/Outdoor": "14",
-    "People": "15",
-    "Religion": "16",
-    "Science": "17",
-    "Signs/Symbols": "18",
-    "Sports/Recreation": "19",
-    "Technology": "20",
-    "The Arts": "21",
-    "Transportation": "22",
-    "Travel": "23",
-    "Vectors": "24"
-}
+from kyugen.client import ApiConnectionError
+from kyugen.engine import GEMINI_MODELS, MetadataEngine, load_config
+from kyugen.exporters import EXPORTERS
+
+MAX_THREAD_WORKERS = 10
+MAX_ASYNC_WORKERS = 500
 
 class WorkerSignals(QObject):
     finished = pyqtSignal(str)
     error = pyqtSignal(str)
     progress = pyqtSignal(int)
-    done = pyqtSignal(int)
+    scanned = pyqtSignal(int, bool)
+    summary = pyqtSignal(object)
 
-class FileProcessor(QRunnable):
-    def __init__(self, index, total, filename, input_path, output_path, api_key, model,
-                 max_title, max_keywords, custom_keywords, delay, lock, csv_path, stop_flag_func):
+class BatchRunner(QRunnable):
+    # Runs a whole MetadataEngine batch off the GUI thread; the engine owns the
+    # per-file worker threads and reports back through Qt signals.
+    def __init__(self, engine):
         super().__init__()
-        self.index = index
-        self.total = total
-        self.filename = filename
-        self.input_path = input_path
-        self.output_path = output_path
-        self.api_key = api_key
-        self.model = model
-        self.max_title = max_title
-        self.max_keywords = max_keywords
-        self.custom_keywords = custom_keywords
-        self.delay = delay
-        self.lock = lock
-        self.csv_path = csv_path
-        self.stop_flag_func = stop_flag_func
+        self.engine = engine
         self.signals = WorkerSignals()
 
-    def extract(self, label, result):
-        pattern = rf"{label}\s*(.*)"
-        match = re.search(pattern, result)
-        return match.group(1).strip() if match else ""
-
-    def describe_image(self, image_path):
-        try:
-            genai.configure(api_key=self.api_key)
-            g_model = genai.GenerativeModel(self.model)
-
-            with open(image_path, "rb") as f:
-                image_data = f.read()
-
-            prompt_parts = [
-                f"""Describe this image with the following format:
-Title: Describe the image in clear, detailed terms, focusing on the main subject, setting, and defining features. Avoid general themes or vague labels. Avoid assumptions or inferred meanings—only describe visible, tangible elements. Do not start with 'This image contains...'. Keep the response informative but concise, Stay under {self.max_title} characters.
-Keywords: A comma-separated list of {self.max_keywords} relevant single-word keywords. Avoid copyrighted words."""
-            ]
-            if self.custom_keywords:
-                prompt_parts.append(f"Ensure these keywords are included in the list: {self.custom_keywords}.")
-            
-            prompt_parts.append(f"""Category: The most relevant category from the following list: {', '.join(CATEGORY_MAP.keys())}.
-Do not include anything except the exact formatted result.""")
-
-            prompt = "\n".join(prompt_parts)
-
-            response = g_model.generate_content([
-                {"inline_data": {"mime_type": "image/png", "data": image_data}},
-                prompt
-            ])
-            result = response.text.strip()
-            return self.extract("Title:", result), self.extract("Keywords:", result), self.extract("Category:", result)
-        except Exception as e:
-            print(f"[GEMINI ERROR] {e}")
-            return "", "", ""
-
     def run(self):
-        if self.stop_flag_func():
-            self.signals.done.emit(0)
-            return
-
-        image_path = os.path.join(self.input_path, self.filename)
-        ext = os.path.splitext(image_path)[1].lower()
-        temp_dir = os.path.join(self.output_path, "__temp")
-        os.makedirs(temp_dir, exist_ok=True)
-
-        original_image_path = image_path
-
         try:
-            if ext in [".mp4", ".mov"]:
-                cap = cv2.VideoCapture(image_path)
-                frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                middle_frame = frame_count // 2
-                cap.set(cv2.CAP_PROP_POS_FRAMES, middle_frame)
-                success, frame = cap.read()
-                cap.release()
-                if success:
-                    tmp_img = os.path.join(temp_dir, f"thumb_{self.index}.jpg")
-                    Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)).save(tmp_img)
-                    image_path = tmp_img
-                else:
-                    print(f"[VIDEO ERROR] Could not read frame from {self.filename}")
-                    error_folder = os.path.join(self.output_path, "Error")
-                    os.makedirs(error_folder, exist_ok=True)
-                    shutil.move(original_image_path, os.path.join(error_folder, self.filename))
-                    self.signals.done.emit(1)
-                    return
-
-            elif ext == ".eps":
-                gs_local = os.path.join(os.path.dirname(sys.argv[0]), "gswin64c.exe")
-                os.environ["GHOSTSCRIPT_PATH"] = gs_local
-                EpsImagePlugin.gs_windows_binary = gs_local
-                png_path = os.path.join(temp_dir, f"eps_{self.index}.png")
-                try:
-                    Image.open(image_path).save(png_path, "PNG")
-                    image_path = png_path
-                except Exception as e:
-                    print(f"[EPS ERROR] {self.filename}: {e}")
-                    error_folder = os.path.join(self.output_path, "Error")
-                    os.makedirs(error_folder, exist_ok=True)
-                    shutil.move(original_image_path, os.path.join(error_folder, self.filename))
-                    self.signals.done.emit(1)
-                    return
-
-            if ext in [".jpg", ".jpeg", ".png"]:
-                img = Image.open(image_path).convert("RGB")
-                img.thumbnail((1024, 1024))
-                resized_path = os.path.join(temp_dir, f"resize_{self.index}.jpg")
-                img.save(resized_path, "JPEG", quality=85)
-                image_path = resized_path
-
-            title, keyword_text, category_text = self.describe_image(image_path)
-
-            if not title or not keyword_text or not category_text:
-                print(f"[ERROR] Empty metadata for {self.filename}, moving to Error folder.")
-                error_folder = os.path.join(self.output_path, "Error")
-                os.makedirs(error_folder, exist_ok=True)
-                shutil.move(original_image_path, os.path.join(error_folder, self.filename))
-                self.signals.done.emit(1)
-                return
-
-            keywords = [k.strip() for k in re.split(r"[\s,;]+", keyword_text) if len(k.strip().split()) == 1]
-            
-            if self.custom_keywords:
-                custom_kw_list = [k.strip() for k in re.split(r"[\s,;]+", self.custom_keywords) if k.strip()]
-                combined_keywords = []
-                seen_keywords = set()
-                for kw in custom_kw_list:
-                    if kw.lower() not in seen_keywords:
-                        combined_keywords.append(kw)
-                        seen_keywords.add(kw.lower())
-                for kw in keywords:
-                    if kw.lower() not in seen_keywords:
-                        combined_keywords.append(kw)
-                        seen_keywords.add(kw.lower())
-                keywords = combined_keywords
-            
-            keywords = sorted(set(keywords), key=lambda x: keyword_text.lower().find(x.lower()))[:self.max_keywords]
-            keywords = ", ".join(keywords)
-
-            category_id = ""
-            for cat, cid in CATEGORY_MAP.items():
-                if cat.lower() in category_text.lower():
-                    category_id = cid
-                    break
-
-            date_prefix = datetime.now().strftime("%Y%m%d")
-            safe_title = re.sub(r'[^\w\s]', '', title)
-            safe_title = "_".join(safe_title.split())[:self.max_title] or "untitled"
-            new_filename = f"{date_prefix}_{safe_title}{os.path.splitext(self.filename)[1]}"
-
-            counter = 1
-            while os.path.exists(os.path.join(self.output_path, new_filename)):
-                new_filename = f"{date_prefix}_{safe_title}_{counter}{os.path.splitext(self.filename)[1]}"
-                counter += 1
-
-            final_path = os.path.join(self.output_path, new_filename)
-
-            shutil.move(original_image_path, final_path)
-
-            with self.lock:
-                with open(self.csv_path, mode="a", newline="", encoding="utf-8") as file:
-                    writer = csv.writer(file)
-                    if file.tell() == 0:
-                        writer.writerow(["Filename", "Title", "Keywords", "Category", "Releases"])
-                    clean_title = re.sub(r'[^\w\s]', '', title)
-                    writer.writerow([new_filename, clean_title, keywords, category_id, ""])
-
+            self.signals.summary.emit(self.engine.run())
+        except ApiConnectionError as e:
+            self.signals.error.emit(f"{e}\nPlease check your API key and internet connection.")
         except Exception as e:
-            print(f"[ERROR] Failed to process {self.filename}: {e}")
-            error_folder = os.path.join(self.output_path, "Error")
-            os.makedirs(error_folder, exist_ok=True)
-            if os.path.exists(original_image_path):
-                shutil.move(original_image_path, os.path.join(error_folder, self.filename))
+            print(f"[ERROR] Batch failed: {e}")
+            self.signals.error.emit(str(e))
         finally:
-            if os.path.exists(image_path) and image_path.startswith(temp_dir):
-                os.remove(image_path)
-            
-            self.signals.done.emit(1)
-
-            if self.delay > 0:
-                time.sleep(self.delay)
+            self.engine.close()
+            self.signals.finished.emit("")
 
 class MetadataApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.thread_pool = QThreadPool()
-        self.processors = []
+        self.signals = WorkerSignals()
+        self.signals.scanned.connect(self.update_scan)
+        # Finished files are queued by engine threads (or the async
+        # dispatcher) and drained on the GUI thread a few times a second, so
+        # hundreds of results per second don't flood the event loop
+        self.finished_files = deque()
+        self.progress_timer = QTimer(self)
+        self.progress_timer.timeout.connect(self.drain_finished)
+        self.processed = 0
+        self.found = 0
+        self.scanning = False
         self.drag_position = None
-        self.csv_lock = Lock()
         self.stop_flag = False
+        self.engine = None
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.update_stats)
         self.initUI()
         self.load_config()
 
     def initUI(self):
         self.setWindowFlags(Qt.FramelessWindowHint)
-        self.setFixedSize(800, 600)
+        self.resize(800, 720)
+        self.setMinimumSize(640, 480)
         
         # Main widget and layout
         main_widget = QWidget()
         self.setCentralWidget(main_widget)
-        layout = QVBoxLayout(main_widget)
-        layout.setContentsMargins(10, 10, 10, 10)
+        window_layout = QVBoxLayout(main_widget)
+        window_layout.setContentsMargins(10, 10, 10, 10)
         
         # Add title bar
         title_bar = TitleBar(self)
-        layout.addWidget(title_bar)
+        window_layout.addWidget(title_bar)
+        
+        # The form scrolls when the window is too small for all its rows
+        form = QWidget()
+        scroll = QScrollArea()
+        scroll.setWidgetResizable(True)
+        scroll.setFrameShape(QScrollArea.NoFrame)
+        scroll.setWidget(form)
+        window_layout.addWidget(scroll)
+        # Frameless windows have no border to drag; resize from the corner
+        window_layout.addWidget(QSizeGrip(main_widget), 0, Qt.AlignBottom | Qt.AlignRight)
+        layout = QVBoxLayout(form)
+        layout.setContentsMargins(0, 0, 0, 0)
         
         # API Key section
         api_layout = QHBoxLayout()
@@ -304,6 +126,18 @@ class MetadataApp(QMainWindow):
         api_layout.addWidget(self.toggle_visibility)
         api_layout.addWidget(save_config)
         layout.addLayout(api_layout)
+
+        # More keys (other projects, each with its own quota); requests are
+        # spread over all of them
+        extra_keys_layout = QHBoxLayout()
+        self.extra_keys_input = QLineEdit()
+        self.extra_keys_input.setEchoMode(QLineEdit.Password)
+        self.extra_keys_input.setPlaceholderText("Optional: more API keys, comma-separated (KEY or KEY@model)")
+        extra_keys_layout.addWidget(QLabel("Extra Keys:"))
+        extra_keys_layout.addWidget(self.extra_keys_input)
+        layout.addLayout(extra_keys_layout)
+        # Entries with their own limits only exist in config.json; kept as-is
+        self.keyed_entries = []
         
         # Model selection
         model_layout = QHBoxLayout()
@@ -362,17 +196,63 @@ class MetadataApp(QMainWindow):
         
         # Workers
         self.workers_spin = QSpinBox()
-        self.workers_spin.setRange(1, 10)
+        self.workers_spin.setRange(1, MAX_THREAD_WORKERS)
         self.workers_spin.setValue(1)
         params_grid.addWidget(QLabel("Workers:"), 1, 0)
         params_grid.addWidget(self.workers_spin, 1, 1)
         
-        # Delay
-        self.delay_spin = QSpinBox()
-        self.delay_spin.setRange(1, 60)
-        self.delay_spin.setValue(6)
-        params_grid.addWidget(QLabel("Delay (s):"), 1, 2)
-        params_grid.addWidget(self.delay_spin, 1, 3)
+        # Rate limits, shared by all workers
+        self.rpm_spin = QSpinBox()
+        self.rpm_spin.setRange(1, 100000)
+        self.rpm_spin.setValue(15)
+        params_grid.addWidget(QLabel("Requests/min:"), 1, 2)
+        params_grid.addWidget(self.rpm_spin, 1, 3)
+
+        self.tpm_spin = QSpinBox()
+        self.tpm_spin.setRange(0, 100000000)
+        self.tpm_spin.setSingleStep(10000)
+        self.tpm_spin.setSpecialValueText("Unlimited")
+        self.tpm_spin.setValue(1000000)
+        params_grid.addWidget(QLabel("Tokens/min:"), 2, 0)
+        params_grid.addWidget(self.tpm_spin, 2, 1)
+
+        # Marketplace CSVs, all written from the same results
+        export_layout = QHBoxLayout()
+        self.export_checks = {}
+        for name, exporter in EXPORTERS.items():
+            check = QCheckBox(exporter.label)
+            check.setChecked(name == "adobe")
+            self.export_checks[name] = check
+            export_layout.addWidget(check)
+        params_grid.addWidget(QLabel("Export CSV:"), 3, 0)
+        params_grid.addLayout(export_layout, 3, 1, 1, 3)
+
+        self.embed_check = QCheckBox("Embed title and keywords in files (XMP/IPTC)")
+        params_grid.addWidget(self.embed_check, 4, 1, 1, 3)
+
+        self.incremental_check = QCheckBox("Only new or changed files (skip ones already done)")
+        params_grid.addWidget(self.incremental_check, 5, 1, 1, 3)
+
+        # One event loop instead of a thread per request; lifts the workers
+        # ceiling to what a paid-tier quota allows
+        self.async_check = QCheckBox("Async dispatch (many requests in flight)")
+        self.async_check.toggled.connect(self.update_workers_range)
+        params_grid.addWidget(self.async_check, 6, 1, 1, 3)
+
+        # Keeps running and picks up files as they are copied into the input
+        # folder, until Stop is pressed
+        self.watch_check = QCheckBox("Watch input folder for new files")
+        params_grid.addWidget(self.watch_check, 7, 1, 1, 3)
+
+        # Blurred, black/white or too small images go to Rejected/ without
+        # using any quota
+        self.quality_check = QCheckBox("Reject blurred, dark or low-resolution images before describing")
+        params_grid.addWidget(self.quality_check, 8, 1, 1, 3)
+
+        # Other machines running in cluster mode on the same folders take
+        # their share of the files; CSVs are merged when each run ends
+        self.cluster_check = QCheckBox("Share input and output folders with other machines (cluster)")
+        params_grid.addWidget(self.cluster_check, 9, 1, 1, 3)
         
         layout.addLayout(params_grid)
         
@@ -383,6 +263,11 @@ class MetadataApp(QMainWindow):
         
         self.progress_bar = QProgressBar()
         layout.addWidget(self.progress_bar)
+
+        # Live throughput, latency and error rate from the engine's metrics
+        self.stats_label = QLabel("")
+        self.stats_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.stats_label)
         
         # Start/Stop buttons
         button_layout = QHBoxLayout()
@@ -454,9 +339,15 @@ class MetadataApp(QMainWindow):
             QMainWindow {
                 background-color: #1A3333;
             }
+            QScrollArea, QScrollArea > QWidget > QWidget {
+                background: transparent;
+            }
             QLabel {
                 color: #FF8C69;
             }
+            QCheckBox {
+                color: white;
+            }
             QLineEdit, QComboBox, QSpinBox {
                 background-color: #1F4040;
                 color: white;
@@ -489,9 +380,11 @@ class MetadataApp(QMainWindow):
     def toggle_api_key_visibility(self):
         if self.api_key_input.echoMode() == QLineEdit.Password:
             self.api_key_input.setEchoMode(QLineEdit.Normal)
+            self.extra_keys_input.setEchoMode(QLineEdit.Normal)
             self.toggle_visibility.setText("🔒")
         else:
             self.api_key_input.setEchoMode(QLineEdit.Password)
+            self.extra_keys_input.setEchoMode(QLineEdit.Password)
             self.toggle_visibility.setText("👁️")
 
     def browse_input(self):
@@ -504,19 +397,40 @@ class MetadataApp(QMainWindow):
         if folder:
             self.output_path_input.setText(folder)
 
-    def save_config(self):
-        config = {
+    def current_config(self):
+        return {
             'api_key': self.api_key_input.text(),
+            'api_keys': [k.strip() for k in self.extra_keys_input.text().split(",") if k.strip()]
+                        + self.keyed_entries,
             'model': self.model_combo.currentText(),
             'input_path': self.input_path_input.text(),
             'output_path': self.output_path_input.text(),
             'max_title_length': self.title_length_spin.value(),
             'max_keywords': self.max_keywords_spin.value(),
             'workers': self.workers_spin.value(),
-            'delay': self.delay_spin.value(),
+            'rpm': self.rpm_spin.value(),
+            'tpm': self.tpm_spin.value(),
+            'exporters': [name for name, check in self.export_checks.items() if check.isChecked()],
+            'embed_metadata': self.embed_check.isChecked(),
+            'incremental': self.incremental_check.isChecked(),
+            'dispatch': 'async' if self.async_check.isChecked() else 'thread',
+            'watch': self.watch_check.isChecked(),
+            'quality_filter': self.quality_check.isChecked(),
+            'cluster': self.cluster_check.isChecked(),
             'custom_keywords': self.custom_keywords_input.text()
         }
+
+    def full_config(self):
+        # config.json with the widgets' values on top, so settings that have
+        # no widget (batch_size, preprocess_backend, local_model_dir, ...)
+        # reach the engine and survive a save
+        config = load_config('config.json')
+        config.update(self.current_config())
+        return config
+
+    def save_config(self):
         try:
+            config = self.full_config()
             with open('config.json', 'w') as f:
                 json.dump(config, f)
             QMessageBox.information(self, "Success", "Configuration saved successfully!")
@@ -525,21 +439,29 @@ class MetadataApp(QMainWindow):
 
     def load_config(self):
         try:
-            with open('config.json', 'r') as f:
-                config = json.load(f)
-                self.api_key_input.setText(config.get('api_key', ''))
-                index = self.model_combo.findText(config.get('model', ''))
-                if index >= 0:
-                    self.model_combo.setCurrentIndex(index)
-                self.input_path_input.setText(config.get('input_path', ''))
-                self.output_path_input.setText(config.get('output_path', ''))
-                self.title_length_spin.setValue(config.get('max_title_length', 120))
-                self.max_keywords_spin.setValue(config.get('max_keywords', 49))
-                self.workers_spin.setValue(config.get('workers', 1))
-                self.delay_spin.setValue(config.get('delay', 6))
-                self.custom_keywords_input.setText(config.get('custom_keywords', ''))
-        except FileNotFoundError:
-            pass
+            config = load_config('config.json')
+            self.api_key_input.setText(config['api_key'])
+            self.extra_keys_input.setText(", ".join(k for k in config['api_keys'] if isinstance(k, str)))
+            self.keyed_entries = [k for k in config['api_keys'] if not isinstance(k, str)]
+            index = self.model_combo.findText(config['model'])
+            if index >= 0:
+                self.model_combo.setCurrentIndex(index)
+            self.input_path_input.setText(config['input_path'])
+            self.output_path_input.setText(config['output_path'])
+            self.title_length_spin.setValue(config['max_title_length'])
+            self.max_keywords_spin.setValue(config['max_keywords'])
+            self.async_check.setChecked(config['dispatch'] == 'async')
+            self.workers_spin.setValue(config['workers'])
+            self.rpm_spin.setValue(config['rpm'])
+            self.tpm_spin.setValue(config['tpm'])
+            for name, check in self.export_checks.items():
+                check.setChecked(name in config['exporters'])
+            self.embed_check.setChecked(config['embed_metadata'])
+            self.incremental_check.setChecked(config['incremental'])
+            self.watch_check.setChecked(config['watch'])
+            self.quality_check.setChecked(config['quality_filter'])
+            self.cluster_check.setChecked(config['cluster'])
+            self.custom_keywords_input.setText(config['custom_keywords'])
         except Exception as e:
             QMessageBox.warning(self, "Warning", f"Error loading configuration: {str(e)}")
 
@@ -552,6 +474,10 @@ class MetadataApp(QMainWindow):
             QMessageBox.warning(self, "Warning", "Please enter your Gemini API key!")
             return
 
+        if not any(check.isChecked() for check in self.export_checks.values()):
+            QMessageBox.warning(self, "Warning", "Please select at least one marketplace to export!")
+            return
+
         if not os.path.exists(self.input_path_input.text()):
             QMessageBox.warning(self, "Warning", "Input folder does not exist!")
             return
@@ -564,76 +490,123 @@ class MetadataApp(QMainWindow):
                 return
 
         try:
-            genai.configure(api_key=self.api_key_input.text())
-            model = genai.GenerativeModel(self.model_combo.currentText())
-            test_response = model.generate_content("Test connection")
-            if not test_response or not test_response.text:
-                raise Exception("Could not connect to Gemini API")
+            config = self.full_config()
         except Exception as e:
-            QMessageBox.critical(self, "API Error", f"Could not initialize Gemini API: {str(e)}\nPlease check your API key and internet connection.")
+            QMessageBox.critical(self, "Error", f"Could not read config.json: {str(e)}")
             return
 
         self.start_button.setEnabled(False)
         self.stop_button.setEnabled(True)
         self.stop_flag = False
 
-        # Get list of media files
-        media_files = []
-        for root, _, files in os.walk(self.input_path_input.text()):
-            for file in files:
-                if file.lower().endswith(tuple(['.jpg', '.jpeg', '.png', '.eps', '.mov', '.mp4'])):
-                    media_files.append(os.path.join(root, file))
-
-        if not media_files:
-            QMessageBox.warning(self, "Warning", "No supported media files found in the input folder!")
-            self.start_button.setEnabled(True)
-            self.stop_button.setEnabled(False)
-            return
-
-        total_files = len(media_files)
+        # Files are discovered and processed at the same time; the total
+        # grows while the input folder is being scanned.
+        self.processed = 0
+        self.found = 0
+        self.scanning = True
+        self.progress_bar.setMaximum(0)
         self.progress_bar.setValue(0)
-        self.progress_bar.setMaximum(total_files)
-        self.progress_label.setText(f"Processing: 0/{total_files}")
-
-        csv_path = os.path.join(self.output_path_input.text(), 'metadata_export.csv')
-
-        for i, media_file in enumerate(media_files):
-            if self.stop_flag:
-                break
-
-            processor = FileProcessor(
-                i + 1, total_files,
-                os.path.basename(media_file),
-                os.path.dirname(media_file),
-                self.output_path_input.text(),
-                self.api_key_input.text(),
-                self.model_combo.currentText(),
-                self.title_length_spin.value(),
-                self.max_keywords_spin.value(),
-                self.custom_keywords_input.text(),
-                self.delay_spin.value(),
-                self.csv_lock,
-                csv_path,
-                lambda: self.stop_flag
-            )
-
-            processor.signals.done.connect(self.update_progress)
-            self.thread_pool.start(processor)
+        self.progress_label.setText("Scanning...")
+
+        engine = MetadataEngine(
+            config,
+            on_file_done=self.finished_files.append,
+            stop_flag_func=lambda: self.stop_flag,
+            on_scan_progress=lambda found, finished: self.signals.scanned.emit(found, finished)
+        )
+        self.engine = engine
+        self.stats_label.setText("")
+        self.stats_timer.start(1000)
+        self.progress_timer.start(100)
+        runner = BatchRunner(engine)
+        runner.signals.finished.connect(self.processing_finished)
+        runner.signals.error.connect(self.processing_error)
+        runner.signals.summary.connect(self.processing_summary)
+        self.thread_pool.start(runner)
+
+    def update_scan(self, found, finished):
+        self.found = found
+        self.scanning = not finished
+        if found:
+            self.progress_bar.setMaximum(found)
+            self.progress_bar.setValue(self.processed)
+        self.update_progress(0)
+
+    def update_workers_range(self, async_dispatch):
+        self.workers_spin.setMaximum(MAX_ASYNC_WORKERS if async_dispatch else MAX_THREAD_WORKERS)
+
+    def drain_finished(self):
+        done = 0
+        while self.finished_files:
+            result = self.finished_files.popleft()
+            if result.status != "skipped":
+                done += 1
+        if done:
+            self.update_progress(done)
 
     def update_progress(self, progress):
-        current = self.progress_bar.value() + progress
-        self.progress_bar.setValue(current)
-        total = self.progress_bar.maximum()
-        self.progress_label.setText(f"Processing: {current}/{total}")
+        self.processed += progress
+        self.progress_bar.setValue(self.processed)
+        more = "+" if self.scanning else ""
+        self.progress_label.setText(f"Processing: {self.processed}/{self.found}{more}")
 
-        if current >= total:
-            self.start_button.setEnabled(True)
-            self.stop_button.setEnabled(False)
-            QMessageBox.information(self, "Complete", "Processing completed successfully!")
+    def update_stats(self):
+        if self.engine is None:
+            return
+        snap = self.engine.metrics.snapshot()
+        self.stats_label.setText(
+            f"{snap['files_per_min']:.1f} files/min  |  latency p50 {snap['p50']:.1f}s, "
+            f"p95 {snap['p95']:.1f}s  |  errors {snap['error_rate']:.1%}  |  API calls {snap['api_calls']}"
+            + (f"  |  keys {sum(k['available'] for k in snap['keys'].values())}/{len(snap['keys'])}"
+               if len(snap['keys']) > 1 else ""))
+
+    def processing_summary(self, counts):
+        quota_reset = self.engine.quota_reset if self.engine is not None else None
+        csv_failures = self.engine.csv_failures if self.engine is not None else 0
+        if csv_failures:
+            QMessageBox.warning(self, "CSV not written",
+                                f"{csv_failures} CSV rows could not be written to the output folder. The files "
+                                f"were moved; their rows are written again on the next run.")
+        if quota_reset:
+            QMessageBox.warning(self, "Out of quota",
+                                f"Every API key is out of daily quota until "
+                                f"{datetime.fromtimestamp(quota_reset):%Y-%m-%d %H:%M}.\n"
+                                f"{counts['ok']} files were done; the remaining files are still in the input "
+                                f"folder. Start again after the reset.")
+        elif self.watch_check.isChecked():
+            # Stopped by the user; no dialogs for an unattended run
+            self.progress_label.setText(f"Stopped watching: {counts['ok']} done, {counts['error']} moved to Error"
+                                        + (f", {counts['unchanged']} unchanged" if counts["unchanged"] else ""))
+        elif not sum(counts.values()):
+            QMessageBox.warning(self, "Warning", "No supported media files found in the input folder!")
+        elif not self.stop_flag:
+            unchanged = counts["unchanged"]
+            QMessageBox.information(self, "Complete", "Processing completed successfully!" + (
+                f"\n{unchanged} files were left in the input folder: they are unchanged since an earlier run."
+                if unchanged else ""))
+
+    def processing_error(self, message):
+        QMessageBox.critical(self, "Error", message)
+
+    def processing_finished(self, _):
+        self.stats_timer.stop()
+        self.progress_timer.stop()
+        self.drain_finished()
+        self.update_stats()
+        self.engine = None
+        self.scanning = False
+        self.progress_bar.setMaximum(max(1, self.found))
+        self.start_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
 
     def stop_processing(self):
-        self.stop_flag = True
         self.stop_button.setEnabled(False)
+        if self.engine is not None and self.engine.watcher is not None:
+            # Stop taking new files but finish the ones already picked up
+            self.engine.stop_watching()
+            self.progress_label.setText("Stopping: finishing files in progress...")
+            return
+        self.stop_flag = True
         QMessageBox.information(self, "Stopping", "Processing will stop after current tasks complete...")
 
     def open_coffee(self):
@@ -688,6 +661,8 @@ class TitleBar(QWidget):
             event.accept()
 
 def main():
+    # The process-pool preprocessing backend needs this in frozen builds
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = MetadataApp()
     window.show()
@@ -16,9 +16,12 @@ pip install --only-binary :all: numpy==1.24.3
 pip install --only-binary :all: Pillow==10.2.0
 pip install --only-binary :all: pandas==2.2.0
 pip install --only-binary :all: PyQt5==5.15.10
-pip install --only-binary :all: google-generativeai==0.3.2
+pip install --only-binary :all: google-generativeai==0.8.3
 pip install --only-binary :all: ffmpeg-python==0.2.0
 pip install --only-binary :all: opencv-python==4.9.0.80
+pip install --only-binary :all: watchdog==4.0.0
+pip install --only-binary :all: onnxruntime==1.17.3
+pip install --only-binary :all: tokenizers==0.15.2
 
 echo Setup complete!
 echo Running the application...
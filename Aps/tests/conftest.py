@@ -0,0 +1,58 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Tests import the kyugen package from the application folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def folders(tmp_path):
+    # Input folder with six small JPEGs, and an empty output folder
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    input_path = tmp_path / "input"
+    output_path = tmp_path / "output"
+    input_path.mkdir()
+    output_path.mkdir()
+    for i in range(6):
+        pixels = rng.integers(0, 256, (8, 12, 3), dtype=np.uint8)
+        Image.fromarray(pixels).resize((600, 400)).save(input_path / f"img{i}.jpg")
+    return str(input_path), str(output_path)
+
+
+@pytest.fixture
+def run_engine(folders):
+    # run_engine(make_model=None, **config) -> (engine, counts, model calls):
+    # one full run over `folders` with a mock model per key, as the
+    # benchmark does
+    from kyugen.bench import MockGenerativeModel
+    from kyugen.client import GeminiSession
+    from kyugen.engine import MetadataEngine
+    from kyugen.keypool import KeyPool
+
+    input_path, output_path = folders
+
+    def run(make_model=None, **config):
+        config = dict({"api_key": "test-0", "model": "mock", "rpm": 0, "tpm": 0, "workers": 4,
+                       "preprocess_workers": 2, "input_path": input_path, "output_path": output_path}, **config)
+        engine = MetadataEngine(config)
+        models = []
+
+        def session_factory(api_key, model_name, own_client):
+            models.append(make_model() if make_model else MockGenerativeModel(latency=0.01, jitter=0))
+            return GeminiSession(api_key, model_name, engine.config["max_title_length"],
+                                 engine.config["max_keywords"], engine.config["custom_keywords"],
+                                 engine.config["structured_output"], model=models[-1])
+
+        engine.keys = KeyPool.from_config(engine.config, session_factory)
+        try:
+            counts = engine.run(check_connection=False)
+        finally:
+            engine.close()
+        return engine, counts, sum(model.calls for model in models)
+
+    return run
@@ -0,0 +1,36 @@
+import os
+
+from kyugen.bench import MockGenerativeModel, format_report, load_corpus, run_once
+
+SPEC = {"megapixels": (0.3,), "jpegs": 3, "pngs": 1, "videos": 0, "eps": 0, "seed": 7}
+
+
+def test_corpus_is_reproducible(tmp_path):
+    first = load_corpus(str(tmp_path / "a"), **SPEC)
+    second = load_corpus(str(tmp_path / "b"), **SPEC)
+    assert first["files"] == second["files"] and len(first["files"]) == 4
+    for name in first["files"]:
+        assert (tmp_path / "a" / name).read_bytes() == (tmp_path / "b" / name).read_bytes()
+    # Reused as long as the settings match
+    mtime = os.path.getmtime(tmp_path / "a" / first["files"][0])
+    assert load_corpus(str(tmp_path / "a"), **SPEC) == first
+    assert os.path.getmtime(tmp_path / "a" / first["files"][0]) == mtime
+
+
+def test_mock_answers_are_deterministic():
+    answers = {MockGenerativeModel(latency=0, seed=seed)._describe(b"image")["title"] for seed in (1, 2)}
+    assert len(answers) == 1
+
+
+def test_run_once_and_report(tmp_path):
+    manifest = load_corpus(str(tmp_path / "corpus"), **SPEC)
+    config = {"api_key": "benchmark-0", "api_keys": ["benchmark-1"], "model": "mock", "rpm": 0, "tpm": 0,
+              "workers": 2, "cache_enabled": False}
+    mock = {"latency": 0.01, "jitter": 0, "error_rate": 0, "rpm": 0, "seed": 1}
+    result = run_once(str(tmp_path / "corpus"), str(tmp_path / "work"), config, mock)
+    assert result["counts"]["ok"] == 4
+    assert result["api_calls"] == result["mock_calls"] == 4
+    assert not os.path.exists(tmp_path / "work")
+    report = format_report(manifest, [result])
+    assert "mock calls" in report.splitlines()[2]
+    assert report.splitlines()[3].split()[:3] == ["2", "4", "0"]
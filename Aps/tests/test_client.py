@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+genai = pytest.importorskip("google.generativeai")
+glm = pytest.importorskip("google.ai.generativelanguage")
+
+from kyugen.client import ApiConnectionError, GeminiSession
+
+
+class Sent(Exception):
+    # Raised by the fake transport instead of calling the API; carries the
+    # key the request went out with
+    pass
+
+
+def fake_client(created):
+    class Client:
+        def __init__(self, client_options=None, **kwargs):
+            self.api_key = client_options["api_key"]
+            created.append(self.api_key)
+
+        def generate_content(self, request, **kwargs):
+            raise Sent(self.api_key)
+
+    return Client
+
+
+def fake_async_client(created):
+    class AsyncClient:
+        def __init__(self, client_options=None, **kwargs):
+            self.api_key = client_options["api_key"]
+            created.append(self.api_key)
+
+        async def generate_content(self, request, **kwargs):
+            raise Sent(self.api_key)
+
+    return AsyncClient
+
+
+def keyed_session(api_key):
+    return GeminiSession(api_key, "gemini-2.0-flash", 100, 30, "", own_client=True)
+
+
+def test_keyed_sessions_send_with_their_own_key(monkeypatch):
+    created = []
+    monkeypatch.setattr(glm, "GenerativeServiceClient", fake_client(created))
+    genai.configure(api_key="process-wide-key")
+    sessions = {key: keyed_session(key) for key in ("key-a", "key-b")}
+    for key, session in sessions.items():
+        with pytest.raises(Sent) as sent:
+            session.generate(b"jpeg", "image/jpeg")
+        assert sent.value.args == (key,)
+    assert created == ["key-a", "key-b"]
+
+
+def test_keyed_sessions_send_async_with_their_own_key(monkeypatch):
+    created = []
+    monkeypatch.setattr(glm, "GenerativeServiceClient", fake_client([]))
+    monkeypatch.setattr(glm, "GenerativeServiceAsyncClient", fake_async_client(created))
+    genai.configure(api_key="process-wide-key")
+    session = keyed_session("key-a")
+
+    async def send():
+        with pytest.raises(Sent) as sent:
+            await session.generate_async(b"jpeg", "image/jpeg")
+        return sent.value.args
+
+    assert asyncio.run(send()) == ("key-a",)
+    assert created == ["key-a"]
+
+
+def test_unknown_sdk_version_refuses_keyed_sessions(monkeypatch):
+    monkeypatch.setattr(genai, "__version__", "0.9.0")
+    with pytest.raises(ApiConnectionError):
+        keyed_session("key-a")
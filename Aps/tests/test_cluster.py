@@ -0,0 +1,152 @@
+import csv
+import os
+import threading
+import time
+
+from kyugen.cluster import LEASES_DIRNAME, LeaseManager, exported_filenames, merge_csv, merge_shards, node_path
+
+
+def write_csv(path, rows, tail=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(rows)
+        f.write(tail)
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_one_node_per_file(tmp_path):
+    a = LeaseManager(tmp_path / "input", tmp_path / "output", "a")
+    b = LeaseManager(tmp_path / "input", tmp_path / "output", "b")
+    try:
+        path = str(tmp_path / "input" / "img.jpg")
+        assert a.claim(path)
+        assert not b.claim(path) and not a.claim(path)
+        a.release(path)
+        assert b.claim(path)
+    finally:
+        a.close()
+        b.close()
+    assert os.listdir(tmp_path / "output" / LEASES_DIRNAME) == []
+
+
+def test_leases_are_named_relative_to_the_input_folder(tmp_path):
+    # Two nodes mounting the share at different paths
+    os.makedirs(tmp_path / "share" / "input")
+    os.symlink(tmp_path / "share", tmp_path / "mount")
+    a = LeaseManager(tmp_path / "share" / "input", tmp_path / "share" / "output", "a")
+    b = LeaseManager(tmp_path / "mount" / "input", tmp_path / "share" / "output", "b")
+    try:
+        assert a.claim(str(tmp_path / "share" / "input" / "img.jpg"))
+        assert not b.claim(str(tmp_path / "mount" / "input" / "img.jpg"))
+    finally:
+        a.close()
+        b.close()
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    a = LeaseManager(tmp_path / "input", tmp_path / "output", "a", lease_seconds=60)
+    b = LeaseManager(tmp_path / "input", tmp_path / "output", "b", lease_seconds=60)
+    try:
+        path = str(tmp_path / "input" / "img.jpg")
+        assert a.claim(path)
+        # a crashed a minute ago
+        a.closed.set()
+        lease_path = a.held[path]
+        old = time.time() - 61
+        os.utime(lease_path, (old, old))
+        assert b.claim(path)
+        assert b._owner(lease_path) == "b"
+    finally:
+        a.close(release=False)
+        b.close()
+
+
+def test_held_leases_are_renewed_and_lost_ones_dropped(tmp_path):
+    a = LeaseManager(tmp_path / "input", tmp_path / "output", "a", lease_seconds=0.3)
+    b = LeaseManager(tmp_path / "input", tmp_path / "output", "b", lease_seconds=0.3)
+    try:
+        path = str(tmp_path / "input" / "img.jpg")
+        assert a.claim(path)
+        time.sleep(0.6)
+        assert not b.claim(path)
+        # b took the file over while a was stalled
+        lease_path = a.held[path]
+        os.remove(lease_path)
+        assert b.claim(path)
+        time.sleep(0.3)
+        assert path not in a.held
+        a.close()
+        assert os.path.exists(lease_path)
+    finally:
+        a.close()
+        b.close()
+
+
+def test_merge_csv_keeps_each_filename_once_and_drops_torn_rows(tmp_path):
+    header = ["Filename", "Title"]
+    target = str(tmp_path / "merged.csv")
+    write_csv(target, [header, ["a.jpg", "A"]])
+    write_csv(str(tmp_path / "one.csv"), [header, ["b.jpg", "B"], ["a.jpg", "A again"]])
+    write_csv(str(tmp_path / "two.csv"), [header, ["c.jpg", "C"]], tail='d.jpg,"torn')
+    assert merge_csv(target, [str(tmp_path / "one.csv"), str(tmp_path / "two.csv")]) == 3
+    assert read_csv(target) == [header, ["a.jpg", "A"], ["b.jpg", "B"], ["c.jpg", "C"]]
+    assert not os.path.exists(target + ".tmp")
+
+
+def test_merge_shards_and_exported_filenames(tmp_path):
+    output_path = str(tmp_path)
+    assert merge_shards(output_path) == {}
+    header = ["Filename", "Title", "Keywords", "Category", "Releases"]
+    write_csv(os.path.join(node_path(output_path, "a"), "metadata_export.csv"), [header, ["a.jpg", "A", "", "1", ""]])
+    write_csv(os.path.join(node_path(output_path, "b"), "metadata_export.csv"), [header, ["b.jpg", "B", "", "1", ""]])
+    write_csv(os.path.join(node_path(output_path, "b"), "rejected.csv"), [["Filename", "Reason"], ["c.jpg", "blurred"]])
+    assert exported_filenames(output_path) == {"a.jpg", "b.jpg"}
+    merged = merge_shards(output_path)
+    assert merged == {os.path.join(output_path, "metadata_export.csv"): 2,
+                      os.path.join(output_path, "Rejected", "rejected.csv"): 1}
+    assert [row[0] for row in read_csv(os.path.join(output_path, "metadata_export.csv"))] == \
+        ["Filename", "a.jpg", "b.jpg"]
+    # Merging again adds nothing
+    assert merge_shards(output_path)[os.path.join(output_path, "metadata_export.csv")] == 2
+
+
+def test_two_nodes_share_the_folders(folders, run_engine, monkeypatch):
+    from kyugen import engine
+
+    monkeypatch.setattr(engine, "LEASE_RECHECK_INTERVAL", 0.1)
+    input_path, output_path = folders
+    results = {}
+
+    def node(node_id):
+        results[node_id] = run_engine(cluster=True, node_id=node_id, workers=1)
+
+    threads = [threading.Thread(target=node, args=(node_id,)) for node_id in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    counts = [counts for _, counts, _ in results.values()]
+    assert sum(c["ok"] for c in counts) == 6 and sum(c["error"] for c in counts) == 0
+    assert sum(calls for _, _, calls in results.values()) <= 6
+    rows = read_csv(os.path.join(output_path, "metadata_export.csv"))[1:]
+    moved = sorted(name for name in os.listdir(output_path) if name.endswith(".jpg"))
+    assert sorted(row[0] for row in rows) == moved and len(moved) == 6
+    assert not any(name.endswith(".jpg") for name in os.listdir(input_path))
+    assert os.listdir(os.path.join(output_path, LEASES_DIRNAME)) == []
+
+
+def test_files_of_a_crashed_node_are_taken_over(folders, run_engine):
+    input_path, output_path = folders
+    dead = LeaseManager(input_path, output_path, "dead", lease_seconds=1)
+    assert dead.claim(os.path.join(input_path, "img0.jpg"))
+    dead.close(release=False)
+    old = time.time() - 60
+    lease_path = os.path.join(output_path, LEASES_DIRNAME, os.listdir(os.path.join(output_path, LEASES_DIRNAME))[0])
+    os.utime(lease_path, (old, old))
+    engine, counts, calls = run_engine(cluster=True, node_id="a", lease_seconds=30)
+    assert counts["ok"] == 6
+    assert os.listdir(os.path.join(output_path, LEASES_DIRNAME)) == []
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from kyugen import dedupe
+from kyugen.dedupe import PerceptualIndex, _UnionFind, hamming
+
+
+def index_of(hashes, max_distance=6):
+    index = PerceptualIndex(max_distance)
+    index.paths = [f"{i}.jpg" for i in range(len(hashes))]
+    index.hashes = np.array(hashes, dtype=np.uint64)
+    return index
+
+
+@pytest.mark.parametrize("builtin", [True, False])
+def test_hamming(monkeypatch, builtin):
+    if not builtin:
+        # NumPy < 2.0 has no bitwise_count
+        monkeypatch.delattr(dedupe.np, "bitwise_count", raising=False)
+    values = np.array([0, 1, 0xFF, 2 ** 64 - 1], dtype=np.uint64)
+    assert hamming(np.uint64(0), values).tolist() == [0, 1, 8, 64]
+    assert hamming(values, values).tolist() == [0, 0, 0, 0]
+
+
+def test_union_find_keeps_the_earliest_root():
+    uf = _UnionFind(5)
+    uf.union(4, 3)
+    uf.union(3, 1)
+    uf.union(2, 0)
+    assert [uf.find(i) for i in range(5)] == [0, 1, 0, 1, 1]
+
+
+def test_pairs_are_found_when_every_band_but_one_differs():
+    # One flipped bit in each of the first six of seven bands
+    near = sum(1 << (band * 9) for band in range(6))
+    index = index_of([0, near, near | (1 << 60)])
+    assert index.clusters() == [["0.jpg", "1.jpg", "2.jpg"]]
+
+
+def test_distant_hashes_are_not_grouped():
+    index = index_of([0, 0x7F, 2 ** 64 - 1, 2 ** 64 - 1])
+    assert index.clusters() == [["2.jpg", "3.jpg"]]
+
+
+def test_chains_merge_into_one_group():
+    # 0 and 2 are 12 bits apart, but both within 6 of 1
+    index = index_of([0xFFF, 0x3F, 0, 0xFFFF << 40])
+    assert index.clusters() == [["0.jpg", "1.jpg", "2.jpg"]]
+
+
+def test_build_hashes_images(tmp_path):
+    from PIL import Image
+
+    rng = np.random.default_rng(1)
+    photo = Image.fromarray(rng.integers(0, 256, (8, 12, 3), dtype=np.uint8)).resize((600, 400))
+    photo.save(tmp_path / "a.jpg", quality=95)
+    photo.resize((300, 200)).save(tmp_path / "b.jpg", quality=60)
+    Image.fromarray(rng.integers(0, 256, (8, 12, 3), dtype=np.uint8)).resize((600, 400)).save(tmp_path / "c.png")
+    (tmp_path / "d.jpg").write_bytes(b"not an image")
+    paths = [str(tmp_path / name) for name in ("a.jpg", "b.jpg", "c.png", "d.jpg", "e.mp4")]
+    index = PerceptualIndex().build(paths, workers=2)
+    assert index.paths == paths[:3]
+    assert index.clusters() == [paths[:2]]
@@ -0,0 +1,98 @@
+import os
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image, IptcImagePlugin
+
+from kyugen.embed import _XMP_UUID, EmbedError, embed_metadata
+
+TITLE = "Café terrace at night"
+KEYWORDS = ["café", "terrace", "night"]
+
+
+@pytest.fixture
+def photo():
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (8, 12, 3), dtype=np.uint8)).resize((120, 80))
+
+
+def scan_data(path):
+    data = open(path, "rb").read()
+    return data[data.index(b"\xff\xda"):]
+
+
+def test_jpeg_gets_xmp_and_iptc_without_recoding(tmp_path, photo):
+    path = str(tmp_path / "a.jpg")
+    photo.save(path, quality=90, exif=Image.Exif())
+    before = scan_data(path)
+    with Image.open(path) as img:
+        pixels = np.asarray(img)
+    assert embed_metadata(path, TITLE, KEYWORDS)
+    assert embed_metadata(path, "Second title", KEYWORDS)
+    assert scan_data(path) == before
+    assert os.listdir(tmp_path) == ["a.jpg"]
+    with Image.open(path) as img:
+        assert img.info["xmp"].count(b"<dc:title>") == 1
+        assert b"Second title" in img.info["xmp"]
+        iptc = IptcImagePlugin.getiptcinfo(img)
+        assert iptc[(2, 5)] == b"Second title"
+        assert [k.decode("utf-8") for k in iptc[(2, 25)]] == KEYWORDS
+        assert np.array_equal(np.asarray(img), pixels)
+
+
+def test_iptc_values_are_cut_on_a_character_boundary(tmp_path, photo):
+    path = str(tmp_path / "a.jpg")
+    photo.save(path)
+    embed_metadata(path, "é" * 40, KEYWORDS)
+    with Image.open(path) as img:
+        assert IptcImagePlugin.getiptcinfo(img)[(2, 5)].decode("utf-8") == "é" * 32
+
+
+def test_png_gets_xmp(tmp_path, photo):
+    path = str(tmp_path / "a.png")
+    photo.save(path)
+    assert embed_metadata(path, TITLE, KEYWORDS)
+    embed_metadata(path, TITLE, KEYWORDS)
+    with Image.open(path) as img:
+        assert "café" in img.info["XML:com.adobe.xmp"]
+        assert img.info["XML:com.adobe.xmp"].count("<dc:title>") == 1
+        assert np.array_equal(np.asarray(img), np.asarray(photo))
+
+
+def boxes(path):
+    data = open(path, "rb").read()
+    pos = 0
+    found = []
+    while pos < len(data):
+        size, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        found.append((kind, data[pos + 8:pos + 24] == _XMP_UUID))
+        pos += size
+    return found
+
+
+def test_mp4_xmp_box_is_appended(tmp_path):
+    path = str(tmp_path / "a.mp4")
+    ftyp = struct.pack(">I4s4sI", 16, b"ftyp", b"isom", 512)
+    # Open-ended mdat (size 0) runs to the end of the file
+    mdat = struct.pack(">I4s", 0, b"mdat") + b"\0" * 32
+    with open(path, "wb") as f:
+        f.write(ftyp + mdat)
+    assert embed_metadata(path, TITLE, KEYWORDS)
+    assert embed_metadata(path, TITLE, KEYWORDS)
+    assert [kind for kind, _ in boxes(path)] == [b"ftyp", b"mdat", b"free", b"uuid"]
+    assert boxes(path)[-1] == (b"uuid", True)
+    assert open(path, "rb").read()[16:56] == struct.pack(">I4s", 40, b"mdat") + b"\0" * 32
+
+
+def test_other_files_are_left_alone(tmp_path):
+    path = tmp_path / "a.eps"
+    path.write_bytes(b"%!PS")
+    assert not embed_metadata(str(path), TITLE, KEYWORDS)
+
+    broken = tmp_path / "b.jpg"
+    broken.write_bytes(b"not a jpeg")
+    with pytest.raises(EmbedError):
+        embed_metadata(str(broken), TITLE, KEYWORDS)
+    assert broken.read_bytes() == b"not a jpeg"
+    assert sorted(os.listdir(tmp_path)) == ["a.eps", "b.jpg"]
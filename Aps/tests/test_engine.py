@@ -0,0 +1,106 @@
+import csv
+import os
+import shutil
+
+import pytest
+
+from kyugen.bench import MockGenerativeModel, ResourceExhausted
+from kyugen.sink import CsvSink
+
+
+class DailyQuotaModel(MockGenerativeModel):
+    # Answers `allowed` requests, then reports the daily quota as spent
+    def __init__(self, allowed, **kwargs):
+        super().__init__(**kwargs)
+        self.allowed = allowed
+
+    def _admit(self):
+        with self.lock:
+            self.allowed -= 1
+            if self.allowed < 0:
+                raise ResourceExhausted("429 Quota exceeded for quota metric 'Generate requests per day'")
+        return super()._admit()
+
+
+def exported(output_path, filename="metadata_export.csv", delimiter=","):
+    with open(os.path.join(output_path, filename), newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f, delimiter=delimiter))
+    return rows[0], rows[1:]
+
+
+@pytest.mark.parametrize("config", [
+    {"dispatch": "thread"},
+    {"dispatch": "async"},
+    {"batch_size": 4, "batch_wait": 0.05},
+    {"structured_output": False},
+], ids=["thread", "async", "batch", "text"])
+def test_files_are_described_moved_and_exported(folders, config, run_engine):
+    input_path, output_path = folders
+    _, counts, calls = run_engine(**config)
+    assert counts == {"ok": 6, "error": 0, "rejected": 0, "skipped": 0, "unchanged": 0}
+    assert not os.listdir(input_path)
+    header, rows = exported(output_path)
+    assert header == ["Filename", "Title", "Keywords", "Category", "Releases"]
+    assert len(rows) == 6
+    for filename, title, keywords, category, _ in rows:
+        assert os.path.exists(os.path.join(output_path, filename))
+        assert title.startswith("Synthetic abstract test image")
+        assert keywords and category
+    # Batches are whatever has queued up within batch_wait
+    assert calls < 6 if "batch_size" in config else calls == 6
+
+
+def test_every_exporter_gets_a_row(folders, run_engine):
+    _, output_path = folders
+    run_engine(exporters=["adobe", "shutterstock", "freepik", "getty"])
+    names = {tuple(sorted(row[0] for row in exported(output_path, name, delimiter)[1]))
+             for name, delimiter in [("metadata_export.csv", ","), ("shutterstock_export.csv", ","),
+                                     ("freepik_export.csv", ";"), ("getty_export.csv", ",")]}
+    assert len(names) == 1 and len(names.pop()) == 6
+
+
+def test_cached_answers_are_reused(folders, tmp_path, run_engine):
+    input_path, output_path = folders
+    copies = tmp_path / "copies"
+    shutil.copytree(input_path, copies)
+    run_engine()
+    for name in os.listdir(copies):
+        os.replace(copies / name, os.path.join(input_path, name))
+    _, counts, calls = run_engine()
+    assert counts["ok"] == 6
+    assert calls == 0
+    assert len(exported(output_path)[1]) == 12
+
+
+
+def test_rows_that_failed_to_write_are_exported_on_the_next_run(folders, monkeypatch, run_engine):
+    input_path, output_path = folders
+
+    def full_disk(sink, data):
+        if sink.size:
+            raise OSError(28, "No space left on device")
+        append(sink, data)
+
+    append = CsvSink._append
+    monkeypatch.setattr(CsvSink, "_append", full_disk)
+    engine, counts, _ = run_engine()
+    assert counts["ok"] == 6
+    assert engine.csv_failures == 6
+    assert exported(output_path)[1] == []
+
+    monkeypatch.setattr(CsvSink, "_append", append)
+    engine, counts, calls = run_engine()
+    assert engine.csv_failures == 0 and calls == 0
+    rows = exported(output_path)[1]
+    assert sorted(row[0] for row in rows) == sorted(name for name in os.listdir(output_path) if name.endswith(".jpg"))
+
+
+def test_run_stops_when_every_key_is_out_of_daily_quota(folders, run_engine):
+    input_path, output_path = folders
+    engine, counts, _ = run_engine(lambda: DailyQuotaModel(1, latency=0.01, jitter=0),
+                                   api_keys=["test-1"], workers=1, preprocess_workers=1)
+    assert engine.quota_reset is not None
+    assert counts["ok"] == 2
+    assert counts["error"] == 0
+    assert len(os.listdir(input_path)) == 4
+    assert not os.path.exists(os.path.join(output_path, "Error"))
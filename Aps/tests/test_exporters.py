@@ -0,0 +1,54 @@
+import pytest
+
+from kyugen.exporters import EXPORTERS, Exporter, get_exporters, trim_title
+
+TITLE = "Red fox, resting in the snow at dawn"
+KEYWORDS = [f"keyword{i}" for i in range(60)]
+
+
+def test_adobe_row():
+    row = EXPORTERS["adobe"]().row("a.jpg", TITLE, KEYWORDS[:3], "Animals")
+    assert row == ["a.jpg", "Red fox resting in the snow at dawn", "keyword0, keyword1, keyword2", "1", ""]
+
+
+def test_shutterstock_row():
+    exporter = EXPORTERS["shutterstock"]()
+    row = exporter.row("a.EPS", TITLE, KEYWORDS, "The Arts")
+    assert len(row) == len(exporter.header)
+    assert row[:2] == ["a.EPS", TITLE]
+    assert row[2].split(", ") == KEYWORDS[:50]
+    assert row[3:] == ["Arts", "no", "no", "yes"]
+    assert exporter.row("a.jpg", TITLE, [], "Unknown")[3:] == ["", "no", "no", "no"]
+
+
+def test_freepik_row():
+    exporter = EXPORTERS["freepik"]()
+    assert exporter.delimiter == ";"
+    row = exporter.row("a.jpg", "word " * 40, KEYWORDS, "Animals")
+    assert len(row[1]) <= 100 and row[1].endswith("word")
+    assert len(row[2].split(", ")) == 50
+
+
+def test_getty_row():
+    exporter = EXPORTERS["getty"]()
+    row = exporter.row("a.jpg", TITLE, KEYWORDS[:2], "Animals")
+    assert len(row) == len(exporter.header)
+    assert row == ["a.jpg", "", TITLE, "", "", TITLE, "keyword0, keyword1"]
+
+
+def test_trim_title_cuts_at_a_word():
+    assert trim_title("one two three", 9) == "one two"
+    assert trim_title("one two, three", 8) == "one two"
+    assert trim_title("abcdefghij", 4) == "abcd"
+    assert trim_title("  spaced   out ", 0) == "spaced out"
+
+
+def test_get_exporters():
+    assert [e.name for e in get_exporters("Adobe, getty,,adobe")] == ["adobe", "getty"]
+    with pytest.raises(ValueError):
+        get_exporters(["adobe", "pond5"])
+
+
+def test_exporters_must_format_rows():
+    with pytest.raises(TypeError):
+        Exporter()
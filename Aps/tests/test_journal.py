@@ -0,0 +1,81 @@
+import os
+import shutil
+
+import pytest
+
+from kyugen.journal import JobJournal, file_hash
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = JobJournal(str(tmp_path / "journal.sqlite"))
+    yield journal
+    journal.close()
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"original")
+    return str(path)
+
+
+def test_described_file_is_restored_until_it_changes(journal, source):
+    journal.queued(source)
+    journal.preprocessed(source, "hash")
+    journal.described(source, "Title", "a, b", "Animals")
+    assert journal.restore(source) == ("Title", "a, b", "Animals")
+    # Queued again by a resumed run: the description is kept
+    journal.queued(source)
+    assert journal.restore(source) == ("Title", "a, b", "Animals")
+    with open(source, "ab") as f:
+        f.write(b" edited")
+    assert journal.restore(source) is None
+
+
+def test_completed_files_are_recognized(journal, source):
+    journal.queued(source)
+    assert journal.completed(source) is None
+    journal.preprocessed(source, file_hash(source))
+    journal.moved(source, "20260101_Title.jpg", "Title", "a", "Animals")
+    assert journal.completed(source) == "20260101_Title.jpg"
+    # Touched, same content
+    os.utime(source, ns=(0, 0))
+    assert journal.completed(source) == "20260101_Title.jpg"
+    with open(source, "wb") as f:
+        f.write(b"replaced")
+    assert journal.completed(source) is None
+
+
+def test_failed_files_are_not_completed(journal, source):
+    journal.queued(source)
+    journal.failed(source, "boom")
+    assert journal.completed(source) is None
+
+
+def test_only_written_rows_are_marked_exported(journal, tmp_path):
+    for name in ("a", "b"):
+        path = str(tmp_path / f"{name}.jpg")
+        open(path, "wb").close()
+        journal.queued(path)
+        journal.moved(path, f"{name}_out.jpg", "Title", "a", "Animals")
+    journal.mark_exported({"b_out.jpg"})
+    assert [row[1] for row in journal.unexported()] == ["b_out.jpg"]
+    journal.mark_exported()
+    assert journal.unexported() == []
+
+
+def test_incremental_run_reports_unchanged_files(folders, tmp_path, run_engine):
+    input_path, output_path = folders
+    originals = tmp_path / "originals"
+    shutil.copytree(input_path, originals)
+    run_engine(incremental=True)
+
+    # Two files come back unchanged, one edited
+    for name in ("img0.jpg", "img1.jpg", "img2.jpg"):
+        shutil.copy2(originals / name, os.path.join(input_path, name))
+    with open(os.path.join(input_path, "img2.jpg"), "ab") as f:
+        f.write(b"\0")
+    _, counts, _ = run_engine(incremental=True)
+    assert counts["unchanged"] == 2 and counts["ok"] == 1
+    assert sorted(os.listdir(input_path)) == ["img0.jpg", "img1.jpg"]
@@ -0,0 +1,89 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from kyugen.keypool import KeyPool, KeySlot, QuotaExhausted, key_entries
+from kyugen.retry import QUOTA, TRANSIENT
+
+DAILY = Exception("429 Quota exceeded for quota metric 'Generate requests per day'")
+
+
+def make_pool(count=2, state_path=None):
+    slots = [KeySlot(f"key-{i}", SimpleNamespace(model_name="mock"), 0, 0) for i in range(count)]
+    return KeyPool(slots, state_path)
+
+
+def test_key_entries_merge_and_dedupe():
+    config = {"api_key": "a", "model": "m", "rpm": 15, "tpm": 1000,
+              "api_keys": ["b@other", {"key": "c", "rpm": 5}, "a", " "]}
+    assert key_entries(config) == [
+        {"key": "a", "model": "m", "rpm": 15, "tpm": 1000},
+        {"key": "b", "model": "other", "rpm": 15, "tpm": 1000},
+        {"key": "c", "model": "m", "rpm": 5, "tpm": 1000},
+    ]
+
+
+def test_requests_go_to_the_fastest_key():
+    pool = make_pool()
+    slot, estimate, wait = pool.reserve()
+    assert (slot.label, wait) == ("key-0", 0.0)
+    pool.succeeded(slot, estimate, 100, 2.0)
+    # key-1 hasn't answered yet, so it counts as fast
+    slot, estimate, _ = pool.reserve()
+    assert slot.label == "key-1"
+    pool.succeeded(slot, estimate, 100, 0.5)
+    slot, _, _ = pool.reserve()
+    assert slot.label == "key-1"
+
+
+def test_rate_limited_key_rests():
+    pool = make_pool()
+    slot, _, _ = pool.reserve()
+    pool.failed(slot, Exception("429 Resource has been exhausted"), QUOTA)
+    assert not slot.exhausted
+    for _ in range(3):
+        other, estimate, _ = pool.reserve()
+        assert other.label == "key-1"
+        pool.release(other, estimate)
+
+
+def test_other_errors_keep_the_key():
+    pool = make_pool(1)
+    slot, _, _ = pool.reserve()
+    pool.failed(slot, Exception("503 overloaded"), TRANSIENT)
+    assert pool.reserve()[0] is slot
+
+
+def test_every_key_out_of_daily_quota():
+    pool = make_pool()
+    for _ in range(2):
+        slot, _, _ = pool.reserve()
+        pool.failed(slot, DAILY, QUOTA)
+    with pytest.raises(QuotaExhausted) as exhausted:
+        pool.reserve()
+    assert exhausted.value.resume_at > time.time()
+    with pytest.raises(QuotaExhausted):
+        pool.acquire()
+    # Watch mode waits for the reset instead
+    slot, estimate, wait = pool.reserve(wait_for_reset=True)
+    assert slot is None and estimate is None and wait > 0
+
+
+def test_resting_keys_are_waited_for():
+    pool = make_pool(1)
+    slot, _, _ = pool.reserve()
+    pool.failed(slot, Exception("429 Resource has been exhausted"), QUOTA)
+    slot, _, wait = pool.reserve()
+    assert slot is None and 0 < wait <= 10
+    assert pool.acquire(lambda: True) is None
+
+
+def test_daily_exhaustion_is_remembered(tmp_path):
+    state_path = str(tmp_path / "keys.json")
+    pool = make_pool(state_path=state_path)
+    slot, _, _ = pool.reserve()
+    pool.failed(slot, DAILY, QUOTA)
+    restarted = make_pool(state_path=state_path)
+    assert [s.exhausted for s in restarted.slots] == [True, False]
+    assert restarted.reserve()[0].label == "key-1"
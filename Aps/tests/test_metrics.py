@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from types import SimpleNamespace
+
+from kyugen.metrics import METRICS_FILENAME, TRACE_FILENAME, Metrics, percentile
+
+
+def job():
+    return SimpleNamespace(started=time.monotonic(), timings={}, tokens=0)
+
+
+def result(status, index=0):
+    return SimpleNamespace(index=index, source=f"in/{index}.jpg", status=status, filename=f"{index}.jpg", error="")
+
+
+def test_percentile():
+    assert percentile([], 0.5) == 0.0
+    assert percentile([3, 1, 2, 4], 0.5) == 3
+    assert percentile(range(100), 0.95) == 95
+
+
+def test_timings_and_tokens_land_on_the_bound_job():
+    metrics = Metrics()
+    current = job()
+    with metrics.bind(current):
+        with metrics.timed("api"):
+            pass
+        metrics.observe("api", 0.5)
+        metrics.usage(SimpleNamespace(usage_metadata=SimpleNamespace(
+            prompt_token_count=300, candidates_token_count=50, total_token_count=350)))
+    metrics.observe("api", 1.0)
+    assert current.timings["api"] >= 0.5 and current.timings["api"] < 1.0
+    assert current.tokens == 350
+    stage = metrics.snapshot()["stages"]["api"]
+    assert stage["count"] == 3 and stage["seconds"] >= 1.5
+    assert metrics.snapshot()["tokens"] == {"prompt": 300, "output": 50, "total": 350}
+
+
+def test_snapshot_counts_and_error_rate():
+    metrics = Metrics()
+    for index, status in enumerate(["ok", "ok", "ok", "error", "skipped"]):
+        metrics.file_done(result(status, index), job())
+    metrics.api_call(1000)
+    metrics.api_error("transient")
+    snap = metrics.snapshot()
+    assert snap["counts"] == {"ok": 3, "error": 1, "rejected": 0, "skipped": 1}
+    assert snap["error_rate"] == 0.25
+    assert snap["api_calls"] == 1 and snap["upload_bytes"] == 1000
+    assert snap["errors"] == {"transient": 1}
+    assert snap["files_per_min"] > 0
+
+
+def test_trace_and_prometheus_files(tmp_path):
+    metrics = Metrics.for_output(str(tmp_path), {})
+    metrics.keys = lambda: {"key-1": {"model": "mock", "requests": 2, "tokens": 10, "errors": 1, "quota_errors": 1,
+                                      "latency": 0.5, "in_flight": 0, "available": False}}
+    current = job()
+    with metrics.bind(current):
+        metrics.observe("move", 0.25)
+    metrics.file_done(result("ok"), current)
+    metrics.close()
+
+    with open(tmp_path / TRACE_FILENAME, encoding="utf-8") as f:
+        events = [json.loads(line) for line in f]
+    assert [e["event"] for e in events] == ["run", "file"]
+    assert events[1]["status"] == "ok" and events[1]["stages"] == {"move": 0.25}
+
+    text = (tmp_path / METRICS_FILENAME).read_text(encoding="utf-8")
+    assert 'kyugen_files_total{status="ok"} 1' in text
+    assert 'kyugen_stage_seconds_count{stage="move"} 1' in text
+    assert 'kyugen_key_errors_total{key="key-1",quota="true"} 1' in text
+    assert 'kyugen_key_available{key="key-1"} 0' in text
+    assert not os.path.exists(tmp_path / (METRICS_FILENAME + ".tmp"))
+
+
+def test_metrics_can_be_turned_off(tmp_path):
+    metrics = Metrics.for_output(str(tmp_path), {"metrics_enabled": False})
+    metrics.file_done(result("ok"), job())
+    metrics.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_engine_run_is_traced(folders, run_engine):
+    _, output_path = folders
+    engine, _, calls = run_engine()
+    snap = engine.metrics.snapshot()
+    assert snap["counts"]["ok"] == 6 and snap["api_calls"] == calls == 6
+    assert snap["stages"]["preprocess"]["count"] == 6 and snap["stages"]["move"]["count"] == 6
+    assert snap["tokens"]["total"] > 0
+    with open(os.path.join(output_path, TRACE_FILENAME), encoding="utf-8") as f:
+        files = [e for e in map(json.loads, f) if e["event"] == "file"]
+    assert len(files) == 6 and all("api" in record["stages"] for record in files)
@@ -0,0 +1,91 @@
+import errno
+import os
+from datetime import datetime
+
+import pytest
+
+from kyugen import output
+from kyugen.output import NameIndex, move_file
+
+
+def test_reserve_numbers_repeated_titles(tmp_path):
+    names = NameIndex(str(tmp_path))
+    prefix = datetime.now().strftime("%Y%m%d")
+    first = names.reserve("Red fox, in snow!", ".jpg", 50)
+    assert first == f"{prefix}_Red_fox_in_snow.jpg"
+    assert names.reserve("Red fox in snow", ".jpg", 50) == f"{prefix}_Red_fox_in_snow_1.jpg"
+    assert names.reserve("red FOX in snow", ".jpg", 50) == f"{prefix}_red_FOX_in_snow_2.jpg"
+    assert names.reserve("", ".jpg", 50) == f"{prefix}_untitled.jpg"
+
+
+def test_names_on_disk_and_known_are_taken(tmp_path):
+    (tmp_path / "IMG_0001.JPG").write_bytes(b"x")
+    names = NameIndex(str(tmp_path), known=["IMG_0002.jpg"])
+    assert "img_0001.jpg" in names
+    assert names.reserve_original("IMG_0001.jpg") == "IMG_0001_1.jpg"
+    assert names.reserve_original("IMG_0002.jpg") == "IMG_0002_1.jpg"
+    assert names.reserve_original("IMG_0003.jpg") == "IMG_0003.jpg"
+    assert names.reserve_original("IMG_0003.jpg") == "IMG_0003_1.jpg"
+
+
+def test_release_frees_a_name(tmp_path):
+    names = NameIndex(str(tmp_path))
+    filename = names.reserve_original("a.jpg")
+    names.release(filename)
+    assert filename not in names
+    assert names.reserve_original("a.jpg") == "a.jpg"
+
+
+def test_exclusive_names_are_created_as_placeholders(tmp_path):
+    names = NameIndex(str(tmp_path), exclusive=True)
+    filename = names.reserve_original("a.jpg")
+    assert os.path.getsize(tmp_path / filename) == 0
+    # Another machine takes the next name after this index was seeded
+    (tmp_path / "a_1.jpg").write_bytes(b"theirs")
+    assert names.reserve_original("a.jpg") == "a_2.jpg"
+    assert (tmp_path / "a_1.jpg").read_bytes() == b"theirs"
+    names.release("a_2.jpg")
+    assert not (tmp_path / "a_2.jpg").exists()
+
+
+@pytest.fixture
+def cross_device(monkeypatch):
+    # The first rename fails as it does between volumes, so move_file copies
+    replace = os.replace
+    calls = []
+
+    def fake_replace(source, target):
+        calls.append(source)
+        if len(calls) == 1:
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        replace(source, target)
+
+    monkeypatch.setattr(output.os, "replace", fake_replace)
+    monkeypatch.setattr(output, "COPY_CHUNK", 1000)
+    return calls
+
+
+def test_move_file_copies_across_volumes(tmp_path, cross_device):
+    source = tmp_path / "a.jpg"
+    source.write_bytes(b"x" * 2500)
+    os.utime(source, (1_000_000_000, 1_000_000_000))
+    progress = []
+    move_file(str(source), str(tmp_path / "b.jpg"), lambda copied, total: progress.append((copied, total)))
+    assert not source.exists()
+    assert (tmp_path / "b.jpg").read_bytes() == b"x" * 2500
+    assert os.path.getmtime(tmp_path / "b.jpg") == 1_000_000_000
+    assert progress == [(1000, 2500), (2000, 2500), (2500, 2500)]
+    assert os.listdir(tmp_path) == ["b.jpg"]
+
+
+def test_failed_copy_keeps_the_source(tmp_path, cross_device):
+    source = tmp_path / "a.jpg"
+    source.write_bytes(b"x" * 2500)
+
+    def interrupt(copied, total):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        move_file(str(source), str(tmp_path / "b.jpg"), interrupt)
+    assert source.read_bytes() == b"x" * 2500
+    assert os.listdir(tmp_path) == ["a.jpg"]
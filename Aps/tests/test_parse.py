@@ -0,0 +1,42 @@
+import json
+
+from kyugen.parse import parse_description, split_batch_response
+
+
+def test_labelled_text_with_markdown_drift():
+    result = ("**Title:** Red fox in the snow\n"
+              "## Keywords: fox, snow, winter,\n  wildlife, animal\n"
+              "- Category : Animals")
+    title, keywords, category = parse_description(result)
+    assert title == "Red fox in the snow"
+    assert keywords == "fox, snow, winter, wildlife, animal"
+    assert category == "Animals"
+
+
+def test_json_answer_is_validated():
+    result = "```json\n" + json.dumps({"title": "  Red   fox ", "keywords": ["fox", " ", 3, "snow"],
+                                       "category": "wild animals"}) + "\n```"
+    assert parse_description(result) == ("Red fox", "fox, snow", "Animals")
+
+
+def test_json_answer_with_invalid_fields():
+    result = json.dumps({"title": 5, "keywords": "fox; snow\nwinter", "category": "nothing like it"})
+    assert parse_description(result) == ("", "fox, snow, winter", "")
+
+
+def test_split_text_batch_by_image_markers():
+    result = ("Image 2\nTitle: Second\n\n"
+              "**Image 1:**\nTitle: First\n\n"
+              "Image 1\nTitle: Ignored repeat\n\n"
+              "Image 4\nTitle: Out of range")
+    blocks = split_batch_response(result, 3)
+    assert blocks == ["Title: First", "Title: Second", ""]
+
+
+def test_split_json_batch_by_image_number():
+    items = [{"image": 2, "title": "Second"}, "not an object", {"title": "Third by position"},
+             {"image": 9, "title": "Out of range"}]
+    blocks = split_batch_response(json.dumps(items), 3)
+    assert json.loads(blocks[1])["title"] == "Second"
+    assert json.loads(blocks[2])["title"] == "Third by position"
+    assert blocks[0] == ""
@@ -0,0 +1,42 @@
+import io
+
+import pytest
+from PIL import EpsImagePlugin, Image
+
+from kyugen.preprocess import preprocess_file, read_eps
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    # Stands in for Ghostscript, which may not be installed: renders a grey
+    # image at the size and scale it was asked for
+    scales = []
+
+    def ghostscript(tile, size, fp, scale=1, transparency=False):
+        scales.append(scale)
+        return Image.new("RGB", (size[0] * scale, size[1] * scale), "grey").im
+
+    monkeypatch.setattr(EpsImagePlugin, "Ghostscript", ghostscript)
+    return scales
+
+
+@pytest.fixture
+def eps_path(tmp_path):
+    path = tmp_path / "art.eps"
+    Image.new("RGB", (300, 200), "red").save(path, "EPS")
+    return str(path)
+
+
+@pytest.mark.parametrize("size, scale, width", [(None, 1, 300), (200, 1, 300), (1024, 3, 900)])
+def test_eps_render_scale(rendered, eps_path, size, scale, width):
+    img = read_eps(eps_path, size)
+    assert rendered == [scale]
+    assert img.size == (width, width * 2 // 3)
+
+
+def test_eps_upload_is_downscaled(rendered, eps_path):
+    upload = preprocess_file(eps_path, size=128)
+    assert rendered == [1]
+    assert upload.mime_type == "image/jpeg"
+    with Image.open(io.BytesIO(upload.data)) as img:
+        assert img.size == (128, 85)
@@ -0,0 +1,75 @@
+import csv
+import os
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from kyugen.quality import REJECTED_FILENAME, REJECTED_FOLDER, measure_quality, rejected_row, rejection_reason
+
+GOOD = {"sharpness": 120.0, "brightness": 128.0, "low": 10, "high": 240, "megapixels": 12.0, "aspect": 1.5}
+
+
+def stats(**changes):
+    return dict(GOOD, **changes)
+
+
+def test_acceptable_image():
+    assert rejection_reason(GOOD, 4.0, 5.0, 30.0) == ""
+
+
+def test_limits():
+    assert rejection_reason(stats(megapixels=3.456), 4.0) == "resolution 3.46 MP is below 4 MP"
+    assert rejection_reason(stats(aspect=6.25), 4.0, 5.0) == "aspect ratio 6.2:1 is above 5:1"
+    assert rejection_reason(stats(sharpness=12.4), 4.0, 5.0, 30.0) == "blurred (sharpness 12 is below 30)"
+
+
+def test_zero_limits_are_off():
+    assert rejection_reason(stats(megapixels=0.3, aspect=9.0, sharpness=1.0)) == ""
+
+
+def test_unknown_resolution_is_not_rejected():
+    # Vectors and video frames are measured without a source size
+    assert rejection_reason(stats(megapixels=None), 4.0) == ""
+
+
+def test_exposure():
+    assert rejection_reason(stats(low=100, high=105)) == "blank or flat image"
+    assert rejection_reason(stats(low=0, high=30)) == "underexposed"
+    assert rejection_reason(stats(low=240, high=255)) == "overexposed"
+
+
+def test_rejected_row():
+    row = rejected_row("a.jpg", "underexposed", stats(megapixels=None))
+    assert row == ["a.jpg", "underexposed", "120.0", "128.0", "230", "", "1.50"]
+
+
+def noise(size=(600, 400)):
+    pixels = np.random.default_rng(0).integers(0, 256, (size[1], size[0]), dtype=np.uint8)
+    return Image.fromarray(pixels).convert("RGB")
+
+
+def test_measure_quality():
+    sharp = measure_quality(noise(), (6000, 4000))
+    blurred = measure_quality(noise().filter(ImageFilter.GaussianBlur(8)))
+    assert sharp["megapixels"] == 24.0 and sharp["aspect"] == 1.5
+    assert blurred["megapixels"] is None
+    assert sharp["sharpness"] > 30 > blurred["sharpness"]
+    assert rejection_reason(measure_quality(Image.new("RGB", (600, 400)))) == "blank or flat image"
+
+
+def test_sharp_subject_on_a_plain_background():
+    img = Image.new("RGB", (1200, 800), (200, 200, 200))
+    img.paste(noise((150, 100)), (500, 350))
+    assert measure_quality(img)["sharpness"] > 30
+
+
+def test_engine_sets_rejected_files_aside(folders, run_engine):
+    input_path, output_path = folders
+    Image.new("RGB", (600, 400)).save(os.path.join(input_path, "img0.jpg"))
+    engine, counts, calls = run_engine(quality_filter=True, reject_min_megapixels=0, reject_min_sharpness=0)
+    assert counts["rejected"] == 1 and counts["ok"] == 5
+    assert calls == 5
+    assert sorted(os.listdir(os.path.join(output_path, REJECTED_FOLDER))) == sorted(["img0.jpg", REJECTED_FILENAME])
+    with open(os.path.join(output_path, REJECTED_FOLDER, REJECTED_FILENAME), newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[1][:2] == ["img0.jpg", "blank or flat image"]
@@ -0,0 +1,111 @@
+import os
+import time
+
+import pytest
+
+from kyugen import engine as engine_module
+from kyugen.bench import MockGenerativeModel, ResourceExhausted, ServiceUnavailable
+from kyugen.retry import (BLOCKED, FATAL, QUOTA, TRANSIENT, ApiError, CircuitBreaker, RetryBudget, backoff_delay,
+                          classify_error)
+
+
+class BlockedPromptException(Exception):
+    pass
+
+
+@pytest.mark.parametrize("error, kind", [
+    (ResourceExhausted("429 Resource has been exhausted"), QUOTA),
+    (Exception("Quota exceeded for requests per minute"), QUOTA),
+    (ServiceUnavailable("503 The model is overloaded"), TRANSIENT),
+    (TimeoutError(), TRANSIENT),
+    (Exception("502 Bad Gateway"), TRANSIENT),
+    (BlockedPromptException("prompt"), BLOCKED),
+    (ValueError("Invalid operation: the response.text quick accessor requires a valid Part"), BLOCKED),
+    (Exception("400 API key not valid"), FATAL),
+    (ApiError(TRANSIENT, "already classified"), TRANSIENT),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+
+def test_backoff_delay_is_capped_and_jittered():
+    delays = [backoff_delay(attempt, base=1.0, cap=8.0) for attempt in range(10) for _ in range(20)]
+    assert all(0 <= d <= 8.0 for d in delays)
+    assert len(set(delays)) > 1
+    assert all(backoff_delay(0) <= 1.0 for _ in range(20))
+
+
+def test_retry_budget():
+    budget = RetryBudget(2)
+    assert [budget.take() for _ in range(3)] == [True, True, False]
+    unlimited = RetryBudget(0)
+    assert all(unlimited.take() for _ in range(100))
+
+
+def test_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05, max_cooldown=0.15)
+    breaker.record_failure()
+    assert breaker.ready()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.ready()
+    time.sleep(0.06)
+    # One probe call only
+    assert breaker.ready() and not breaker.ready()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.cooldown == 0.15
+    assert not breaker.wait(lambda: True)
+    assert breaker.wait()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.cooldown == 0.05
+    assert breaker.ready() and breaker.ready()
+
+
+class FlakyModel(MockGenerativeModel):
+    # Answers after `failures` calls have failed with `error`
+    def __init__(self, failures, error, **kwargs):
+        super().__init__(latency=0.01, jitter=0, **kwargs)
+        self.failures = failures
+        self.error = error
+
+    def _admit(self):
+        with self.lock:
+            self.failures -= 1
+            if self.failures >= 0:
+                self.calls += 1
+                raise self.error
+        return super()._admit()
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(engine_module, "backoff_delay", lambda attempt: 0.0)
+
+
+def test_transient_errors_are_retried(run_engine, no_backoff):
+    _, counts, calls = run_engine(lambda: FlakyModel(4, ServiceUnavailable("503 overloaded")),
+                                  breaker_threshold=10)
+    assert counts["ok"] == 6 and counts["error"] == 0
+    assert calls == 10
+
+
+def test_retries_run_out(folders, run_engine, no_backoff):
+    _, output_path = folders
+    _, counts, calls = run_engine(lambda: FlakyModel(1000, ServiceUnavailable("503 overloaded")),
+                                  workers=1, max_retries=2, breaker_threshold=100)
+    assert counts["error"] == 6
+    assert calls == 18
+    assert len(os.listdir(os.path.join(output_path, "Error"))) == 6
+
+
+def test_blocked_answers_fail_without_retrying(run_engine, no_backoff):
+    _, counts, calls = run_engine(lambda: FlakyModel(1000, BlockedPromptException("blocked")))
+    assert counts["error"] == 6
+    assert calls == 6
+
+
+def test_rate_limited_requests_wait_for_the_key(run_engine, monkeypatch):
+    # A per-minute 429 rests the key instead of failing the file
+    monkeypatch.setattr("kyugen.keypool.THROTTLE_BACKOFF", 0.1)
+    _, counts, calls = run_engine(lambda: FlakyModel(1, ResourceExhausted("429 Resource has been exhausted")))
+    assert counts["ok"] == 6
+    assert calls == 7
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from kyugen.sink import CsvSink, complete_rows
+
+HEADER = ["Filename", "Title"]
+
+
+def test_complete_rows_keeps_quoted_newlines():
+    data = b'Filename,Title\r\na.jpg,"two\nlines"\r\nb.jpg,done\r\n'
+    rows, end = complete_rows(data)
+    assert rows == [HEADER, ["a.jpg", "two\nlines"], ["b.jpg", "done"]]
+    assert end == len(data)
+
+
+def test_complete_rows_leaves_out_a_torn_row():
+    complete = b'Filename,Title\r\na.jpg,"two\nlines"\r\n'
+    for torn in (b'b.jpg,"cut off\nmid', b"b.jpg,no newline"):
+        rows, end = complete_rows(complete + torn)
+        assert rows == [HEADER, ["a.jpg", "two\nlines"]]
+        assert end == len(complete)
+
+
+def test_complete_rows_reads_a_malformed_file_leniently():
+    data = b'Filename,Title\r\na.jpg,bad"quote\r\nb.jpg,x\r\n'
+    rows, end = complete_rows(data)
+    assert [row[0] for row in rows] == ["Filename", "a.jpg", "b.jpg"]
+    assert end == len(data)
+
+
+def test_sink_cuts_torn_row_and_skips_known_files(tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_bytes(b'Filename,Title\r\na.jpg,"two\nlines"\r\nb.jpg,"torn')
+    sink = CsvSink(str(path), HEADER, flush_rows=1)
+    assert sink.filenames == {"a.jpg"}
+    assert not sink.write(["a.jpg", "again"])
+    assert sink.write(["b.jpg", "whole"])
+    sink.close()
+    assert path.read_bytes() == b'Filename,Title\r\na.jpg,"two\nlines"\r\nb.jpg,whole\r\n'
+
+
+def test_new_sink_writes_header_with_delimiter(tmp_path):
+    path = tmp_path / "export.csv"
+    sink = CsvSink(str(path), HEADER, delimiter=";")
+    sink.write(["a.jpg", "x;y"])
+    sink.close()
+    assert path.read_bytes() == b'Filename;Title\r\na.jpg;"x;y"\r\n'
+
+
+@pytest.fixture
+def failing_fsync(monkeypatch):
+    # fsync raises while failures["left"] > 0, as on a full disk
+    failures = {"left": 0}
+    fsync = os.fsync
+
+    def flaky(fd):
+        if failures["left"] > 0:
+            failures["left"] -= 1
+            raise OSError(28, "No space left on device")
+        fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", flaky)
+    return failures
+
+
+def test_failed_batch_is_retried_at_close(tmp_path, failing_fsync):
+    path = tmp_path / "export.csv"
+    sink = CsvSink(str(path), HEADER, flush_rows=100, flush_interval=60)
+    failing_fsync["left"] = 2
+    sink.write(["a.jpg", "first"])
+    sink.write(["b.jpg", "second"])
+    sink.close()
+    assert sink.failures == 1
+    assert sink.unsaved == []
+    assert path.read_bytes() == b"Filename,Title\r\na.jpg,first\r\nb.jpg,second\r\n"
+
+
+def test_unwritable_rows_are_kept(tmp_path, failing_fsync):
+    path = tmp_path / "export.csv"
+    sink = CsvSink(str(path), HEADER, flush_rows=100, flush_interval=60)
+    failing_fsync["left"] = 100
+    sink.write(["a.jpg", "first"])
+    sink.close()
+    assert sink.failures == 2
+    assert sink.unsaved_filenames() == {"a.jpg"}
+    assert path.read_bytes() == b"Filename,Title\r\n"
@@ -0,0 +1,85 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from kyugen.constants import CATEGORY_MAP
+from kyugen.tagger import LABELS_FILENAME, LocalModelError, LocalTagger, clip_pixels, load_vocabulary
+
+
+class ColorSession:
+    # Stands in for a CLIP image encoder: embeds a batch as its mean
+    # normalized color
+    def __init__(self, path, options=None, providers=None):
+        self.path = path
+
+    def get_inputs(self):
+        return [type("Input", (), {"name": "pixel_values"})]
+
+    def get_outputs(self):
+        return [type("Output", (), {"name": "image_embeds"})]
+
+    def run(self, outputs, feed):
+        assert outputs == ["image_embeds"]
+        return [feed["pixel_values"].mean(axis=(2, 3))]
+
+
+@pytest.fixture
+def model_dir(tmp_path, monkeypatch):
+    # An image "model" and labels.npz: red means Animals, green Nature, and
+    # the keywords are the three primary colors
+    ort = pytest.importorskip("onnxruntime")
+    monkeypatch.setattr(ort, "InferenceSession", ColorSession)
+    (tmp_path / "image.onnx").write_bytes(b"model")
+    names = list(CATEGORY_MAP)
+    categories = np.zeros((len(names), 3), dtype=np.float32)
+    categories[names.index("Animals")] = (1, 0, 0)
+    categories[names.index("Nature")] = (0, 1, 0)
+    np.savez(tmp_path / LABELS_FILENAME, categories=categories, keywords=np.eye(3, dtype=np.float32),
+             keyword_names=np.asarray(["red", "green", "blue"]), signature=np.asarray(""))
+    return str(tmp_path)
+
+
+def test_load_vocabulary(tmp_path):
+    path = tmp_path / "words.txt"
+    path.write_text("# colors\nred\n\n green \nred\n", encoding="utf-8")
+    assert load_vocabulary(str(path)) == ["red", "green"]
+    assert "landscape" in load_vocabulary()
+
+
+def test_clip_pixels_crops_the_center():
+    img = Image.new("RGB", (600, 300), (0, 0, 255))
+    img.paste((255, 0, 0), (0, 0, 150, 300))
+    pixels = clip_pixels(img)
+    assert pixels.shape == (224, 224, 3) and pixels.dtype == np.uint8
+    assert (pixels[:, 4:, 2] > 250).all() and (pixels[:, 4:, 0] < 5).all()
+
+
+def test_missing_model(tmp_path):
+    with pytest.raises(LocalModelError):
+        LocalTagger(str(tmp_path))
+
+
+def test_tag(model_dir):
+    tagger = LocalTagger(model_dir)
+    assert tagger.model_id.endswith("-5")
+    vectors = tagger.embed([clip_pixels(Image.new("RGB", (300, 200), color)) for color in ("red", "lime")])
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1)
+    (red_category, red_confidence, red_keywords), (green_category, _, green_keywords) = tagger.tag(vectors, 2)
+    assert red_category == "Animals" and red_confidence > 0.99
+    assert red_keywords[0] == "red" and len(red_keywords) == 2
+    assert green_category == "Nature" and green_keywords[0] == "green"
+
+
+def test_engine_uses_the_local_category_and_keywords(folders, run_engine, model_dir):
+    input_path, output_path = folders
+    for name in os.listdir(input_path):
+        Image.new("RGB", (600, 400), "red").save(os.path.join(input_path, name))
+    engine, counts, calls = run_engine(local_model_dir=model_dir, local_keywords=1, max_keywords=50)
+    assert counts["ok"] == 6
+    with open(os.path.join(output_path, "metadata_export.csv"), newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))[1:]
+    assert len(rows) == 6
+    assert all(row[3] == CATEGORY_MAP["Animals"] and "red" in row[2].split(", ") for row in rows)
@@ -0,0 +1,81 @@
+import shutil
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from kyugen import video
+from kyugen.video import contact_sheet, read_video_keyframes, sample_keyframes, sharpness
+
+
+def noise(seed, size=(160, 90)):
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+
+
+def blurred(seed):
+    return noise(seed).resize((16, 9)).resize((160, 90), Image.BILINEAR)
+
+
+@pytest.fixture
+def clip(monkeypatch):
+    # A 10 s clip without ffmpeg: frames[t] is the keyframe at or before t
+    requested = []
+    frames = {}
+
+    def grab_keyframe(file_path, timestamp, size):
+        requested.append(timestamp)
+        return frames.get(timestamp)
+
+    monkeypatch.setattr(video, "probe_duration", lambda file_path: 10.0)
+    monkeypatch.setattr(video, "grab_keyframe", grab_keyframe)
+    return requested, frames
+
+
+def test_samples_are_spread_over_the_clip(clip):
+    requested, frames = clip
+    sharp = noise(1)
+    frames.update({1.0: blurred(0), 3.0: sharp, 5.0: sharp.copy(), 9.0: blurred(2)})
+    sampled = sample_keyframes("clip.mp4", count=5)
+    assert requested == [1.0, 3.0, 5.0, 7.0, 9.0]
+    # 5.0 snapped to the same keyframe as 3.0; nothing decoded at 7.0
+    assert len(sampled) == 3
+    assert read_video_keyframes("clip.mp4", count=5) is sharp
+
+
+def test_unknown_duration_samples_the_start(clip, monkeypatch):
+    requested, frames = clip
+    monkeypatch.setattr(video, "probe_duration", lambda file_path: 0.0)
+    frames[0.0] = noise(0)
+    assert len(sample_keyframes("clip.mp4", count=5)) == 1
+    assert requested == [0.0]
+
+
+def test_no_frames(clip):
+    assert read_video_keyframes("clip.mp4") is None
+
+
+def test_contact_sheet(clip):
+    _, frames = clip
+    frames.update({t: noise(int(t)) for t in (1.0, 3.0, 5.0, 7.0, 9.0)})
+    sheet = read_video_keyframes("clip.mp4", size=300, mode="sheet", count=5)
+    # 3 x 2 grid of 100-pixel-wide 16:9 cells
+    assert sheet.size == (300, 112)
+    assert contact_sheet([noise(0)], 300).size == (300, 169)
+
+
+def test_sharpness():
+    assert sharpness(Image.new("RGB", (100, 100), "grey")) == 0.0
+    assert sharpness(noise(0, (2, 2))) == 0.0
+    assert sharpness(noise(0)) > sharpness(blurred(0)) > 0
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="needs ffmpeg")
+def test_real_clip(tmp_path):
+    pytest.importorskip("ffmpeg")
+    from kyugen.bench import _write_video
+
+    path = str(tmp_path / "clip.mp4")
+    _write_video(path, np.random.default_rng(0), 4, size=(320, 180))
+    frame = read_video_keyframes(path, size=160, count=3)
+    assert frame.size == (160, 90)
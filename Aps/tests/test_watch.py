@@ -0,0 +1,130 @@
+import os
+import shutil
+import threading
+import time
+
+from kyugen.watch import FolderWatcher
+
+
+def write(path, data=b"x" * 100):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def watch(watcher):
+    # Runs the watcher on a thread; returns the list it hands files to
+    seen = []
+    thread = threading.Thread(target=lambda: seen.extend(watcher.iter_files()), daemon=True)
+    thread.start()
+    return seen, thread
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def polling_watcher(path, **kwargs):
+    watcher = FolderWatcher(path, settle=0.1, poll_interval=0.05, use_events=False, **kwargs)
+    watcher.TICK = 0.02
+    return watcher
+
+
+def test_hands_out_existing_files_and_skips_ignored(tmp_path):
+    write(tmp_path / "a.jpg")
+    write(tmp_path / ".hidden.jpg")
+    write(tmp_path / "notes.txt")
+    os.makedirs(tmp_path / "sub")
+    write(tmp_path / "sub" / "b.png")
+    os.makedirs(tmp_path / "out")
+    write(tmp_path / "out" / "done.jpg")
+    watcher = polling_watcher(tmp_path, ignore=[str(tmp_path / "out")])
+    seen, thread = watch(watcher)
+    assert wait_for(lambda: len(seen) == 2)
+    time.sleep(0.2)
+    watcher.close()
+    thread.join(2)
+    assert not thread.is_alive()
+    assert sorted(os.path.relpath(p, tmp_path) for p in seen) == ["a.jpg", os.path.join("sub", "b.png")]
+
+
+def test_waits_for_a_growing_file_to_settle(tmp_path):
+    watcher = polling_watcher(tmp_path)
+    watcher.settle = 0.3
+    seen, thread = watch(watcher)
+    path = tmp_path / "copying.jpg"
+    with open(path, "wb") as f:
+        for _ in range(5):
+            f.write(b"x" * 100)
+            f.flush()
+            time.sleep(0.1)
+            assert not seen
+    assert wait_for(lambda: seen)
+    watcher.close()
+    thread.join(2)
+    assert seen == [str(path)]
+
+
+def test_new_file_under_a_processed_name_is_picked_up_again(tmp_path):
+    os.makedirs(tmp_path / "input")
+    os.makedirs(tmp_path / "done")
+    watcher = polling_watcher(tmp_path / "input")
+    watcher.PRUNE_INTERVAL = 0.05
+    seen, thread = watch(watcher)
+    path = tmp_path / "input" / "a.jpg"
+    write(path)
+    assert wait_for(lambda: len(seen) == 1)
+    shutil.move(path, tmp_path / "done" / "a.jpg")
+    time.sleep(0.2)
+    write(path, b"y" * 200)
+    assert wait_for(lambda: len(seen) == 2)
+    watcher.close()
+    thread.join(2)
+    assert seen == [str(path), str(path)]
+
+
+def test_stop_flag_ends_the_generator(tmp_path):
+    write(tmp_path / "a.jpg")
+    watcher = polling_watcher(tmp_path)
+    stop = threading.Event()
+    files = watcher.iter_files(stop.is_set)
+    assert next(files) == str(tmp_path / "a.jpg")
+    stop.set()
+    assert list(files) == []
+
+
+def test_engine_processes_files_as_they_arrive(folders):
+    from kyugen.bench import MockGenerativeModel
+    from kyugen.client import GeminiSession
+    from kyugen.engine import MetadataEngine
+    from kyugen.keypool import KeyPool
+
+    input_path, output_path = folders
+    arriving = os.path.join(os.path.dirname(input_path), "arriving")
+    os.makedirs(arriving)
+    for name in sorted(os.listdir(input_path))[3:]:
+        shutil.move(os.path.join(input_path, name), os.path.join(arriving, name))
+    engine = MetadataEngine({"api_key": "test-0", "model": "mock", "rpm": 0, "tpm": 0, "workers": 2,
+                             "input_path": input_path, "output_path": output_path,
+                             "watch": True, "watch_settle": 0.1, "watch_poll_interval": 0.05})
+    engine.keys = KeyPool.from_config(engine.config, lambda key, model_name, own_client: GeminiSession(
+        key, model_name, 100, 10, "", True, model=MockGenerativeModel(latency=0.01, jitter=0)))
+    outcome = {}
+    thread = threading.Thread(target=lambda: outcome.update(engine.run(check_connection=False)), daemon=True)
+    thread.start()
+
+    def input_empty():
+        return not any(name.endswith(".jpg") for name in os.listdir(input_path))
+
+    assert wait_for(input_empty, 20)
+    for name in sorted(os.listdir(arriving)):
+        shutil.move(os.path.join(arriving, name), os.path.join(input_path, name))
+    assert wait_for(input_empty, 20)
+    assert not outcome
+    engine.stop_watching()
+    thread.join(20)
+    engine.close()
+    assert not thread.is_alive()
+    assert outcome["ok"] == 6 and outcome["error"] == 0